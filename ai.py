@@ -0,0 +1,867 @@
+"""
+Gemini AI module for Telegram Bot
+Builds prompts and runs content generation without blocking the event loop
+"""
+
+import os
+import re
+import json
+import time
+import random
+import asyncio
+from collections import Counter
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+# ============ KONFIGURATSIYA ============
+GEMINI_API_KEY = os.getenv("API_KEY")
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.5-flash")
+
+# Bir foydalanuvchining navbatdagi/ishlanayotgan generatsiyalari soni
+AI_MAX_PER_USER = int(os.getenv("AI_MAX_PER_USER", "1"))
+# Javobni oqim (stream) ko'rinishida olish va progress ko'rsatish
+AI_STREAM = os.getenv("AI_STREAM", "1") == "1"
+# Katta hujjatlar: avval reja (outline), keyin bo'laklar parallel
+AI_CHUNK_THRESHOLD = int(os.getenv("AI_CHUNK_THRESHOLD", "15"))
+AI_CHUNK_SIZE = int(os.getenv("AI_CHUNK_SIZE", "8"))
+AI_CHUNK_CONCURRENCY = int(os.getenv("AI_CHUNK_CONCURRENCY", "3"))
+AI_CHUNK_RETRIES = int(os.getenv("AI_CHUNK_RETRIES", "2"))
+
+# Gemini chaqiruvlari: timeout, qayta urinish, rate limit, circuit breaker
+AI_TIMEOUT = float(os.getenv("AI_TIMEOUT", "120"))
+AI_RETRIES = int(os.getenv("AI_RETRIES", "3"))
+AI_BACKOFF_BASE = float(os.getenv("AI_BACKOFF_BASE", "1"))
+AI_BACKOFF_MAX = float(os.getenv("AI_BACKOFF_MAX", "20"))
+AI_RATE_PER_MINUTE = float(os.getenv("AI_RATE_PER_MINUTE", "60"))
+AI_RATE_BURST = int(os.getenv("AI_RATE_BURST", "10"))
+AI_BREAKER_THRESHOLD = int(os.getenv("AI_BREAKER_THRESHOLD", "5"))
+AI_BREAKER_RESET = float(os.getenv("AI_BREAKER_RESET", "60"))
+
+LANG_NAMES = {'uz': 'uzbek', 'ru': 'russian', 'en': 'english'}
+
+# Gemini modeli birinchi so'rovda yaratiladi - google.generativeai yuklanishi sekin
+_model = None
+
+def get_model():
+    """Gemini modeli (google.generativeai shu yerda import qilinadi)"""
+    global _model
+    if _model is None:
+        import google.generativeai as genai
+        genai.configure(api_key=GEMINI_API_KEY)
+        _model = genai.GenerativeModel(GEMINI_MODEL)
+    return _model
+
+
+# ============ RATE LIMIT VA CIRCUIT BREAKER ============
+
+class CircuitOpen(Exception):
+    """Gemini vaqtincha ishlamayapti - so'rov yuborilmadi"""
+
+
+class TokenBucket:
+    """Async token bucket: `rate` token/soniya, `capacity` gacha yig'iladi"""
+    
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = max(1, capacity)
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+        self.waits = 0
+        self.wait_time = 0.0
+    
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+    
+    async def acquire(self):
+        if self.rate <= 0:
+            return
+        async with self._lock:
+            self._refill()
+            if self._tokens < 1:
+                delay = (1 - self._tokens) / self.rate
+                self.waits += 1
+                self.wait_time += delay
+                await asyncio.sleep(delay)
+                self._refill()
+            self._tokens -= 1
+
+
+class CircuitBreaker:
+    """Ketma-ket xatolardan keyin so'rovlarni to'xtatib turish
+    
+    closed -> (threshold ta xato) -> open -> (reset_timeout) -> half_open
+    -> sinov so'rovi muvaffaqiyatli bo'lsa closed, aks holda yana open.
+    """
+    
+    def __init__(self, threshold: int, reset_timeout: float):
+        self.threshold = max(1, threshold)
+        self.reset_timeout = reset_timeout
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at = 0.0
+        self.opens = 0
+        self.rejected = 0
+        self._probe_in_flight = False
+    
+    def allow(self) -> bool:
+        if self.state == 'open':
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                self.rejected += 1
+                return False
+            self.state = 'half_open'
+        
+        if self.state == 'half_open':
+            if self._probe_in_flight:
+                self.rejected += 1
+                return False
+            self._probe_in_flight = True
+        return True
+    
+    def record_success(self):
+        self.state = 'closed'
+        self.failures = 0
+        self._probe_in_flight = False
+    
+    def record_failure(self):
+        self.failures += 1
+        self._probe_in_flight = False
+        if self.state == 'half_open' or self.failures >= self.threshold:
+            if self.state != 'open':
+                self.opens += 1
+            self.state = 'open'
+            self.opened_at = time.monotonic()
+    
+    def release(self):
+        """Natijasi upstream holatini ko'rsatmaydigan sinov so'rovi tugadi"""
+        self._probe_in_flight = False
+
+
+_retryable_errors = None
+
+def retryable_errors() -> tuple:
+    """Qayta urinsa bo'ladigan xatolar (google.api_core kerak bo'lganda yuklanadi)"""
+    global _retryable_errors
+    if _retryable_errors is None:
+        from google.api_core import exceptions as google_exceptions
+        _retryable_errors = (
+            asyncio.TimeoutError,
+            google_exceptions.ResourceExhausted,
+            google_exceptions.ServiceUnavailable,
+            google_exceptions.DeadlineExceeded,
+            google_exceptions.InternalServerError,
+            google_exceptions.TooManyRequests,
+            ConnectionError,
+        )
+    return _retryable_errors
+
+
+class GeminiClient:
+    """Gemini chaqiruvlari uchun timeout, backoff, rate limit va circuit breaker"""
+    
+    def __init__(self, timeout: float = AI_TIMEOUT, retries: int = AI_RETRIES,
+                 backoff_base: float = AI_BACKOFF_BASE, backoff_max: float = AI_BACKOFF_MAX):
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.bucket = TokenBucket(AI_RATE_PER_MINUTE / 60, AI_RATE_BURST)
+        self.breaker = CircuitBreaker(AI_BREAKER_THRESHOLD, AI_BREAKER_RESET)
+        self.metrics = Counter()
+    
+    async def call(self, operation: Callable[[], Awaitable]):
+        """operation() ni himoyalangan holda bajarish"""
+        attempt = 0
+        while True:
+            if not self.breaker.allow():
+                self.metrics['rejected'] += 1
+                raise CircuitOpen("Gemini is temporarily unavailable")
+            
+            await self.bucket.acquire()
+            self.metrics['calls'] += 1
+            try:
+                result = await asyncio.wait_for(operation(), self.timeout)
+            except retryable_errors() as e:
+                self.breaker.record_failure()
+                if isinstance(e, asyncio.TimeoutError):
+                    self.metrics['timeouts'] += 1
+                self.metrics['failures'] += 1
+                
+                if attempt >= self.retries:
+                    raise
+                if self.breaker.state == 'open':
+                    self.metrics['rejected'] += 1
+                    raise CircuitOpen("Gemini is temporarily unavailable") from e
+                
+                # Full jitter: bir vaqtda qayta urinishlar to'planib qolmasin
+                delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+                print(f"Gemini retry {attempt + 1}/{self.retries} in {delay:.1f}s: {e}")
+                self.metrics['retries'] += 1
+                attempt += 1
+                await asyncio.sleep(delay)
+                continue
+            except BaseException:
+                # So'rov xatosi (noto'g'ri prompt va h.k.) - upstream ishlayapti
+                self.breaker.release()
+                raise
+            
+            self.breaker.record_success()
+            self.metrics['successes'] += 1
+            return result
+    
+    def stats(self) -> Dict:
+        return {
+            **self.metrics,
+            'breaker_state': self.breaker.state,
+            'breaker_opens': self.breaker.opens,
+            'breaker_rejected': self.breaker.rejected,
+            'rate_limit_waits': self.bucket.waits,
+            'rate_limit_wait_time': self.bucket.wait_time,
+        }
+    
+    async def generate(self, prompt: str) -> str:
+        """Oddiy (stream'siz) javob matni"""
+        async def operation():
+            response = await get_model().generate_content_async(prompt)
+            return response.text
+        return await self.call(operation)
+
+
+gemini = GeminiClient()
+
+
+def ai_stats() -> Dict:
+    """AI qatlami metrikalari"""
+    return {
+        'client': gemini.stats(),
+        'parse': parse_stats(),
+    }
+
+
+# ============ GEMINI AI ORQALI KONTENT OLISH ============
+
+def build_prompt(topic: str, pages: int, doc_type: str, lang: str) -> str:
+    """Hujjat turi va til bo'yicha Gemini uchun prompt tuzish"""
+    
+    lang_full = LANG_NAMES.get(lang, 'uzbek')
+    
+    if doc_type == 'presentation':
+        prompt = f"""Create a detailed presentation content in {lang_full} language about "{topic}".
+
+Generate EXACTLY {pages} slides with the following structure:
+
+Return ONLY valid JSON (no markdown, no extra text) in this exact format:
+{{
+  "title": "Main presentation title",
+  "slides": [
+    {{
+      "title": "Slide 1 title",
+      "content": [
+        "First point about the topic",
+        "Second point with details",
+        "Third important point"
+      ]
+    }},
+    ... (continue for all {pages} slides)
+  ]
+}}
+
+Requirements:
+- Each slide must have 3-5 bullet points
+- Content must be informative and well-structured
+- Use {lang_full} language throughout
+- Make it educational and professional
+- RETURN ONLY JSON, NO OTHER TEXT"""
+
+    else:  # report or coursework
+        prompt = f"""Create a detailed {'report' if doc_type == 'report' else 'coursework'} in {lang_full} language about "{topic}".
+
+Generate content for approximately {pages} pages with the following structure:
+
+Return ONLY valid JSON (no markdown, no extra text) in this exact format:
+{{
+  "title": "Document title",
+  "introduction": "Detailed introduction (2-3 paragraphs)",
+  "sections": [
+    {{
+      "title": "Section 1 title",
+      "content": "Detailed content for this section (3-4 paragraphs)"
+    }},
+    {{
+      "title": "Section 2 title",
+      "content": "Detailed content for this section (3-4 paragraphs)"
+    }},
+    ... (continue with more sections)
+  ],
+  "conclusion": "Detailed conclusion (2-3 paragraphs)"
+}}
+
+Requirements:
+- Create enough sections to fill {pages} pages
+- Each section should have detailed, informative content
+- Use {lang_full} language throughout
+- Make it academic and well-researched
+- RETURN ONLY JSON, NO OTHER TEXT"""
+
+    return prompt
+
+
+# ============ JSON AJRATISH VA TIKLASH ============
+
+class ParseError(Exception):
+    """AI javobidan yaroqli kontent ajratib bo'lmadi"""
+
+
+# Qaysi tiklash yo'li necha marta ishlagani
+PARSE_STATS = Counter()
+# JSON tiklanmasdan o'qilgan javoblar; repaired/truncated - oxiri yo'qolgan
+CLEAN_PARSES = ('direct', 'extracted')
+
+
+def parse_stats() -> Dict[str, int]:
+    return dict(PARSE_STATS)
+
+
+def _scan(text: str, start: int):
+    """JSON matnini skanerlash
+    
+    (oxirgi pozitsiya, ochiq qavslar steki, string ichidami,
+    xavfsiz kesish nuqtalari) qaytaradi. Xavfsiz nuqta - '}' yoki ']'
+    yopilgandan keyingi pozitsiya va o'sha paytdagi stek.
+    """
+    stack = []
+    in_string = False
+    escape = False
+    safe_points = []
+    
+    for i in range(start, len(text)):
+        ch = text[i]
+        if in_string:
+            if escape:
+                escape = False
+            elif ch == '\\':
+                escape = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch in '{[':
+            stack.append('}' if ch == '{' else ']')
+        elif ch in '}]':
+            if not stack or stack[-1] != ch:
+                break
+            stack.pop()
+            if not stack:
+                return i + 1, [], False, safe_points
+            safe_points.append((i + 1, list(stack)))
+    
+    return len(text), stack, in_string, safe_points
+
+
+def _close(fragment: str, stack: List[str]) -> str:
+    """Oxiridagi vergul/ikki nuqtani olib tashlab, ochiq qavslarni yopish"""
+    fragment = fragment.rstrip()
+    while fragment and fragment[-1] in ',:':
+        if fragment[-1] == ':':
+            # Qiymatsiz qolgan kalitni ham olib tashlash
+            fragment = fragment[:-1].rstrip()
+            if fragment.endswith('"'):
+                key_start = fragment.rfind('"', 0, len(fragment) - 1)
+                fragment = fragment[:key_start].rstrip() if key_start >= 0 else fragment
+        else:
+            fragment = fragment[:-1].rstrip()
+    return fragment + ''.join(reversed(stack))
+
+
+def _extract_json(text: str) -> Tuple[dict, str]:
+    """extract_json, qo'shimcha ravishda qaysi yo'l bilan o'qilgani"""
+    text = text.strip()
+    
+    try:
+        data = json.loads(text)
+        if isinstance(data, dict):
+            PARSE_STATS['direct'] += 1
+            return data, 'direct'
+    except ValueError:
+        pass
+    
+    start = text.find('{')
+    if start < 0:
+        PARSE_STATS['failed'] += 1
+        raise ParseError("AI javobida JSON topilmadi")
+    
+    end, stack, in_string, safe_points = _scan(text, start)
+    
+    if not stack and not in_string:
+        # To'liq obyekt - atrofida markdown yoki matn bor edi
+        try:
+            data = json.loads(text[start:end])
+            PARSE_STATS['extracted'] += 1
+            return data, 'extracted'
+        except ValueError:
+            pass
+    else:
+        # Javob uzilib qolgan: avval hammasini yopib ko'rish
+        fragment = text[start:end] + ('"' if in_string else '')
+        try:
+            data = json.loads(_close(fragment, stack))
+            PARSE_STATS['repaired'] += 1
+            return data, 'repaired'
+        except ValueError:
+            pass
+    
+    # Oxirgi to'liq element bo'yicha kesish
+    for cut, cut_stack in reversed(safe_points):
+        try:
+            data = json.loads(_close(text[start:cut], cut_stack))
+            PARSE_STATS['truncated'] += 1
+            return data, 'truncated'
+        except ValueError:
+            continue
+    
+    PARSE_STATS['failed'] += 1
+    raise ParseError("AI javobini tahlil qilishda xatolik")
+
+
+def extract_json(text: str) -> dict:
+    """Matndan eng tashqi JSON obyektini ajratish, kerak bo'lsa tiklash
+    
+    Kod bloklari, oldingi/keyingi matn va uzilib qolgan oxir (yopilmagan
+    string yoki massiv) bilan ishlaydi.
+    """
+    return _extract_json(text)[0]
+
+
+def clean_slides(items) -> List[dict]:
+    """Yaroqli slaydlar: sarlavha va punktlar ro'yxati (bitta string -> bitta punkt)"""
+    slides = []
+    for slide in items if isinstance(items, list) else []:
+        if not isinstance(slide, dict) or not isinstance(slide.get('title'), str):
+            continue
+        points = slide.get('content')
+        if isinstance(points, str):
+            points = [points]
+        if not isinstance(points, list):
+            continue
+        points = [str(p) for p in points if isinstance(p, (str, int, float)) and str(p).strip()]
+        if points:
+            slides.append({'title': slide['title'], 'content': points})
+    return slides
+
+
+def clean_sections(items) -> List[dict]:
+    """Yaroqli bo'limlar: sarlavha va matn (paragraflar ro'yxati -> bitta matn)"""
+    sections = []
+    for section in items if isinstance(items, list) else []:
+        if not isinstance(section, dict) or not isinstance(section.get('title'), str):
+            continue
+        body = section.get('content')
+        if isinstance(body, list):
+            body = '\n\n'.join(str(p) for p in body)
+        if isinstance(body, str) and body.strip():
+            sections.append({'title': section['title'], 'content': body})
+    return sections
+
+
+def _validate_content(data: dict, doc_type: str, expected: int = None) -> Tuple[dict, bool]:
+    """validate_content, qo'shimcha ravishda natija to'liqmi (hech narsa tashlanmagan)"""
+    if not isinstance(data, dict):
+        PARSE_STATS['invalid'] += 1
+        raise ParseError("AI javobi kutilgan tuzilishga mos emas")
+    
+    title = data.get('title')
+    title = title.strip() if isinstance(title, str) and title.strip() else ''
+    
+    if doc_type == 'presentation':
+        slides = clean_slides(data.get('slides'))
+        if not slides:
+            PARSE_STATS['invalid'] += 1
+            raise ParseError("AI javobida slaydlar topilmadi")
+        complete = len(slides) == len(data['slides']) and len(slides) >= (expected or 0)
+        if expected and len(slides) < expected:
+            PARSE_STATS['salvaged'] += 1
+        return {'title': title or slides[0]['title'], 'slides': slides}, complete
+    
+    sections = clean_sections(data.get('sections'))
+    if not sections:
+        PARSE_STATS['invalid'] += 1
+        raise ParseError("AI javobida bo'limlar topilmadi")
+    
+    introduction = data.get('introduction') if isinstance(data.get('introduction'), str) else ''
+    conclusion = data.get('conclusion') if isinstance(data.get('conclusion'), str) else ''
+    if not conclusion:
+        # Xulosa yozilmay qolgan - uzilgan javob
+        PARSE_STATS['salvaged'] += 1
+    complete = (len(sections) == len(data['sections']) and len(sections) >= (expected or 0)
+                and bool(introduction.strip()) and bool(conclusion.strip()))
+    
+    return {
+        'title': title or sections[0]['title'],
+        'introduction': introduction,
+        'sections': sections,
+        'conclusion': conclusion,
+    }, complete
+
+
+def validate_content(data: dict, doc_type: str, expected: int = None) -> dict:
+    """Taqdimot/hujjat tuzilishini tekshirish va yaroqli qismlarini saqlab qolish"""
+    return _validate_content(data, doc_type, expected)[0]
+
+
+def _log_parse_error(error: ParseError, result_text: str):
+    print(f"JSON parse error: {error}")
+    print(f"Response text: {result_text[:500]}")
+
+
+def parse_content(result_text: str, doc_type: str, expected: int = None) -> Tuple[dict, bool]:
+    """AI javobidan kontent va u to'liqmi
+    
+    To'liq - JSON tiklanmasdan o'qilgan, hech bir element tashlanmagan va
+    soni kutilganicha. Faqat to'liq natija keshga yoziladi.
+    """
+    try:
+        data, method = _extract_json(result_text)
+        content, complete = _validate_content(data, doc_type, expected)
+        return content, complete and method in CLEAN_PARSES
+    except ParseError as e:
+        _log_parse_error(e, result_text)
+        raise
+
+
+# ============ STREAMING ============
+
+class StreamingArrayParser:
+    """Oqim bilan kelayotgan JSON'dan massiv elementlarini tayyor bo'lishi bilan ajratish
+    
+    Masalan "slides" massivining har bir slaydi yopilishi bilan feed()
+    uni dict sifatida qaytaradi - butun javobni kutish shart emas.
+    """
+    
+    def __init__(self, key: str):
+        self._key_re = re.compile(r'"%s"\s*:\s*\[' % re.escape(key))
+        self._buf = ''
+        self._pos = None          # massiv ichidagi skan pozitsiyasi
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._item_start = None
+        self.count = 0
+        self.done = False
+    
+    def feed(self, text: str) -> List[dict]:
+        """Yangi bo'lakni qo'shish va tugagan elementlarni qaytarish"""
+        self._buf += text
+        if self.done:
+            return []
+        
+        if self._pos is None:
+            match = self._key_re.search(self._buf)
+            if not match:
+                return []
+            self._pos = match.end()
+        
+        items = []
+        buf = self._buf
+        i = self._pos
+        while i < len(buf):
+            ch = buf[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == '\\':
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch in '{[':
+                if self._depth == 0:
+                    self._item_start = i
+                self._depth += 1
+            elif ch in '}]':
+                if self._depth == 0:
+                    # Massiv yopildi
+                    self.done = True
+                    i += 1
+                    break
+                self._depth -= 1
+                if self._depth == 0 and self._item_start is not None:
+                    try:
+                        items.append(json.loads(buf[self._item_start:i + 1]))
+                        self.count += 1
+                    except ValueError:
+                        pass
+                    self._item_start = None
+            i += 1
+        
+        self._pos = i
+        return items
+
+
+async def _stream_response(prompt: str, key: str,
+                           on_item: Callable[[int, dict], Awaitable[None]]) -> str:
+    """Javobni oqim bilan o'qib, har bir tayyor slayd/bo'limda on_item chaqirish"""
+    async def operation():
+        # Qayta urinishda progress boshidan hisoblanadi
+        parser = StreamingArrayParser(key)
+        chunks = []
+        
+        response = await get_model().generate_content_async(prompt, stream=True)
+        async for chunk in response:
+            try:
+                text = chunk.text
+            except ValueError:
+                # Matnsiz bo'lak (masalan, faqat metadata)
+                continue
+            chunks.append(text)
+            
+            for item in parser.feed(text):
+                try:
+                    await on_item(parser.count, item)
+                except Exception as e:
+                    print(f"Progress callback error: {e}")
+        
+        return ''.join(chunks)
+    
+    return await gemini.call(operation)
+
+
+# ============ CHUNKED GENERATION ============
+
+def count_sections(pages: int) -> int:
+    """Hujjat uchun bo'limlar soni (taxminan 2 sahifaga bitta bo'lim)"""
+    return max(3, round(pages / 2))
+
+
+def build_outline_prompt(topic: str, pages: int, doc_type: str, lang: str) -> str:
+    """Faqat sarlavhalar rejasini so'rash"""
+    lang_full = LANG_NAMES.get(lang, 'uzbek')
+    if doc_type == 'presentation':
+        count = pages
+        what = 'presentation slides'
+    else:
+        count = count_sections(pages)
+        what = f"sections of a {'report' if doc_type == 'report' else 'coursework'}"
+    
+    return f"""Create an outline in {lang_full} language for {what} about "{topic}".
+
+Return ONLY valid JSON (no markdown, no extra text) in this exact format:
+{{
+  "title": "Main title",
+  "items": ["Title 1", "Title 2", ... (EXACTLY {count} titles)]
+}}
+
+Requirements:
+- EXACTLY {count} titles, in a logical order without repetition
+- Use {lang_full} language throughout
+- RETURN ONLY JSON, NO OTHER TEXT"""
+
+
+def build_chunk_prompt(topic: str, doc_type: str, lang: str, doc_title: str,
+                       titles: List[str]) -> str:
+    """Rejadagi bir nechta slayd/bo'lim matnini so'rash"""
+    lang_full = LANG_NAMES.get(lang, 'uzbek')
+    titles_json = json.dumps(titles, ensure_ascii=False)
+    
+    if doc_type == 'presentation':
+        return f"""Write presentation slides in {lang_full} language for the presentation "{doc_title}" about "{topic}".
+
+Write one slide for EACH of these titles, in this order: {titles_json}
+
+Return ONLY valid JSON (no markdown, no extra text) in this exact format:
+{{
+  "slides": [
+    {{"title": "Slide title", "content": ["First point", "Second point", "Third point"]}}
+  ]
+}}
+
+Requirements:
+- EXACTLY {len(titles)} slides, titles exactly as given
+- Each slide must have 3-5 bullet points
+- Use {lang_full} language throughout
+- RETURN ONLY JSON, NO OTHER TEXT"""
+
+    return f"""Write sections in {lang_full} language for the {'report' if doc_type == 'report' else 'coursework'} "{doc_title}" about "{topic}".
+
+Write one section for EACH of these titles, in this order: {titles_json}
+
+Return ONLY valid JSON (no markdown, no extra text) in this exact format:
+{{
+  "sections": [
+    {{"title": "Section title", "content": "Detailed content for this section (3-4 paragraphs)"}}
+  ]
+}}
+
+Requirements:
+- EXACTLY {len(titles)} sections, titles exactly as given
+- Make it academic and well-researched
+- Use {lang_full} language throughout
+- RETURN ONLY JSON, NO OTHER TEXT"""
+
+
+def build_framing_prompt(topic: str, doc_type: str, lang: str, doc_title: str,
+                         titles: List[str]) -> str:
+    """Hujjat uchun kirish va xulosani so'rash"""
+    lang_full = LANG_NAMES.get(lang, 'uzbek')
+    return f"""Write the introduction and conclusion in {lang_full} language for the {'report' if doc_type == 'report' else 'coursework'} "{doc_title}" about "{topic}".
+
+The document has these sections: {json.dumps(titles, ensure_ascii=False)}
+
+Return ONLY valid JSON (no markdown, no extra text) in this exact format:
+{{
+  "introduction": "Detailed introduction (2-3 paragraphs)",
+  "conclusion": "Detailed conclusion (2-3 paragraphs)"
+}}
+
+Requirements:
+- Use {lang_full} language throughout
+- RETURN ONLY JSON, NO OTHER TEXT"""
+
+
+async def _generate_json(prompt: str) -> Tuple[dict, bool]:
+    """(JSON, tiklanmasdan o'qildimi)
+    
+    Reja, bo'lak va kirish/xulosa javoblari har xil tuzilishda - ular
+    tekshiruv (check) va clean_* orqali, yakuniy natija validate_content'da.
+    """
+    result_text = await gemini.generate(prompt)
+    try:
+        data, method = _extract_json(result_text)
+    except ParseError as e:
+        _log_parse_error(e, result_text)
+        raise
+    return data, method in CLEAN_PARSES
+
+
+async def _generate_with_retries(prompt: str, check: Callable[[dict], bool],
+                                 semaphore: asyncio.Semaphore) -> Tuple[dict, bool]:
+    """Bitta bo'lakni generatsiya qilish; yaroqsiz javob bo'lsa faqat shu bo'lak qayta so'raladi
+    
+    Faqat JSON/tuzilish xatosi qayta so'raladi. Upstream xatolarini (timeout,
+    503, CircuitOpen) GeminiClient.call o'zi backoff bilan qayta uradi -
+    bu yerda ham takrorlansa, so'rovlar soni ko'payib ketadi.
+    """
+    last_error = None
+    for attempt in range(AI_CHUNK_RETRIES + 1):
+        try:
+            async with semaphore:
+                data, clean_parse = await _generate_json(prompt)
+        except ParseError as e:
+            last_error = e
+        else:
+            if check(data):
+                return data, clean_parse
+            last_error = ParseError("AI javobi kutilgan tuzilishga mos emas")
+        print(f"Chunk attempt {attempt + 1} failed: {last_error}")
+    raise last_error
+
+
+async def generate_chunked(topic: str, pages: int, doc_type: str, lang: str,
+                           on_item: Optional[Callable[[int, dict], Awaitable[None]]] = None
+                           ) -> Tuple[dict, bool]:
+    """Reja + parallel bo'laklar: katta hujjatlar uchun tezroq va ishonchliroq
+    
+    (kontent, to'liqmi) qaytaradi - parse_content kabi.
+    """
+    semaphore = asyncio.Semaphore(max(1, AI_CHUNK_CONCURRENCY))
+    key = 'slides' if doc_type == 'presentation' else 'sections'
+    clean = clean_slides if doc_type == 'presentation' else clean_sections
+    count = pages if doc_type == 'presentation' else count_sections(pages)
+    
+    outline, _ = await _generate_with_retries(
+        build_outline_prompt(topic, pages, doc_type, lang),
+        lambda d: isinstance(d.get('items'), list) and len(d['items']) > 0,
+        semaphore
+    )
+    doc_title = outline.get('title') or topic
+    titles = [str(t) for t in outline['items']][:count]
+    
+    batches = [titles[i:i + AI_CHUNK_SIZE] for i in range(0, len(titles), max(1, AI_CHUNK_SIZE))]
+    done = 0
+    clean_parses = []
+    
+    async def run_batch(batch: List[str]) -> List[dict]:
+        nonlocal done
+        data, clean_parse = await _generate_with_retries(
+            build_chunk_prompt(topic, doc_type, lang, doc_title, batch),
+            lambda d: len(clean(d.get(key))) == len(batch),
+            semaphore
+        )
+        items = clean(data[key])
+        clean_parses.append(clean_parse and len(data[key]) == len(items))
+        if on_item:
+            for item in items:
+                done += 1
+                try:
+                    await on_item(done, item)
+                except Exception as e:
+                    print(f"Progress callback error: {e}")
+        return items
+    
+    async def run_framing() -> dict:
+        data, clean_parse = await _generate_with_retries(
+            build_framing_prompt(topic, doc_type, lang, doc_title, titles),
+            lambda d: all(isinstance(d.get(k), str) and d[k].strip()
+                          for k in ('introduction', 'conclusion')),
+            semaphore
+        )
+        clean_parses.append(clean_parse)
+        return data
+    
+    jobs = [run_batch(batch) for batch in batches]
+    if doc_type != 'presentation':
+        jobs.append(run_framing())
+    
+    tasks = [asyncio.ensure_future(job) for job in jobs]
+    try:
+        results = await asyncio.gather(*tasks)
+    except BaseException:
+        # Bitta bo'lak butunlay muvaffaqiyatsiz - qolganlarini to'xtatish
+        for task in tasks:
+            task.cancel()
+        raise
+    
+    # Tartib saqlangan holda birlashtirish
+    items = [item for batch_items in results[:len(batches)] for item in batch_items]
+    content: Dict = {'title': doc_title, key: items}
+    if doc_type != 'presentation':
+        framing = results[-1]
+        content['introduction'] = framing['introduction']
+        content['conclusion'] = framing['conclusion']
+    # Oddiy yo'l bilan bir xil shakl (renderlar shunga tayanadi)
+    content, complete = _validate_content(content, doc_type, count)
+    # Reja so'ralganidan qisqa bo'lsa ham to'liq emas
+    return content, complete and all(clean_parses) and len(titles) == count
+
+
+async def generate_content_with_gemini(topic: str, pages: int, doc_type: str, lang: str,
+                                       on_item: Optional[Callable[[int, dict], Awaitable[None]]] = None
+                                       ) -> Tuple[dict, bool]:
+    """Gemini AI yordamida kontent generatsiya qilish; (kontent, to'liqmi) qaytaradi
+    
+    To'liq emas - javob uzilib tiklangan yoki slayd/bo'limlar kam; bunday
+    natija foydalanuvchiga beriladi, lekin keshga yozilmaydi.
+    
+    on_item berilsa va AI_STREAM yoqilgan bo'lsa, javob oqim bilan olinadi
+    va har bir tayyor slayd/bo'lim uchun on_item(tartib raqami, element)
+    chaqiriladi. Katta hujjatlar (AI_CHUNK_THRESHOLD dan ko'p sahifa)
+    reja + parallel bo'laklar usulida tayyorlanadi.
+    """
+    if AI_CHUNK_THRESHOLD and pages >= AI_CHUNK_THRESHOLD:
+        return await generate_chunked(topic, pages, doc_type, lang, on_item)
+    
+    prompt = build_prompt(topic, pages, doc_type, lang)
+    
+    try:
+        # Async klient - event loop bloklanmaydi
+        if on_item and AI_STREAM:
+            key = 'slides' if doc_type == 'presentation' else 'sections'
+            result_text = await _stream_response(prompt, key, on_item)
+        else:
+            result_text = await gemini.generate(prompt)
+    except Exception as e:
+        print(f"Gemini error: {e}")
+        raise
+    
+    return parse_content(result_text, doc_type, pages if doc_type == 'presentation' else None)
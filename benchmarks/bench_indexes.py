@@ -0,0 +1,216 @@
+"""
+Index benchmark for the generations/referrals access paths
+
+Seeds a throwaway schema with a million generations, times the queries
+GenerationDB/ReferralDB run, then applies the index and counter
+migrations and times them again.
+
+    BENCH_DATABASE_URL=postgresql://... python benchmarks/bench_indexes.py
+
+Everything happens inside the `bench_indexes` schema, which is dropped
+at the end (--keep to inspect it). Do not point this at production.
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+import statistics
+
+import psycopg2
+import psycopg2.extras
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from migrations import MIGRATIONS
+
+SCHEMA = 'bench_indexes'
+BASELINE_VERSION = 7
+# Faqat o'lchanayotgan o'zgarishlar: 8 - indekslar, 9 - hisoblagichlar (bo'limlar emas)
+MEASURED_VERSIONS = (8, 9)
+
+QUERIES = {
+    'get_user_generations': '''
+        SELECT * FROM generations
+        WHERE user_id = %(user_id)s
+        ORDER BY created_at DESC
+        LIMIT 10
+    ''',
+    'get_referrer': '''
+        SELECT referrer_id FROM referrals
+        WHERE referred_id = %(user_id)s
+    ''',
+    'count_active': '''
+        SELECT COUNT(*) AS count FROM generations
+        WHERE user_id = %(user_id)s AND status IN ('pending', 'processing')
+    ''',
+    'get_user_stats (scan)': '''
+        SELECT COUNT(*) as total,
+               SUM(CASE WHEN status = 'completed' THEN 1 ELSE 0 END) as completed,
+               SUM(CASE WHEN status = 'failed' THEN 1 ELSE 0 END) as failed
+        FROM generations
+        WHERE user_id = %(user_id)s
+    ''',
+}
+
+COUNTER_QUERY = ('get_user_stats (counters)', '''
+    SELECT total, completed, failed FROM user_generation_stats
+    WHERE user_id = %(user_id)s
+''')
+
+
+def apply(conn, migrations):
+    cursor = conn.cursor()
+    for migration in migrations:
+        started = time.perf_counter()
+        for statement in migration.statements:
+            cursor.execute(statement)
+        print(f"  migration {migration.version} ({migration.name}): "
+              f"{(time.perf_counter() - started) * 1000:.0f} ms")
+
+
+def seed(conn, users: int, generations: int, referrals: int):
+    cursor = conn.cursor()
+    started = time.perf_counter()
+    cursor.execute('''
+        INSERT INTO users (user_id, username, last_reset)
+        SELECT g, 'user' || g, CURRENT_DATE FROM generate_series(1, %s) g
+    ''', (users,))
+    # Faol foydalanuvchilar ko'proq yaratadi: power-law taqsimot
+    cursor.execute('''
+        INSERT INTO generations (user_id, doc_type, topic, pages, design, status,
+                                 created_at, completed_at, chat_id)
+        SELECT 1 + floor(%s * power(random(), 3))::bigint,
+               CASE WHEN random() < 0.7 THEN 'presentation' ELSE 'document' END,
+               'Mavzu ' || g,
+               5 + (random() * 20)::int,
+               (1 + (random() * 4)::int)::text,
+               CASE WHEN random() < 0.9 THEN 'completed'
+                    WHEN random() < 0.8 THEN 'failed'
+                    ELSE 'pending' END,
+               ts, ts + INTERVAL '40 seconds', 1
+        FROM generate_series(1, %s) g,
+             LATERAL (SELECT CURRENT_TIMESTAMP - random() * INTERVAL '365 days' AS ts) t
+    ''', (users - 1, generations))
+    cursor.execute('''
+        INSERT INTO referrals (referrer_id, referred_id, bonus_applied)
+        SELECT 1 + (random() * (%s - 1))::bigint, g, TRUE
+        FROM generate_series(2, %s + 1) g
+        ON CONFLICT DO NOTHING
+    ''', (users, min(referrals, users - 1)))
+    cursor.execute('ANALYZE')
+    print(f"  seeded {users} users, {generations} generations, {referrals} referrals "
+          f"in {time.perf_counter() - started:.1f} s")
+
+
+def plan(cursor, sql: str, params: dict) -> str:
+    """Birinchi scan tugunining nomi (Index Scan using ..., Seq Scan ...)"""
+    cursor.execute('EXPLAIN ' + sql, params)
+    for row in cursor.fetchall():
+        line = row['QUERY PLAN'].strip().lstrip('-> ').strip()
+        if 'Scan' in line:
+            return line.split('  (')[0]
+    return '?'
+
+
+def measure(conn, queries: dict, user_ids, label: str) -> dict:
+    cursor = conn.cursor()
+    results = {}
+    for name, sql in queries.items():
+        timings = []
+        for user_id in user_ids:
+            started = time.perf_counter()
+            cursor.execute(sql, {'user_id': user_id})
+            cursor.fetchall()
+            timings.append((time.perf_counter() - started) * 1000)
+        timings.sort()
+        results[name] = {
+            'mean': statistics.mean(timings),
+            'p95': timings[int(len(timings) * 0.95) - 1],
+            'plan': plan(cursor, sql, {'user_id': user_ids[0]}),
+        }
+        print(f"  [{label}] {name}: mean {results[name]['mean']:.2f} ms, "
+              f"p95 {results[name]['p95']:.2f} ms  ({results[name]['plan']})")
+    return results
+
+
+def measure_inserts(conn, count: int, users: int, label: str) -> float:
+    """Yozish narxi: indekslar va trigger qo'shilgach insert + status o'zgarishi"""
+    cursor = conn.cursor()
+    started = time.perf_counter()
+    for _ in range(count):
+        cursor.execute('''
+            INSERT INTO generations (user_id, doc_type, topic, pages, design, status, chat_id)
+            VALUES (%s, 'presentation', 'bench', 10, '1', 'pending', 1)
+            RETURNING id
+        ''', (random.randint(1, users),))
+        generation_id = cursor.fetchone()['id']
+        cursor.execute("UPDATE generations SET status = 'completed' WHERE id = %s", (generation_id,))
+    per_row = (time.perf_counter() - started) * 1000 / count
+    print(f"  [{label}] insert + complete: {per_row:.3f} ms per generation")
+    return per_row
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--users', type=int, default=100_000)
+    parser.add_argument('--generations', type=int, default=1_000_000)
+    parser.add_argument('--referrals', type=int, default=50_000)
+    parser.add_argument('--samples', type=int, default=500)
+    parser.add_argument('--writes', type=int, default=2000)
+    parser.add_argument('--keep', action='store_true', help="keep the benchmark schema")
+    args = parser.parse_args()
+    
+    dsn = os.environ.get('BENCH_DATABASE_URL')
+    if not dsn:
+        sys.exit("BENCH_DATABASE_URL is not set")
+    
+    conn = psycopg2.connect(dsn, cursor_factory=psycopg2.extras.RealDictCursor)
+    conn.autocommit = True
+    cursor = conn.cursor()
+    cursor.execute(f'DROP SCHEMA IF EXISTS {SCHEMA} CASCADE')
+    cursor.execute(f'CREATE SCHEMA {SCHEMA}')
+    cursor.execute(f'SET search_path TO {SCHEMA}')
+    
+    try:
+        print("Baseline schema:")
+        apply(conn, [m for m in MIGRATIONS if m.version <= BASELINE_VERSION])
+        seed(conn, args.users, args.generations, args.referrals)
+        
+        random.seed(1)
+        # Yarmi eng faol foydalanuvchilar (ko'p qatorli), yarmi tasodifiy
+        heavy = [random.randint(1, max(1, args.users // 100)) for _ in range(args.samples // 2)]
+        user_ids = heavy + [random.randint(1, args.users) for _ in range(args.samples - len(heavy))]
+        
+        before = measure(conn, QUERIES, user_ids, 'before')
+        write_before = measure_inserts(conn, args.writes, args.users, 'before')
+        
+        print("Index and counter migrations:")
+        apply(conn, [m for m in MIGRATIONS if m.version in MEASURED_VERSIONS])
+        cursor.execute('ANALYZE')
+        
+        after_queries = dict(QUERIES)
+        after_queries[COUNTER_QUERY[0]] = COUNTER_QUERY[1]
+        after = measure(conn, after_queries, user_ids, 'after')
+        write_after = measure_inserts(conn, args.writes, args.users, 'after')
+        
+        print()
+        print(f"{'query':<28} {'before ms':>10} {'after ms':>10} {'speedup':>8}")
+        for name in QUERIES:
+            b = before[name]['mean']
+            a = after[name]['mean']
+            if name == 'get_user_stats (scan)':
+                a = after[COUNTER_QUERY[0]]['mean']
+                name = 'get_user_stats'
+            print(f"{name:<28} {b:>10.3f} {a:>10.3f} {b / a:>7.1f}x")
+        print(f"{'insert + complete':<28} {write_before:>10.3f} {write_after:>10.3f} "
+              f"{write_before / write_after:>7.1f}x")
+    finally:
+        if not args.keep:
+            cursor.execute(f'DROP SCHEMA IF EXISTS {SCHEMA} CASCADE')
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,227 @@
+"""
+Broadcast engine for Telegram Bot
+Sends an admin's message to every user at low priority, with resumable progress
+"""
+
+import os
+import time
+import socket
+import asyncio
+from typing import Dict, Optional
+
+from aiogram import Bot
+from aiogram.exceptions import (
+    TelegramAPIError, TelegramBadRequest, TelegramForbiddenError, TelegramRetryAfter
+)
+
+from database import get_async_db
+from sender import send_priority, PRIORITY_LOW
+
+# ============ KONFIGURATSIYA ============
+# Broadcast yubora oladigan adminlar: "123,456"
+ADMIN_IDS = {int(x) for x in os.getenv("ADMIN_IDS", "").split(",") if x.strip()}
+# Bir partiyada nechta foydalanuvchi (har partiyadan keyin progress saqlanadi)
+BROADCAST_BATCH_SIZE = int(os.getenv("BROADCAST_BATCH_SIZE", "200"))
+# Bir vaqtda yuborilayotgan so'rovlar (tezlikni sender cheklaydi)
+BROADCAST_CONCURRENCY = int(os.getenv("BROADCAST_CONCURRENCY", "20"))
+# Admin'ga hisobot yuborish oralig'i (soniya)
+BROADCAST_REPORT_INTERVAL = float(os.getenv("BROADCAST_REPORT_INTERVAL", "15"))
+# Shuncha vaqt progress saqlanmasa - egasi o'lgan deb hisoblanadi va davom ettiriladi
+BROADCAST_STALE_AFTER = int(os.getenv("BROADCAST_STALE_AFTER", "300"))
+BROADCAST_RESUME_INTERVAL = float(os.getenv("BROADCAST_RESUME_INTERVAL", "60"))
+
+# Foydalanuvchiga endi yetib bo'lmaydi - keyingi safar o'tkazib yuboriladi
+UNREACHABLE_ERRORS = ('chat not found', 'user is deactivated', 'peer_id_invalid')
+
+OWNER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+db = get_async_db()
+
+
+def is_admin(user_id: int) -> bool:
+    return user_id in ADMIN_IDS
+
+
+class Broadcast:
+    """Bitta broadcast: foydalanuvchilarni partiyalab o'qish va xabarni nusxalash"""
+    
+    def __init__(self, bot: Bot, record: Dict, concurrency: int = BROADCAST_CONCURRENCY,
+                 batch_size: int = BROADCAST_BATCH_SIZE):
+        self.bot = bot
+        self.id = record['id']
+        self.admin_id = record['admin_id']
+        self.from_chat_id = record['from_chat_id']
+        self.message_id = record['message_id']
+        self.last_user_id = record.get('last_user_id') or 0
+        self.sent = record.get('sent') or 0
+        self.failed = record.get('failed') or 0
+        self.blocked = record.get('blocked') or 0
+        self.batch_size = batch_size
+        self._semaphore = asyncio.Semaphore(max(1, concurrency))
+        
+        self._started = time.monotonic()
+        self._processed_at_start = self.sent + self.failed + self.blocked
+        self._last_report = 0.0
+        self._report_message_id = None
+    
+    @property
+    def processed(self) -> int:
+        return self.sent + self.failed + self.blocked
+    
+    def throughput(self) -> float:
+        """Shu jarayonda soniyasiga qayta ishlangan foydalanuvchilar"""
+        elapsed = time.monotonic() - self._started
+        return (self.processed - self._processed_at_start) / elapsed if elapsed > 0 else 0.0
+    
+    async def _send_one(self, user_id: int) -> str:
+        """'sent', 'blocked' yoki 'failed'"""
+        async with self._semaphore:
+            try:
+                with send_priority(PRIORITY_LOW):
+                    await self.bot.copy_message(user_id, self.from_chat_id, self.message_id)
+                return 'sent'
+            except TelegramForbiddenError:
+                # Botni bloklagan yoki hisobini o'chirgan
+                return 'blocked'
+            except TelegramBadRequest as e:
+                if any(reason in str(e).lower() for reason in UNREACHABLE_ERRORS):
+                    return 'blocked'
+                print(f"Broadcast {self.id}: {user_id} ga yuborilmadi: {e}")
+                return 'failed'
+            except (TelegramRetryAfter, TelegramAPIError) as e:
+                print(f"Broadcast {self.id}: {user_id} ga yuborilmadi: {e}")
+                return 'failed'
+    
+    async def _send_batch(self, user_ids) -> bool:
+        """Partiyani yuborish va progressni saqlash; to'xtatilgan bo'lsa False"""
+        results = await asyncio.gather(*(self._send_one(user_id) for user_id in user_ids))
+        
+        blocked_ids = [user_id for user_id, result in zip(user_ids, results) if result == 'blocked']
+        self.sent += results.count('sent')
+        self.failed += results.count('failed')
+        self.blocked += len(blocked_ids)
+        self.last_user_id = user_ids[-1]
+        
+        if blocked_ids:
+            await db.mark_blocked(blocked_ids)
+        return await db.run(db.db.broadcasts.save_progress, self.id, OWNER_ID,
+                            self.last_user_id, self.sent, self.failed, self.blocked)
+    
+    def _report_text(self, title: str) -> str:
+        return (
+            f"{title}\n\n"
+            f"🆔 Broadcast #{self.id}\n"
+            f"✅ Yuborildi: {self.sent}\n"
+            f"🚫 Bloklagan: {self.blocked}\n"
+            f"⚠️ Xatolik: {self.failed}\n"
+            f"⚡️ Tezlik: {self.throughput():.1f} ta/soniya"
+        )
+    
+    async def report(self, title: str, force: bool = False):
+        """Admin'ga holatni ko'rsatish (bitta xabarni tahrirlab)"""
+        now = time.monotonic()
+        if not force and now - self._last_report < BROADCAST_REPORT_INTERVAL:
+            return
+        self._last_report = now
+        text = self._report_text(title)
+        try:
+            with send_priority(PRIORITY_LOW):
+                if self._report_message_id is None:
+                    message = await self.bot.send_message(self.admin_id, text)
+                    self._report_message_id = message.message_id
+                else:
+                    await self.bot.edit_message_text(text, chat_id=self.admin_id,
+                                                     message_id=self._report_message_id)
+        except TelegramAPIError as e:
+            print(f"Broadcast {self.id} report failed: {e}")
+    
+    async def run(self):
+        """Oxirgi saqlangan foydalanuvchidan boshlab oxirigacha yuborish"""
+        print(f"📣 Broadcast #{self.id} boshlandi (user_id > {self.last_user_id})")
+        await self.report("📣 Broadcast boshlandi", force=True)
+        
+        batches = db.iter_user_ids(self.last_user_id, self.batch_size)
+        try:
+            async for user_ids in batches:
+                if not await self._send_batch(user_ids):
+                    # Admin to'xtatdi yoki boshqa replika oldi
+                    print(f"⏹ Broadcast #{self.id} to'xtatildi")
+                    await self.report("⏹ Broadcast to'xtatildi", force=True)
+                    return
+                await self.report("📣 Broadcast davom etmoqda...")
+        finally:
+            # Server-side cursor va ulanishni darhol qaytarish
+            await batches.aclose()
+        
+        await db.run(db.db.broadcasts.finish, self.id, 'completed')
+        print(f"✅ Broadcast #{self.id} tugadi: {self.sent} yuborildi, "
+              f"{self.blocked} bloklangan, {self.throughput():.1f}/s")
+        await self.report("✅ Broadcast tugadi", force=True)
+
+
+class BroadcastManager:
+    """Shu jarayondagi broadcast'lar va to'xtab qolganlarini davom ettirish"""
+    
+    def __init__(self, bot: Bot):
+        self.bot = bot
+        self._tasks: Dict[int, asyncio.Task] = {}
+    
+    def _spawn(self, record: Dict):
+        broadcast = Broadcast(self.bot, record)
+        task = asyncio.create_task(self._run(broadcast))
+        self._tasks[broadcast.id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(broadcast.id, None))
+    
+    async def _run(self, broadcast: Broadcast):
+        try:
+            await broadcast.run()
+        except asyncio.CancelledError:
+            # Jarayon to'xtamoqda - progress saqlangan, boshqa replika davom ettiradi
+            raise
+        except Exception as e:
+            # Xatolik - progress saqlangan, stale bo'lgach qayta olinadi
+            print(f"Broadcast #{broadcast.id} error: {e}")
+    
+    async def start(self, admin_id: int, from_chat_id: int, message_id: int) -> int:
+        """Yangi broadcast yaratib ishga tushirish"""
+        broadcast_id = await db.run(db.db.broadcasts.create, admin_id, from_chat_id,
+                                    message_id, OWNER_ID)
+        self._spawn(await db.run(db.db.broadcasts.get, broadcast_id))
+        return broadcast_id
+    
+    async def stop(self, broadcast_id: int) -> bool:
+        """Broadcast'ni bekor qilish (qaysi replikada ishlayotganidan qat'i nazar)"""
+        record = await db.run(db.db.broadcasts.get, broadcast_id)
+        if not record or record['status'] != 'running':
+            return False
+        await db.run(db.db.broadcasts.finish, broadcast_id, 'cancelled')
+        return True
+    
+    async def resume_loop(self, interval: float = BROADCAST_RESUME_INTERVAL):
+        """Egasi o'lgan broadcast'larni vaqti-vaqti bilan olib davom ettirish"""
+        while True:
+            try:
+                for record in await db.run(db.db.broadcasts.claim_stale, OWNER_ID,
+                                           BROADCAST_STALE_AFTER):
+                    if record['id'] not in self._tasks:
+                        self._spawn(record)
+            except Exception as e:
+                print(f"Broadcast resume error: {e}")
+            await asyncio.sleep(interval)
+    
+    async def shutdown(self):
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+
+_manager: Optional[BroadcastManager] = None
+
+def get_broadcast_manager(bot: Bot) -> BroadcastManager:
+    """Global broadcast manager"""
+    global _manager
+    if _manager is None:
+        _manager = BroadcastManager(bot)
+    return _manager
@@ -0,0 +1,380 @@
+"""
+Cache module for Telegram Bot
+In-process LRU/TTL cache, pluggable cache for AI-generated content,
+Telegram file_id cache for rendered files and channel subscription cache
+"""
+
+import os
+import re
+import time
+import json
+import asyncio
+import hashlib
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Optional
+
+# ============ KONFIGURATSIYA ============
+# memory - jarayon ichida, postgres - replikalar orasida umumiy, none - o'chirilgan
+CONTENT_CACHE_BACKEND = os.getenv("CONTENT_CACHE_BACKEND", "memory")
+CONTENT_CACHE_TTL = int(os.getenv("CONTENT_CACHE_TTL", str(7 * 24 * 3600)))
+CONTENT_CACHE_SIZE = int(os.getenv("CONTENT_CACHE_SIZE", "1000"))
+# postgres backend: muddati o'tgan yozuvlarni o'chirish oralig'i (soniya)
+CONTENT_CACHE_PURGE_INTERVAL = float(os.getenv("CONTENT_CACHE_PURGE_INTERVAL", "3600"))
+FILE_CACHE_SIZE = int(os.getenv("FILE_CACHE_SIZE", "5000"))
+FILE_CACHE_TTL = int(os.getenv("FILE_CACHE_TTL", str(24 * 3600)))
+# Obuna natijalari: obuna bo'lganlar uzoqroq, bo'lmaganlar qisqa saqlanadi
+SUB_CACHE_POSITIVE_TTL = float(os.getenv("SUB_CACHE_POSITIVE_TTL", "600"))
+SUB_CACHE_NEGATIVE_TTL = float(os.getenv("SUB_CACHE_NEGATIVE_TTL", "20"))
+# API xatosida eski natijadan qancha vaqtgacha foydalanish mumkin
+SUB_CACHE_STALE_TTL = float(os.getenv("SUB_CACHE_STALE_TTL", str(24 * 3600)))
+SUB_CACHE_SIZE = int(os.getenv("SUB_CACHE_SIZE", "50000"))
+
+
+# ============ LRU + TTL CACHE ============
+
+_MISSING = object()
+
+
+class TTLCache:
+    """Bounded LRU cache with per-entry expiry"""
+    
+    def __init__(self, maxsize: int = 1024, ttl: float = 300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()    # key -> (expires_at, value)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+    
+    def get(self, key, default=None):
+        item = self._data.get(key, _MISSING)
+        if item is _MISSING:
+            self.misses += 1
+            return default
+        
+        expires_at, value = item
+        if expires_at < time.monotonic():
+            del self._data[key]
+            self.misses += 1
+            return default
+        
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+    
+    def set(self, key, value, ttl: float = None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        self._data[key] = (expires_at, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+    
+    def pop(self, key, default=None):
+        item = self._data.pop(key, _MISSING)
+        return default if item is _MISSING else item[1]
+    
+    def clear(self):
+        self._data.clear()
+    
+    def __len__(self):
+        return len(self._data)
+    
+    def stats(self) -> Dict:
+        return {
+            'size': len(self._data),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
+
+
+# ============ AI CONTENT CACHE ============
+
+def normalize_topic(topic: str) -> str:
+    """Mavzuni solishtirish uchun normallashtirish"""
+    topic = topic.casefold().replace('’', "'").replace('‘', "'")
+    topic = re.sub(r'\s+', ' ', topic)
+    return topic.strip(' .,!?;:"\'«»')
+
+
+def make_content_key(topic: str, pages: int, doc_type: str, lang: str) -> str:
+    """(mavzu, sahifalar, tur, til) bo'yicha kesh kaliti"""
+    raw = json.dumps([normalize_topic(topic), int(pages), doc_type, lang], ensure_ascii=False)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+class ContentCache:
+    """Base class: counts hits and misses, backends implement _get/_set"""
+    
+    backend = 'none'
+    
+    def __init__(self, ttl: int = CONTENT_CACHE_TTL):
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+    
+    async def _get(self, key: str) -> Optional[dict]:
+        return None
+    
+    async def _set(self, key: str, content: dict):
+        pass
+    
+    async def get(self, topic: str, pages: int, doc_type: str, lang: str) -> Optional[dict]:
+        """Keshdan kontent olish (xatolik bo'lsa - miss)"""
+        try:
+            content = await self._get(make_content_key(topic, pages, doc_type, lang))
+        except Exception as e:
+            self.errors += 1
+            print(f"Content cache get error: {e}")
+            content = None
+        
+        if content is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return content
+    
+    async def set(self, topic: str, pages: int, doc_type: str, lang: str, content: dict):
+        """Kontentni keshga yozish"""
+        try:
+            await self._set(make_content_key(topic, pages, doc_type, lang), content)
+        except Exception as e:
+            self.errors += 1
+            print(f"Content cache set error: {e}")
+    
+    def stats(self) -> Dict:
+        total = self.hits + self.misses
+        return {
+            'backend': self.backend,
+            'hits': self.hits,
+            'misses': self.misses,
+            'errors': self.errors,
+            'hit_rate': self.hits / total if total else 0.0,
+        }
+
+
+class MemoryContentCache(ContentCache):
+    """Jarayon ichidagi LRU kesh"""
+    
+    backend = 'memory'
+    
+    def __init__(self, ttl: int = CONTENT_CACHE_TTL, maxsize: int = CONTENT_CACHE_SIZE):
+        super().__init__(ttl)
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+    
+    async def _get(self, key: str) -> Optional[dict]:
+        return self._cache.get(key)
+    
+    async def _set(self, key: str, content: dict):
+        self._cache.set(key, content)
+    
+    def stats(self) -> Dict:
+        return {**super().stats(), 'size': len(self._cache)}
+
+
+class PostgresContentCache(ContentCache):
+    """content_cache jadvalidagi kesh - barcha replikalar uchun umumiy"""
+    
+    backend = 'postgres'
+    
+    def __init__(self, ttl: int = CONTENT_CACHE_TTL):
+        super().__init__(ttl)
+        from database import get_async_db
+        self._db = get_async_db()
+    
+    async def _get(self, key: str) -> Optional[dict]:
+        return await self._db.run(self._db.db.content_cache.get, key)
+    
+    async def _set(self, key: str, content: dict):
+        await self._db.run(self._db.db.content_cache.set, key, content, self.ttl)
+    
+    async def purge_loop(self, interval: float = CONTENT_CACHE_PURGE_INTERVAL):
+        """Muddati o'tgan yozuvlarni vaqti-vaqti bilan o'chirish (jadval cheksiz o'smasin)"""
+        while True:
+            try:
+                removed = await self._db.run(self._db.db.content_cache.purge_expired)
+                if removed:
+                    print(f"🧹 {removed} ta eskirgan kontent keshi o'chirildi")
+            except Exception as e:
+                print(f"Content cache purge error: {e}")
+            await asyncio.sleep(interval)
+
+
+def create_content_cache(backend: str = CONTENT_CACHE_BACKEND) -> ContentCache:
+    """Sozlamaga ko'ra kesh backend'ini tanlash"""
+    if backend == 'memory':
+        return MemoryContentCache()
+    if backend == 'postgres':
+        return PostgresContentCache()
+    return ContentCache()
+
+
+# ============ RENDERED FILE CACHE ============
+
+def make_render_key(content: dict, design_id: Optional[str], doc_type: str) -> str:
+    """(kontent JSON, dizayn, tur) bo'yicha tayyor fayl kaliti"""
+    raw = json.dumps([content, design_id, doc_type], ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+# Fayl nomida ruxsat etilmagan belgilar
+UNSAFE_FILENAME_CHARS = re.compile(r'[\\/:*?"<>|\x00-\x1f]+')
+
+
+def make_filename(content: dict, doc_type: str) -> str:
+    """Kontent sarlavhasidan fayl nomi
+    
+    file_id orqali boshqa foydalanuvchiga qayta yuborilganda Telegram asl
+    nomni saqlaydi - shuning uchun nomda foydalanuvchi yoki generatsiya id yo'q.
+    """
+    extension = 'pptx' if doc_type == 'presentation' else 'docx'
+    title = UNSAFE_FILENAME_CHARS.sub(' ', str(content.get('title') or ''))
+    title = re.sub(r'\s+', '_', title.strip(' ._'))[:60].rstrip('_.')
+    return f"{title or ('presentation' if doc_type == 'presentation' else 'document')}.{extension}"
+
+
+class FileCache:
+    """Tayyor fayllarning Telegram file_id'lari: xotira + generations jadvali"""
+    
+    def __init__(self, maxsize: int = FILE_CACHE_SIZE, ttl: int = FILE_CACHE_TTL):
+        from database import get_async_db
+        self._db = get_async_db()
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.hits = 0
+        self.misses = 0
+    
+    async def get(self, render_key: str) -> Optional[str]:
+        """Oldin yuborilgan faylning file_id'si"""
+        file_id = self._cache.get(render_key)
+        if file_id is None:
+            try:
+                file_id = await self._db.find_file_id(render_key)
+            except Exception as e:
+                print(f"File cache get error: {e}")
+            if file_id is not None:
+                self._cache.set(render_key, file_id)
+        
+        if file_id is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return file_id
+    
+    async def set(self, generation_id: int, render_key: str, file_id: str):
+        """Yuborilgan fayl file_id'sini saqlash"""
+        self._cache.set(render_key, file_id)
+        try:
+            await self._db.set_file_id(generation_id, render_key, file_id)
+        except Exception as e:
+            print(f"File cache set error: {e}")
+    
+    def forget(self, render_key: str):
+        """Yaroqsiz file_id'ni xotiradan o'chirish"""
+        self._cache.pop(render_key)
+    
+    def stats(self) -> Dict:
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self._cache)}
+
+
+# ============ SUBSCRIPTION CACHE ============
+
+class SubscriptionCache:
+    """Kanal a'zoligi natijalari: TTL, bir vaqtdagi so'rovlarni birlashtirish"""
+    
+    def __init__(self, positive_ttl: float = SUB_CACHE_POSITIVE_TTL,
+                 negative_ttl: float = SUB_CACHE_NEGATIVE_TTL,
+                 stale_ttl: float = SUB_CACHE_STALE_TTL, maxsize: int = SUB_CACHE_SIZE):
+        self.positive_ttl = positive_ttl
+        self.negative_ttl = negative_ttl
+        # (a'zomi, tekshirilgan vaqt) - stale_ttl gacha saqlanadi
+        self._results = TTLCache(maxsize=maxsize, ttl=max(stale_ttl, positive_ttl, negative_ttl))
+        self._in_flight = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.stale_served = 0
+    
+    def set(self, user_id: int, is_member: bool):
+        self._results.set(user_id, (is_member, time.monotonic()))
+    
+    def invalidate(self, user_id: int):
+        self._results.pop(user_id)
+    
+    async def check(self, user_id: int, fetch: Callable[[int], Awaitable[bool]]) -> bool:
+        """Keshdan yoki fetch(user_id) orqali a'zolikni aniqlash
+        
+        fetch xato bersa va eski natija bo'lsa, o'sha qaytariladi; aks holda
+        xato yuqoriga uzatiladi.
+        """
+        cached = self._results.get(user_id)
+        if cached is not None:
+            is_member, checked_at = cached
+            ttl = self.positive_ttl if is_member else self.negative_ttl
+            if time.monotonic() - checked_at < ttl:
+                self.hits += 1
+                return is_member
+        
+        task = self._in_flight.get(user_id)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            self.misses += 1
+            task = asyncio.ensure_future(fetch(user_id))
+            self._in_flight[user_id] = task
+            task.add_done_callback(lambda _: self._in_flight.pop(user_id, None))
+        
+        try:
+            # shield: bitta kutuvchi bekor qilinsa, boshqalar uchun so'rov davom etadi
+            is_member = await asyncio.shield(task)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            if cached is not None:
+                self.stale_served += 1
+                return cached[0]
+            raise
+        
+        self.set(user_id, is_member)
+        return is_member
+    
+    def stats(self) -> Dict:
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'coalesced': self.coalesced,
+            'stale_served': self.stale_served,
+            'size': len(self._results),
+        }
+
+
+_content_cache = None
+
+def get_content_cache() -> ContentCache:
+    """Global content cache"""
+    global _content_cache
+    if _content_cache is None:
+        _content_cache = create_content_cache()
+    return _content_cache
+
+
+_file_cache = None
+
+def get_file_cache() -> FileCache:
+    """Global rendered file cache"""
+    global _file_cache
+    if _file_cache is None:
+        _file_cache = FileCache()
+    return _file_cache
+
+
+_subscription_cache = None
+
+def get_subscription_cache() -> SubscriptionCache:
+    """Global subscription cache"""
+    global _subscription_cache
+    if _subscription_cache is None:
+        _subscription_cache = SubscriptionCache()
+    return _subscription_cache
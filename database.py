@@ -4,112 +4,294 @@ Handles all database operations for users, generations, and referrals
 """
 
 import os
+import time
+import asyncio
+import functools
+import threading
 import psycopg2
+import psycopg2.extras
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, date
-from typing import Optional, Dict, List, Tuple
+from typing import Optional, Dict, List, Tuple, Iterator
 from contextlib import contextmanager
 
+from cache import TTLCache
+
 # Railway'dagi DATABASE_URL hamma ma'lumotni o'zi ichiga oladi
-DATABASE_URL = os.environ.get('DATABASE_URL',sslmode=require)
+DATABASE_URL = os.environ.get('DATABASE_URL')
+
+# Pool sozlamalari
+DB_POOL_MIN = int(os.environ.get('DB_POOL_MIN', '1'))
+DB_POOL_MAX = int(os.environ.get('DB_POOL_MAX', '10'))
+DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', '10'))
+DB_POOL_RECYCLE = float(os.environ.get('DB_POOL_RECYCLE', '1800'))
+DB_POOL_PING_AFTER = float(os.environ.get('DB_POOL_PING_AFTER', '30'))
+# Ulanish va o'lik TCP aloqani aniqlash (soniya) - yarim ochiq socket daqiqalab osilib qolmasin
+DB_CONNECT_TIMEOUT = int(os.environ.get('DB_CONNECT_TIMEOUT', '5'))
+DB_KEEPALIVES_IDLE = int(os.environ.get('DB_KEEPALIVES_IDLE', '30'))
+DB_KEEPALIVES_INTERVAL = int(os.environ.get('DB_KEEPALIVES_INTERVAL', '10'))
+DB_KEEPALIVES_COUNT = int(os.environ.get('DB_KEEPALIVES_COUNT', '3'))
+
+# Foydalanuvchi qatorlari keshi: qisqa TTL - boshqa replikalar o'zgarishi ham tez ko'rinadi
+USER_CACHE_SIZE = int(os.environ.get('USER_CACHE_SIZE', '10000'))
+USER_CACHE_TTL = float(os.environ.get('USER_CACHE_TTL', '30'))
+
+# generations oylik bo'limlarga bo'lingan: so'rovlar created_at oynasi bilan
+# faqat oxirgi bo'limlarni o'qiydi. Vazifalar (navbat) va tarix/file_id keshi uchun
+JOB_WINDOW_DAYS = int(os.environ.get('JOB_WINDOW_DAYS', '7'))
+HISTORY_WINDOW_DAYS = int(os.environ.get('HISTORY_WINDOW_DAYS', '180'))
+
+# get_user_stats: user_generation_stats hisoblagichlaridan (1) yoki generations'ni sanab (0)
+USER_STATS_COUNTERS = os.environ.get('USER_STATS_COUNTERS', '1') == '1'
+
+# Jarayon ishga tushganda migratsiyalarni qo'llash; avtoskeyling'da 0 qilib,
+# `python migrations.py` ni deploy (release) qadamida bir marta ishga tushiring
+RUN_MIGRATIONS = os.environ.get('RUN_MIGRATIONS', '1') == '1'
+
+
+# ============ CONNECTION POOL ============
+
+class PoolTimeout(Exception):
+    """Raised when no connection becomes available in time"""
+
+
+class ConnectionPool:
+    """Thread-safe pool of long-lived PostgreSQL connections"""
+    
+    def __init__(self, dsn: str, min_size: int = 1, max_size: int = 10,
+                 timeout: float = 10, recycle: float = 1800, ping_after: float = 30):
+        self.dsn = dsn
+        self.min_size = min_size
+        self.max_size = max(max_size, min_size, 1)
+        self.timeout = timeout
+        self.recycle = recycle
+        self.ping_after = ping_after
+        
+        self._idle = deque()          # (conn, created_at, last_used)
+        self._created = {}            # id(conn) -> created_at
+        self._connecting = 0          # slots reserved for connections being opened
+        self._cond = threading.Condition()
+        self._closed = False
+        
+        self._stats = {
+            'checkouts': 0,
+            'created': 0,
+            'recycled': 0,
+            'failed_checks': 0,
+            'timeouts': 0,
+            'wait_time_total': 0.0,
+            'wait_time_max': 0.0,
+        }
+    
+    def _connect(self):
+        return psycopg2.connect(
+            self.dsn,
+            sslmode='require',
+            cursor_factory=psycopg2.extras.RealDictCursor,
+            connect_timeout=DB_CONNECT_TIMEOUT,
+            keepalives=1,
+            keepalives_idle=DB_KEEPALIVES_IDLE,
+            keepalives_interval=DB_KEEPALIVES_INTERVAL,
+            keepalives_count=DB_KEEPALIVES_COUNT
+        )
+    
+    def _discard(self, conn):
+        with self._cond:
+            self._created.pop(id(conn), None)
+            self._cond.notify()
+        try:
+            conn.close()
+        except Exception:
+            pass
+    
+    def _is_healthy(self, conn, created_at: float, last_used: float) -> bool:
+        """Drop closed, broken or too old connections; ping idle ones
+        
+        Called without the pool lock: the ping goes over the network.
+        """
+        now = time.monotonic()
+        if conn.closed:
+            return False
+        if self.recycle and now - created_at > self.recycle:
+            with self._cond:
+                self._stats['recycled'] += 1
+            return False
+        if self.ping_after and now - last_used > self.ping_after:
+            try:
+                with conn.cursor() as cursor:
+                    cursor.execute('SELECT 1')
+                conn.rollback()
+            except Exception:
+                with self._cond:
+                    self._stats['failed_checks'] += 1
+                return False
+        return True
+    
+    def open(self):
+        """Pre-create min_size connections"""
+        with self._cond:
+            while len(self._created) < self.min_size:
+                conn = self._connect()
+                now = time.monotonic()
+                self._created[id(conn)] = now
+                self._stats['created'] += 1
+                self._idle.append((conn, now, now))
+    
+    def getconn(self):
+        """Borrow a connection, waiting up to `timeout` seconds"""
+        started = time.monotonic()
+        deadline = started + self.timeout
+        
+        while True:
+            conn = None
+            with self._cond:
+                while True:
+                    if self._closed:
+                        raise PoolTimeout("Connection pool is closed")
+                    
+                    if self._idle:
+                        conn, created_at, last_used = self._idle.pop()
+                        break
+                    
+                    if len(self._created) + self._connecting < self.max_size:
+                        # Slot band qilinadi, TLS ulanish lock'dan tashqarida ochiladi
+                        self._connecting += 1
+                        break
+                    
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats['timeouts'] += 1
+                        raise PoolTimeout(
+                            f"No free database connection after {self.timeout}s "
+                            f"(max_size={self.max_size})"
+                        )
+                    self._cond.wait(remaining)
+            
+            if conn is None:
+                break
+            # Tekshiruv (ping) lock'dan tashqarida - sekin ulanish boshqalarni to'xtatmaydi
+            if self._is_healthy(conn, created_at, last_used):
+                break
+            self._discard(conn)
+        
+        if conn is None:
+            try:
+                conn = self._connect()
+            except Exception:
+                with self._cond:
+                    self._connecting -= 1
+                    self._cond.notify()
+                raise
+            with self._cond:
+                self._connecting -= 1
+                self._created[id(conn)] = time.monotonic()
+                self._stats['created'] += 1
+        
+        with self._cond:
+            waited = time.monotonic() - started
+            self._stats['checkouts'] += 1
+            self._stats['wait_time_total'] += waited
+            self._stats['wait_time_max'] = max(self._stats['wait_time_max'], waited)
+        return conn
+    
+    def putconn(self, conn, discard: bool = False):
+        """Return a connection to the pool"""
+        with self._cond:
+            created_at = self._created.get(id(conn))
+            if not (discard or self._closed or conn.closed or created_at is None):
+                self._idle.append((conn, created_at, time.monotonic()))
+                self._cond.notify()
+                return
+        self._discard(conn)
+    
+    def close(self):
+        """Close all idle connections; borrowed ones are closed on return"""
+        with self._cond:
+            self._closed = True
+            idle = [conn for conn, _, _ in self._idle]
+            self._idle.clear()
+            self._cond.notify_all()
+        for conn in idle:
+            self._discard(conn)
+    
+    def stats(self) -> Dict:
+        """Pool usage statistics"""
+        with self._cond:
+            total = len(self._created)
+            idle = len(self._idle)
+            checkouts = self._stats['checkouts']
+            return {
+                **self._stats,
+                'size': total,
+                'idle': idle,
+                'checked_out': total - idle,
+                'min_size': self.min_size,
+                'max_size': self.max_size,
+                'wait_time_avg': self._stats['wait_time_total'] / checkouts if checkouts else 0.0,
+            }
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool() -> ConnectionPool:
+    """Get global connection pool"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(
+                    DATABASE_URL,
+                    min_size=DB_POOL_MIN,
+                    max_size=DB_POOL_MAX,
+                    timeout=DB_POOL_TIMEOUT,
+                    recycle=DB_POOL_RECYCLE,
+                    ping_after=DB_POOL_PING_AFTER
+                )
+                _pool.open()
+    return _pool
+
+
+def close_pool():
+    """Close global connection pool"""
+    global _pool
+    if _pool is not None:
+        _pool.close()
+        _pool = None
 
-# Faqat shunday ulanasiz:
-conn = psycopg2.connect(DATABASE_URL)
-cursor = conn.cursor()
 
 # ============ DATABASE CONNECTION ============
 
 @contextmanager
 def get_connection():
-    """Context manager for PostgreSQL connections"""
-    # 1. (DATABASE_NAME) qismini butunlay o'chiring
-    # 2. sslmode='require' ni qo'shish tavsiya etiladi
-    db_url = os.environ.get('DATABASE_URL')
-    conn = psycopg2.connect(db_url, sslmode='require')
+    """Context manager for pooled PostgreSQL connections"""
+    pool = get_pool()
+    conn = pool.getconn()
+    broken = False
     
     try:
         yield conn
         conn.commit()
     except Exception as e:
-        conn.rollback()
+        try:
+            conn.rollback()
+        except psycopg2.Error:
+            broken = True
         raise e
     finally:
-        conn.close()
+        pool.putconn(conn, discard=broken or bool(conn.closed))
 
 
 # ============ DATABASE INITIALIZATION ============
 
 def init_db():
-    """Initialize database tables"""
-    with get_connection() as conn:
-        cursor = conn.cursor()
-        
-        # Users table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                user_id BIGINT PRIMARY KEY,
-                username TEXT,
-                first_name TEXT,
-                language TEXT DEFAULT 'uz',
-                daily_limit BIGINT DEFAULT 2,
-                used_today BIGINT DEFAULT 0,
-                last_reset DATE,
-                total_generations BIGINT DEFAULT 0,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        # Generations table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS generations (
-                id BIGSERIAL PRIMARY KEY,
-                user_id BIGINT NOT NULL,
-                doc_type TEXT NOT NULL,
-                topic TEXT NOT NULL,
-                pages BIGINT NOT NULL,
-                design TEXT,
-                status TEXT DEFAULT 'pending',
-                file_path TEXT,
-                error_message TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                completed_at TIMESTAMP,
-                CONSTRAINT fk_user FOREIGN KEY (user_id) REFERENCES users (user_id)
-            )
-        ''')
-        
-        # Referrals table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS referrals (
-                id BIGSERIAL PRIMARY KEY,
-                referrer_id BIGINT NOT NULL,
-                referred_id BIGINT NOT NULL,
-                bonus_applied BOOLEAN DEFAULT FALSE,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                CONSTRAINT fk_referrer FOREIGN KEY (referrer_id) REFERENCES users (user_id),
-                CONSTRAINT fk_referred FOREIGN KEY (referred_id) REFERENCES users (user_id),
-                UNIQUE(referrer_id, referred_id)
-            )
-        ''')
-
-        
-        # Create indexes for better performance
-        cursor.execute('''
-            CREATE INDEX IF NOT EXISTS idx_generations_user_id 
-            ON generations(user_id)
-        ''')
-        
-        cursor.execute('''
-            CREATE INDEX IF NOT EXISTS idx_generations_created_at 
-            ON generations(created_at)
-        ''')
-        
-        cursor.execute('''
-            CREATE INDEX IF NOT EXISTS idx_referrals_referrer 
-            ON referrals(referrer_id)
-        ''')
-        
-        conn.commit()
-        print("✅ Database initialized successfully")
+    """Apply pending schema migrations (see migrations.py)"""
+    # migrations imports this module, so import it lazily
+    from migrations import migrate
+    
+    applied = migrate()
+    print(f"✅ Database initialized successfully ({applied} migration(s) applied)")
 
 
 # ============ USER DATABASE CLASS ============
@@ -128,19 +310,26 @@ class UserDB:
             existing = cursor.fetchone()
             
             if existing:
+                if existing.get('blocked_at'):
+                    # Foydalanuvchi botga qaytdi - broadcast'larga qayta qo'shiladi
+                    cursor.execute(
+                        'UPDATE users SET blocked_at = NULL WHERE user_id = %s',
+                        (user_id,)
+                    )
+                    existing['blocked_at'] = None
                 return dict(existing)
             
             # Create new user
             today = date.today().isoformat()
             cursor.execute('''
                 INSERT INTO users (user_id, username, first_name, last_reset)
-                VALUES ($s, $s, $s, $s)
+                VALUES (%s, %s, %s, %s)
             ''', (user_id, username, first_name, today))
             
             conn.commit()
             
             # Return created user
-            cursor.execute('SELECT * FROM users WHERE user_id = $s', (user_id,))
+            cursor.execute('SELECT * FROM users WHERE user_id = %s', (user_id,))
             return dict(cursor.fetchone())
     
     @staticmethod
@@ -148,7 +337,7 @@ class UserDB:
         """Get user by ID"""
         with get_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute('SELECT * FROM users WHERE user_id = $s', (user_id,))
+            cursor.execute('SELECT * FROM users WHERE user_id = %s', (user_id,))
             row = cursor.fetchone()
             return dict(row) if row else None
     
@@ -159,32 +348,91 @@ class UserDB:
             cursor = conn.cursor()
             cursor.execute('''
                 UPDATE users 
-                SET language = $s, updated_at = CURRENT_TIMESTAMP
-                WHERE user_id = $s
+                SET language = %s, updated_at = CURRENT_TIMESTAMP
+                WHERE user_id = %s
             ''', (language, user_id))
             conn.commit()
     
     @staticmethod
     def get_daily_limit(user_id: int) -> Tuple[int, int]:
         """Get remaining and total daily limit"""
-        user = UserDB.get_user(user_id)
-        if not user:
-            return (0, 0)
-        
-        # Check if need to reset
-        UserDB._check_and_reset_limit(user_id)
-        
-        # Get fresh data after potential reset
-        user = UserDB.get_user(user_id)
-        remaining = user['daily_limit'] - user['used_today']
-        return (remaining, user['daily_limit'])
+        return UserDB.get_quota(user_id)
+    
+    @staticmethod
+    def get_quota(user_id: int) -> Tuple[int, int]:
+        """Read-only (remaining, total) with the daily reset applied in SQL"""
+        with get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT daily_limit,
+                       CASE WHEN last_reset IS DISTINCT FROM %s
+                            THEN 0 ELSE used_today END AS used
+                FROM users
+                WHERE user_id = %s
+            ''', (date.today(), user_id))
+            row = cursor.fetchone()
+            if not row:
+                return (0, 0)
+            return (row['daily_limit'] - row['used'], row['daily_limit'])
     
     @staticmethod
     def can_generate(user_id: int) -> bool:
         """Check if user can generate a document"""
-        UserDB._check_and_reset_limit(user_id)
-        user = UserDB.get_user(user_id)
-        return user['used_today'] < user['daily_limit']
+        remaining, _ = UserDB.get_quota(user_id)
+        return remaining > 0
+    
+    @staticmethod
+    def consume_generation(user_id: int) -> Tuple[bool, int, int]:
+        """Atomically reset, check and use one generation
+        
+        Returns (allowed, remaining, total). A single UPDATE does the daily
+        reset, the limit check and the increment, so concurrent confirms
+        cannot overspend the quota.
+        """
+        today = date.today()
+        with get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                UPDATE users
+                SET used_today = CASE WHEN last_reset IS DISTINCT FROM %s
+                                      THEN 1 ELSE used_today + 1 END,
+                    last_reset = %s,
+                    total_generations = total_generations + 1,
+                    updated_at = CURRENT_TIMESTAMP
+                WHERE user_id = %s
+                  AND (CASE WHEN last_reset IS DISTINCT FROM %s
+                            THEN 0 ELSE used_today END) < daily_limit
+                RETURNING daily_limit - used_today AS remaining, daily_limit AS total
+            ''', (today, today, user_id, today))
+            row = cursor.fetchone()
+            if row:
+                return (True, row['remaining'], row['total'])
+            
+            # Limit tugagan yoki foydalanuvchi yo'q - faqat ko'rsatish uchun
+            cursor.execute('''
+                SELECT daily_limit,
+                       CASE WHEN last_reset IS DISTINCT FROM %s
+                            THEN 0 ELSE used_today END AS used
+                FROM users
+                WHERE user_id = %s
+            ''', (today, user_id))
+            row = cursor.fetchone()
+            if not row:
+                return (False, 0, 0)
+            return (False, row['daily_limit'] - row['used'], row['daily_limit'])
+    
+    @staticmethod
+    def refund_generation(user_id: int):
+        """Give back a generation consumed today (e.g. after a failed render)"""
+        with get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                UPDATE users
+                SET used_today = GREATEST(used_today - 1, 0),
+                    total_generations = GREATEST(total_generations - 1, 0),
+                    updated_at = CURRENT_TIMESTAMP
+                WHERE user_id = %s AND last_reset = %s
+            ''', (user_id, date.today()))
     
     @staticmethod
     def use_generation(user_id: int):
@@ -193,47 +441,72 @@ class UserDB:
             cursor = conn.cursor()
             cursor.execute('''
                 UPDATE users 
-                SET used_today = used_today + 1,
+                SET used_today = CASE WHEN last_reset IS DISTINCT FROM %s
+                                      THEN 1 ELSE used_today + 1 END,
+                    last_reset = %s,
                     total_generations = total_generations + 1,
                     updated_at = CURRENT_TIMESTAMP
-                WHERE user_id = $s
-            ''', (user_id,))
+                WHERE user_id = %s
+            ''', (date.today(), date.today(), user_id))
             conn.commit()
     
     @staticmethod
-    def _check_and_reset_limit(user_id: int):
-        """Reset daily limit if day changed"""
-        user = UserDB.get_user(user_id)
-        if not user:
-            return
-        
-        today = date.today().isoformat()
+    def get_all_users() -> List[Dict]:
+        """Get all users"""
+        with get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT * FROM users ORDER BY created_at DESC')
+            return [dict(row) for row in cursor.fetchall()]
+    
+    
+    @staticmethod
+    def iter_user_ids(after_user_id: int = 0, batch_size: int = 1000) -> Iterator[List[int]]:
+        """Stream reachable user IDs in batches with a server-side cursor
         
-        if user['last_reset'] != today:
-            with get_connection() as conn:
-                cursor = conn.cursor()
+        The cursor is WITH HOLD, so the transaction is committed right away
+        and a long broadcast does not keep a snapshot open.
+        """
+        with get_connection() as conn:
+            cursor = conn.cursor(name='user_ids', withhold=True,
+                                 cursor_factory=psycopg2.extensions.cursor)
+            cursor.itersize = batch_size
+            try:
                 cursor.execute('''
-                    UPDATE users 
-                    SET used_today = 0, 
-                        last_reset = $s,
-                        updated_at = CURRENT_TIMESTAMP
-                    WHERE user_id = $s
-                ''', (today, user_id))
+                    SELECT user_id FROM users
+                    WHERE user_id > %s AND blocked_at IS NULL
+                    ORDER BY user_id
+                ''', (after_user_id,))
                 conn.commit()
+                while True:
+                    rows = cursor.fetchmany(batch_size)
+                    if not rows:
+                        break
+                    yield [row[0] for row in rows]
+            finally:
+                cursor.close()
     
     @staticmethod
-    def get_all_users() -> List[Dict]:
-        """Get all users"""
+    def mark_blocked(user_ids: List[int]):
+        """Remember users who blocked the bot or deleted their account"""
+        if not user_ids:
+            return
         with get_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute('SELECT * FROM users ORDER BY created_at DESC')
-            return [dict(row) for row in cursor.fetchall()]
+            cursor.execute('''
+                UPDATE users
+                SET blocked_at = CURRENT_TIMESTAMP
+                WHERE user_id = ANY(%s)
+            ''', (list(user_ids),))
 
 
 # ============ GENERATION DATABASE CLASS ============
 
 class GenerationDB:
-    """Database operations for generations"""
+    """Database operations for generations
+    
+    After migration 10 the table is partitioned by month; queries bound
+    created_at so only recent partitions are read.
+    """
     
     @staticmethod
     def create_generation(user_id: int, doc_type: str, topic: str, 
@@ -243,10 +516,135 @@ class GenerationDB:
             cursor = conn.cursor()
             cursor.execute('''
                 INSERT INTO generations (user_id, doc_type, topic, pages, design, status)
-                VALUES ($s, $s, $s, $s, $s, 'pending')
+                VALUES (%s, %s, %s, %s, %s, 'pending')
+                RETURNING id
             ''', (user_id, doc_type, topic, pages, design))
             conn.commit()
-            return cursor.lastrowid
+            return cursor.fetchone()['id']
+    
+    @staticmethod
+    def enqueue(user_id: int, doc_type: str, topic: str, pages: int, design: str,
+                lang: str, chat_id: int, message_id: int = None) -> int:
+        """Create a pending generation job for the workers"""
+        with get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                INSERT INTO generations (user_id, doc_type, topic, pages, design, status,
+                                         lang, chat_id, message_id)
+                VALUES (%s, %s, %s, %s, %s, 'pending', %s, %s, %s)
+                RETURNING id
+            ''', (user_id, doc_type, topic, pages, design, lang, chat_id, message_id))
+            return cursor.fetchone()['id']
+    
+    @staticmethod
+    def claim_next(worker_id: str) -> Optional[Dict]:
+        """Claim the oldest pending job; concurrent workers skip locked rows"""
+        with get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                UPDATE generations
+                SET status = 'processing',
+                    locked_by = %s,
+                    locked_at = CURRENT_TIMESTAMP,
+                    attempts = attempts + 1
+                WHERE created_at > CURRENT_TIMESTAMP - %s * INTERVAL '1 day'
+                  AND (id, created_at) = (
+                    SELECT id, created_at FROM generations
+                    WHERE status = 'pending' AND chat_id IS NOT NULL
+                      AND created_at > CURRENT_TIMESTAMP - %s * INTERVAL '1 day'
+                    ORDER BY id
+                    LIMIT 1
+                    FOR UPDATE SKIP LOCKED
+                )
+                RETURNING *
+            ''', (worker_id, JOB_WINDOW_DAYS, JOB_WINDOW_DAYS))
+            row = cursor.fetchone()
+            return dict(row) if row else None
+    
+    @staticmethod
+    def heartbeat(generation_id: int, worker_id: str):
+        """Keep the claim on a long-running job alive"""
+        with get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                UPDATE generations
+                SET locked_at = CURRENT_TIMESTAMP
+                WHERE id = %s AND locked_by = %s AND status = 'processing'
+                  AND created_at > CURRENT_TIMESTAMP - %s * INTERVAL '1 day'
+            ''', (generation_id, worker_id, JOB_WINDOW_DAYS))
+    
+    @staticmethod
+    def reclaim_stale(stale_after: int, max_attempts: int) -> List[Dict]:
+        """Requeue jobs of dead workers; return jobs that ran out of attempts"""
+        with get_connection() as conn:
+            cursor = conn.cursor()
+            
+            # Jobs from before the queue existed cannot be delivered
+            cursor.execute('''
+                UPDATE generations
+                SET status = 'failed', error_message = 'Abandoned before job queue'
+                WHERE status = 'pending' AND chat_id IS NULL
+                  AND created_at > CURRENT_TIMESTAMP - %s * INTERVAL '1 day'
+            ''', (JOB_WINDOW_DAYS,))
+            
+            cursor.execute('''
+                UPDATE generations
+                SET status = 'failed',
+                    error_message = 'Worker lost the job too many times',
+                    locked_by = NULL
+                WHERE status = 'processing'
+                  AND locked_at < CURRENT_TIMESTAMP - %s * INTERVAL '1 second'
+                  AND attempts >= %s
+                  AND created_at > CURRENT_TIMESTAMP - %s * INTERVAL '1 day'
+                RETURNING *
+            ''', (stale_after, max_attempts, JOB_WINDOW_DAYS))
+            exhausted = [dict(row) for row in cursor.fetchall()]
+            
+            cursor.execute('''
+                UPDATE generations
+                SET status = 'pending', locked_by = NULL, locked_at = NULL
+                WHERE status = 'processing'
+                  AND locked_at < CURRENT_TIMESTAMP - %s * INTERVAL '1 second'
+                  AND created_at > CURRENT_TIMESTAMP - %s * INTERVAL '1 day'
+            ''', (stale_after, JOB_WINDOW_DAYS))
+            
+            # Jobs leaving the window would never be claimed again (older ones
+            # were expired once by migration 12); scan only the last day past it
+            cursor.execute('''
+                UPDATE generations
+                SET status = 'failed', error_message = 'Expired in queue', locked_by = NULL
+                WHERE status IN ('pending', 'processing')
+                  AND created_at <= CURRENT_TIMESTAMP - %s * INTERVAL '1 day'
+                  AND created_at > CURRENT_TIMESTAMP - (%s + 1) * INTERVAL '1 day'
+            ''', (JOB_WINDOW_DAYS, JOB_WINDOW_DAYS))
+            
+            return exhausted
+    
+    @staticmethod
+    def count_active(user_id: int) -> int:
+        """Count user's pending and processing jobs"""
+        with get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT COUNT(*) AS count
+                FROM generations
+                WHERE user_id = %s AND status IN ('pending', 'processing')
+                  AND created_at > CURRENT_TIMESTAMP - %s * INTERVAL '1 day'
+            ''', (user_id, JOB_WINDOW_DAYS))
+            return cursor.fetchone()['count']
+    
+    @staticmethod
+    def queue_position(generation_id: int) -> int:
+        """1-based position among pending jobs (0 if not pending)"""
+        with get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT COUNT(*) AS position
+                FROM generations
+                WHERE status = 'pending' AND chat_id IS NOT NULL AND id <= %s
+                  AND created_at > CURRENT_TIMESTAMP - %s * INTERVAL '1 day'
+            ''', (generation_id, JOB_WINDOW_DAYS))
+            return cursor.fetchone()['position']
     
     @staticmethod
     def update_status(generation_id: int, status: str, 
@@ -259,20 +657,47 @@ class GenerationDB:
             
             cursor.execute('''
                 UPDATE generations 
-                SET status = $s, 
-                    file_path = $s,
-                    error_message = $s,
-                    completed_at = $s
-                WHERE id = $s
-            ''', (status, file_path, error_message, completed_at, generation_id))
+                SET status = %s, 
+                    file_path = %s,
+                    error_message = %s,
+                    completed_at = %s
+                WHERE id = %s AND created_at > CURRENT_TIMESTAMP - %s * INTERVAL '1 day'
+            ''', (status, file_path, error_message, completed_at, generation_id, JOB_WINDOW_DAYS))
             conn.commit()
     
+    @staticmethod
+    def set_file_id(generation_id: int, content_hash: str, file_id: str):
+        """Remember Telegram file_id of the delivered file"""
+        with get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                UPDATE generations
+                SET content_hash = %s, file_id = %s
+                WHERE id = %s AND created_at > CURRENT_TIMESTAMP - %s * INTERVAL '1 day'
+            ''', (content_hash, file_id, generation_id, JOB_WINDOW_DAYS))
+    
+    @staticmethod
+    def find_file_id(content_hash: str) -> Optional[str]:
+        """Get file_id of an already delivered file with the same content"""
+        with get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT file_id
+                FROM generations
+                WHERE content_hash = %s AND file_id IS NOT NULL
+                  AND created_at > CURRENT_TIMESTAMP - %s * INTERVAL '1 day'
+                ORDER BY id DESC
+                LIMIT 1
+            ''', (content_hash, HISTORY_WINDOW_DAYS))
+            row = cursor.fetchone()
+            return row['file_id'] if row else None
+    
     @staticmethod
     def get_generation(generation_id: int) -> Optional[Dict]:
         """Get generation by ID"""
         with get_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute('SELECT * FROM generations WHERE id = $s', (generation_id,))
+            cursor.execute('SELECT * FROM generations WHERE id = %s', (generation_id,))
             row = cursor.fetchone()
             return dict(row) if row else None
     
@@ -283,10 +708,10 @@ class GenerationDB:
             cursor = conn.cursor()
             cursor.execute('''
                 SELECT * FROM generations 
-                WHERE user_id = $s 
+                WHERE user_id = %s AND created_at > CURRENT_TIMESTAMP - %s * INTERVAL '1 day'
                 ORDER BY created_at DESC 
-                LIMIT $s
-            ''', (user_id, limit))
+                LIMIT %s
+            ''', (user_id, HISTORY_WINDOW_DAYS, limit))
             return [dict(row) for row in cursor.fetchall()]
     
     @staticmethod
@@ -295,13 +720,23 @@ class GenerationDB:
         with get_connection() as conn:
             cursor = conn.cursor()
             
+            if USER_STATS_COUNTERS:
+                # Trigger bilan yuritiladigan hisoblagichlar - bitta qator
+                cursor.execute('''
+                    SELECT total, completed, failed
+                    FROM user_generation_stats
+                    WHERE user_id = %s
+                ''', (user_id,))
+                row = cursor.fetchone()
+                return dict(row) if row else {'total': 0, 'completed': 0, 'failed': 0}
+            
             # Total generations
             cursor.execute('''
                 SELECT COUNT(*) as total,
                        SUM(CASE WHEN status = 'completed' THEN 1 ELSE 0 END) as completed,
                        SUM(CASE WHEN status = 'failed' THEN 1 ELSE 0 END) as failed
                 FROM generations
-                WHERE user_id = $s
+                WHERE user_id = %s
             ''', (user_id,))
             
             row = cursor.fetchone()
@@ -323,7 +758,7 @@ class ReferralDB:
                 # Check if referral already exists
                 cursor.execute('''
                     SELECT id FROM referrals 
-                    WHERE referrer_id = $s AND referred_id = $s
+                    WHERE referrer_id = %s AND referred_id = %s
                 ''', (referrer_id, referred_id))
                 
                 if cursor.fetchone():
@@ -332,7 +767,7 @@ class ReferralDB:
                 # Add referral
                 cursor.execute('''
                     INSERT INTO referrals (referrer_id, referred_id, bonus_applied)
-                    VALUES ($s, $s, 1)
+                    VALUES (%s, %s, TRUE)
                 ''', (referrer_id, referred_id))
                 
                 # Give bonus to referrer (+1 permanent limit)
@@ -340,13 +775,13 @@ class ReferralDB:
                     UPDATE users 
                     SET daily_limit = daily_limit + 1,
                         updated_at = CURRENT_TIMESTAMP
-                    WHERE user_id = $s
+                    WHERE user_id = %s
                 ''', (referrer_id,))
                 
                 conn.commit()
                 return True
-                
-        except sqlite3.IntegrityError:
+        
+        except psycopg2.IntegrityError:
             return False
     
     @staticmethod
@@ -357,7 +792,7 @@ class ReferralDB:
             cursor.execute('''
                 SELECT COUNT(*) as count 
                 FROM referrals 
-                WHERE referrer_id = $s
+                WHERE referrer_id = %s
             ''', (referrer_id,))
             row = cursor.fetchone()
             return row['count'] if row else 0
@@ -371,7 +806,7 @@ class ReferralDB:
                 SELECT r.*, u.username, u.first_name 
                 FROM referrals r
                 LEFT JOIN users u ON r.referred_id = u.user_id
-                WHERE r.referrer_id = $s
+                WHERE r.referrer_id = %s
                 ORDER BY r.created_at DESC
             ''', (referrer_id,))
             return [dict(row) for row in cursor.fetchall()]
@@ -384,12 +819,279 @@ class ReferralDB:
             cursor.execute('''
                 SELECT referrer_id 
                 FROM referrals 
-                WHERE referred_id = $s
+                WHERE referred_id = %s
             ''', (referred_id,))
             row = cursor.fetchone()
             return row['referrer_id'] if row else None
 
 
+# ============ CONTENT CACHE DATABASE CLASS ============
+
+class ContentCacheDB:
+    """Database operations for cached AI content"""
+    
+    @staticmethod
+    def get(cache_key: str) -> Optional[Dict]:
+        """Get cached content if not expired"""
+        with get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                UPDATE content_cache
+                SET hits = hits + 1
+                WHERE cache_key = %s AND expires_at > CURRENT_TIMESTAMP
+                RETURNING content
+            ''', (cache_key,))
+            row = cursor.fetchone()
+            return row['content'] if row else None
+    
+    @staticmethod
+    def set(cache_key: str, content: Dict, ttl: int):
+        """Store content for `ttl` seconds"""
+        with get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                INSERT INTO content_cache (cache_key, content, expires_at)
+                VALUES (%s, %s, CURRENT_TIMESTAMP + %s * INTERVAL '1 second')
+                ON CONFLICT (cache_key) DO UPDATE
+                SET content = EXCLUDED.content,
+                    created_at = CURRENT_TIMESTAMP,
+                    expires_at = EXCLUDED.expires_at
+            ''', (cache_key, psycopg2.extras.Json(content), ttl))
+    
+    @staticmethod
+    def purge_expired() -> int:
+        """Delete expired entries"""
+        with get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                DELETE FROM content_cache
+                WHERE expires_at <= CURRENT_TIMESTAMP
+            ''')
+            return cursor.rowcount
+
+
+# ============ FSM DATABASE CLASS ============
+
+class FSMDB:
+    """Database operations for FSM (conversation) state"""
+    
+    @staticmethod
+    def get(storage_key: str) -> Optional[Dict]:
+        """Get {'state', 'data'} for a chat"""
+        with get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT state, data FROM fsm_states WHERE storage_key = %s
+            ''', (storage_key,))
+            row = cursor.fetchone()
+            return dict(row) if row else None
+    
+    @staticmethod
+    def _delete_if_empty(cursor, storage_key: str):
+        cursor.execute('''
+            DELETE FROM fsm_states
+            WHERE storage_key = %s AND state IS NULL AND data = '{}'::jsonb
+        ''', (storage_key,))
+    
+    @staticmethod
+    def set_state(storage_key: str, state: Optional[str]):
+        """Store only the state; data written concurrently is kept"""
+        with get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                INSERT INTO fsm_states (storage_key, state, updated_at)
+                VALUES (%s, %s, CURRENT_TIMESTAMP)
+                ON CONFLICT (storage_key) DO UPDATE
+                SET state = EXCLUDED.state,
+                    updated_at = CURRENT_TIMESTAMP
+            ''', (storage_key, state))
+            if state is None:
+                FSMDB._delete_if_empty(cursor, storage_key)
+    
+    @staticmethod
+    def set_data(storage_key: str, data: Dict):
+        """Store only the data; the state written concurrently is kept"""
+        with get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                INSERT INTO fsm_states (storage_key, data, updated_at)
+                VALUES (%s, %s, CURRENT_TIMESTAMP)
+                ON CONFLICT (storage_key) DO UPDATE
+                SET data = EXCLUDED.data,
+                    updated_at = CURRENT_TIMESTAMP
+            ''', (storage_key, psycopg2.extras.Json(data)))
+            if not data:
+                FSMDB._delete_if_empty(cursor, storage_key)
+    
+    @staticmethod
+    def merge_data(storage_key: str, data: Dict) -> Dict:
+        """Merge top-level keys into the stored data in one statement; returns the result"""
+        with get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                INSERT INTO fsm_states AS s (storage_key, data, updated_at)
+                VALUES (%s, %s, CURRENT_TIMESTAMP)
+                ON CONFLICT (storage_key) DO UPDATE
+                SET data = s.data || EXCLUDED.data,
+                    updated_at = CURRENT_TIMESTAMP
+                RETURNING data
+            ''', (storage_key, psycopg2.extras.Json(data)))
+            return cursor.fetchone()['data']
+    
+    @staticmethod
+    def purge(older_than: int) -> int:
+        """Delete states not touched for `older_than` seconds"""
+        with get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                DELETE FROM fsm_states
+                WHERE updated_at < CURRENT_TIMESTAMP - %s * INTERVAL '1 second'
+            ''', (older_than,))
+            return cursor.rowcount
+
+
+# ============ UPDATE DATABASE CLASS ============
+
+class UpdateDB:
+    """Database operations for Telegram update deduplication"""
+    
+    @staticmethod
+    def claim(update_id: int, lease: int) -> str:
+        """Take the update for `lease` seconds
+        
+        Returns 'claimed', 'done' (already handled) or 'busy' (another
+        replica holds an unexpired lease). An expired lease means its
+        replica died mid-update, so the update is claimed again.
+        """
+        with get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                INSERT INTO processed_updates AS u (update_id, status, expires_at)
+                VALUES (%s, 'processing', CURRENT_TIMESTAMP + %s * INTERVAL '1 second')
+                ON CONFLICT (update_id) DO UPDATE
+                SET expires_at = EXCLUDED.expires_at,
+                    created_at = CURRENT_TIMESTAMP
+                WHERE u.status = 'processing' AND u.expires_at < CURRENT_TIMESTAMP
+                RETURNING update_id
+            ''', (update_id, lease))
+            if cursor.fetchone():
+                return 'claimed'
+            
+            cursor.execute('SELECT status FROM processed_updates WHERE update_id = %s', (update_id,))
+            row = cursor.fetchone()
+            return 'done' if row and row['status'] == 'done' else 'busy'
+    
+    @staticmethod
+    def complete(update_id: int):
+        """Mark a claimed update as handled"""
+        with get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                UPDATE processed_updates
+                SET status = 'done', expires_at = NULL
+                WHERE update_id = %s
+            ''', (update_id,))
+    
+    @staticmethod
+    def forget(update_id: int):
+        """Release the lease so a redelivered update is handled"""
+        with get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                DELETE FROM processed_updates
+                WHERE update_id = %s AND status = 'processing'
+            ''', (update_id,))
+    
+    @staticmethod
+    def purge(older_than: int) -> int:
+        """Delete records older than `older_than` seconds"""
+        with get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                DELETE FROM processed_updates
+                WHERE created_at < CURRENT_TIMESTAMP - %s * INTERVAL '1 second'
+            ''', (older_than,))
+            return cursor.rowcount
+
+
+# ============ BROADCAST DATABASE CLASS ============
+
+class BroadcastDB:
+    """Database operations for broadcast progress"""
+    
+    @staticmethod
+    def create(admin_id: int, from_chat_id: int, message_id: int, owner: str) -> int:
+        """Create a running broadcast owned by `owner`"""
+        with get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                INSERT INTO broadcasts (admin_id, from_chat_id, message_id, locked_by)
+                VALUES (%s, %s, %s, %s)
+                RETURNING id
+            ''', (admin_id, from_chat_id, message_id, owner))
+            return cursor.fetchone()['id']
+    
+    @staticmethod
+    def claim_stale(owner: str, stale_after: int) -> List[Dict]:
+        """Take over running broadcasts whose owner stopped saving progress"""
+        with get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                UPDATE broadcasts
+                SET locked_by = %s, updated_at = CURRENT_TIMESTAMP
+                WHERE id IN (
+                    SELECT id FROM broadcasts
+                    WHERE status = 'running'
+                      AND updated_at < CURRENT_TIMESTAMP - %s * INTERVAL '1 second'
+                    FOR UPDATE SKIP LOCKED
+                )
+                RETURNING *
+            ''', (owner, stale_after))
+            return [dict(row) for row in cursor.fetchall()]
+    
+    @staticmethod
+    def save_progress(broadcast_id: int, owner: str, last_user_id: int,
+                      sent: int, failed: int, blocked: int) -> bool:
+        """Checkpoint progress; False if the broadcast was stopped or taken over"""
+        with get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                UPDATE broadcasts
+                SET last_user_id = %s, sent = %s, failed = %s, blocked = %s,
+                    updated_at = CURRENT_TIMESTAMP
+                WHERE id = %s AND locked_by = %s AND status = 'running'
+            ''', (last_user_id, sent, failed, blocked, broadcast_id, owner))
+            return cursor.rowcount > 0
+    
+    @staticmethod
+    def finish(broadcast_id: int, status: str):
+        """Mark broadcast completed or cancelled"""
+        with get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                UPDATE broadcasts
+                SET status = %s, finished_at = CURRENT_TIMESTAMP, updated_at = CURRENT_TIMESTAMP
+                WHERE id = %s AND status = 'running'
+            ''', (status, broadcast_id))
+    
+    @staticmethod
+    def get(broadcast_id: int) -> Optional[Dict]:
+        """Get broadcast by ID"""
+        with get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT * FROM broadcasts WHERE id = %s', (broadcast_id,))
+            row = cursor.fetchone()
+            return dict(row) if row else None
+    
+    @staticmethod
+    def get_running() -> List[Dict]:
+        """Get all running broadcasts"""
+        with get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT * FROM broadcasts WHERE status = 'running' ORDER BY id")
+            return [dict(row) for row in cursor.fetchall()]
+
+
 # ============ COMBINED DATABASE CLASS ============
 
 class Database:
@@ -399,6 +1101,10 @@ class Database:
         self.users = UserDB()
         self.generations = GenerationDB()
         self.referrals = ReferralDB()
+        self.content_cache = ContentCacheDB()
+        self.updates = UpdateDB()
+        self.fsm = FSMDB()
+        self.broadcasts = BroadcastDB()
     
     # Shortcut methods for common operations
     def create_user(self, user_id: int, username: str = None, first_name: str = None):
@@ -416,11 +1122,204 @@ class Database:
     def get_daily_limit(self, user_id: int):
         return self.users.get_daily_limit(user_id)
     
+    def consume_generation(self, user_id: int):
+        return self.users.consume_generation(user_id)
+    
+    def refund_generation(self, user_id: int):
+        return self.users.refund_generation(user_id)
+    
     def add_referral(self, referrer_id: int, referred_id: int):
         return self.referrals.add_referral(referrer_id, referred_id)
     
     def get_referral_count(self, referrer_id: int):
         return self.referrals.get_referral_count(referrer_id)
+    
+    def update_language(self, user_id: int, language: str):
+        return self.users.update_language(user_id, language)
+    
+    def create_generation(self, user_id: int, doc_type: str, topic: str,
+                          pages: int, design: str = None):
+        return self.generations.create_generation(user_id, doc_type, topic, pages, design)
+    
+    def update_generation_status(self, generation_id: int, status: str,
+                                 file_path: str = None, error_message: str = None):
+        return self.generations.update_status(generation_id, status, file_path, error_message)
+    
+    def enqueue_generation(self, user_id: int, doc_type: str, topic: str, pages: int,
+                           design: str, lang: str, chat_id: int, message_id: int = None):
+        return self.generations.enqueue(user_id, doc_type, topic, pages, design,
+                                        lang, chat_id, message_id)
+    
+    def claim_generation(self, worker_id: str):
+        return self.generations.claim_next(worker_id)
+    
+    def heartbeat_generation(self, generation_id: int, worker_id: str):
+        return self.generations.heartbeat(generation_id, worker_id)
+    
+    def reclaim_stale_generations(self, stale_after: int, max_attempts: int):
+        return self.generations.reclaim_stale(stale_after, max_attempts)
+    
+    def count_active_generations(self, user_id: int):
+        return self.generations.count_active(user_id)
+    
+    def generation_queue_position(self, generation_id: int):
+        return self.generations.queue_position(generation_id)
+    
+    def set_file_id(self, generation_id: int, content_hash: str, file_id: str):
+        return self.generations.set_file_id(generation_id, content_hash, file_id)
+    
+    def find_file_id(self, content_hash: str):
+        return self.generations.find_file_id(content_hash)
+    
+    def mark_blocked(self, user_ids: List[int]):
+        return self.users.mark_blocked(user_ids)
+    
+    def pool_stats(self):
+        return get_pool().stats()
+
+
+# ============ ASYNC DATABASE CLASS ============
+
+class AsyncDatabase:
+    """Awaitable counterpart of Database for aiogram handlers
+    
+    psycopg2 is blocking, so every call runs on a dedicated thread pool
+    sized to the connection pool: queries from different users overlap
+    instead of blocking the event loop.
+    """
+    
+    def __init__(self, db: Database = None, max_workers: int = None,
+                 user_cache_size: int = USER_CACHE_SIZE, user_cache_ttl: float = USER_CACHE_TTL):
+        self.db = db or get_db()
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers or DB_POOL_MAX,
+            thread_name_prefix='db'
+        )
+        # Read-through cache of user rows; only touched from the event loop
+        self.user_cache = TTLCache(maxsize=user_cache_size, ttl=user_cache_ttl)
+    
+    async def run(self, func, *args, **kwargs):
+        """Run any blocking database call without blocking the event loop"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
+    
+    def invalidate_user(self, user_id: int):
+        """Drop cached row after the user changed"""
+        self.user_cache.pop(user_id)
+    
+    async def create_user(self, user_id: int, username: str = None, first_name: str = None):
+        user = await self.run(self.db.create_user, user_id, username, first_name)
+        if user:
+            self.user_cache.set(user_id, user)
+        return user
+    
+    async def get_user(self, user_id: int):
+        user = self.user_cache.get(user_id)
+        if user is None:
+            user = await self.run(self.db.get_user, user_id)
+            if user:
+                self.user_cache.set(user_id, user)
+        return user
+    
+    async def update_language(self, user_id: int, language: str):
+        try:
+            return await self.run(self.db.update_language, user_id, language)
+        finally:
+            self.invalidate_user(user_id)
+    
+    async def can_generate(self, user_id: int):
+        return await self.run(self.db.can_generate, user_id)
+    
+    async def use_generation(self, user_id: int):
+        try:
+            return await self.run(self.db.use_generation, user_id)
+        finally:
+            self.invalidate_user(user_id)
+    
+    async def get_daily_limit(self, user_id: int):
+        return await self.run(self.db.get_daily_limit, user_id)
+    
+    async def consume_generation(self, user_id: int):
+        try:
+            return await self.run(self.db.consume_generation, user_id)
+        finally:
+            self.invalidate_user(user_id)
+    
+    async def refund_generation(self, user_id: int):
+        try:
+            return await self.run(self.db.refund_generation, user_id)
+        finally:
+            self.invalidate_user(user_id)
+    
+    async def add_referral(self, referrer_id: int, referred_id: int):
+        try:
+            return await self.run(self.db.add_referral, referrer_id, referred_id)
+        finally:
+            # Referrer's daily_limit changed
+            self.invalidate_user(referrer_id)
+    
+    async def get_referral_count(self, referrer_id: int):
+        return await self.run(self.db.get_referral_count, referrer_id)
+    
+    async def create_generation(self, user_id: int, doc_type: str, topic: str,
+                                pages: int, design: str = None):
+        return await self.run(self.db.create_generation, user_id, doc_type, topic, pages, design)
+    
+    async def update_generation_status(self, generation_id: int, status: str,
+                                       file_path: str = None, error_message: str = None):
+        return await self.run(self.db.update_generation_status, generation_id, status,
+                              file_path, error_message)
+    
+    async def enqueue_generation(self, user_id: int, doc_type: str, topic: str, pages: int,
+                                 design: str, lang: str, chat_id: int, message_id: int = None):
+        return await self.run(self.db.enqueue_generation, user_id, doc_type, topic, pages,
+                              design, lang, chat_id, message_id)
+    
+    async def claim_generation(self, worker_id: str):
+        return await self.run(self.db.claim_generation, worker_id)
+    
+    async def heartbeat_generation(self, generation_id: int, worker_id: str):
+        return await self.run(self.db.heartbeat_generation, generation_id, worker_id)
+    
+    async def reclaim_stale_generations(self, stale_after: int, max_attempts: int):
+        return await self.run(self.db.reclaim_stale_generations, stale_after, max_attempts)
+    
+    async def count_active_generations(self, user_id: int):
+        return await self.run(self.db.count_active_generations, user_id)
+    
+    async def generation_queue_position(self, generation_id: int):
+        return await self.run(self.db.generation_queue_position, generation_id)
+    
+    async def set_file_id(self, generation_id: int, content_hash: str, file_id: str):
+        return await self.run(self.db.set_file_id, generation_id, content_hash, file_id)
+    
+    async def find_file_id(self, content_hash: str):
+        return await self.run(self.db.find_file_id, content_hash)
+    
+    async def iter_user_ids(self, after_user_id: int = 0, batch_size: int = 1000):
+        """Async iterator over user ID batches; each fetch runs on the executor"""
+        batches = self.db.users.iter_user_ids(after_user_id, batch_size)
+        try:
+            while True:
+                batch = await self.run(next, batches, None)
+                if batch is None:
+                    break
+                yield batch
+        finally:
+            # Cursor va ulanishni ham executor'da yopish
+            await self.run(batches.close)
+    
+    async def mark_blocked(self, user_ids: List[int]):
+        try:
+            return await self.run(self.db.mark_blocked, user_ids)
+        finally:
+            for user_id in user_ids:
+                self.invalidate_user(user_id)
+    
+    async def close(self):
+        """Stop worker threads and close pooled connections"""
+        self._executor.shutdown(wait=True)
+        close_pool()
 
 
 # ============ GLOBAL DATABASE INSTANCE ============
@@ -435,21 +1334,20 @@ def get_db() -> Database:
     return _db_instance
 
 
-# ============ INITIALIZE ON IMPORT ============
+_async_db_instance = None
+
+def get_async_db() -> AsyncDatabase:
+    """Get global async database instance"""
+    global _async_db_instance
+    if _async_db_instance is None:
+        _async_db_instance = AsyncDatabase(get_db())
+    return _async_db_instance
+
+
+# ============ MIGRATION ENTRY POINT ============
 
 if __name__ == "__main__":
+    # Alohida migratsiya qadami: python database.py (yoki python migrations.py)
     print("Initializing database...")
     init_db()
     print("Database ready!")
-else:
-    # Auto-initialize when imported
-    try:
-        init_db()
-    except Exception as e:
-
-        print(f"Warning: Could not initialize database: {e}")
-
-
-
-
-
@@ -0,0 +1,129 @@
+"""
+Streaming DOCX writer for Telegram Bot
+Writes WordprocessingML straight into the zip instead of building a python-docx tree
+"""
+
+import os
+import re
+import zipfile
+import importlib.util
+from typing import BinaryIO, Dict, Iterator, Union
+from xml.sax.saxutils import escape
+
+DOCUMENT_PART = 'word/document.xml'
+
+# python-docx'ning Document() bilan bir xil uslublar, shrift va sahifa sozlamalari;
+# berilmasa python-docx'ning default.docx shabloni (birinchi render'da topiladi)
+DOCX_TEMPLATE = os.getenv("DOCX_TEMPLATE")
+
+# Bo'sh qator - yangi paragraf
+PARAGRAPH_SPLIT = re.compile(r'\n\s*\n')
+# XML'da ruxsat etilmagan boshqaruv belgilari
+INVALID_XML_CHARS = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+# Shablon qismlari (document.xml'dan tashqari) - jarayonda bir marta o'qiladi
+_template = None
+
+
+def _default_template() -> str:
+    spec = importlib.util.find_spec('docx')
+    if spec is None:
+        raise ImportError("python-docx o'rnatilmagan va DOCX_TEMPLATE berilmagan")
+    return os.path.join(os.path.dirname(spec.origin), 'templates', 'default.docx')
+
+
+def load_template() -> Dict:
+    """Shablonni o'qish (worker ishga tushganda oldindan chaqiriladi)"""
+    global _template
+    if _template is None:
+        with zipfile.ZipFile(DOCX_TEMPLATE or _default_template()) as source:
+            parts = {
+                info.filename: source.read(info.filename)
+                for info in source.infolist()
+                if info.filename != DOCUMENT_PART
+            }
+            document = source.read(DOCUMENT_PART).decode('utf-8')
+        
+        # <w:body> dan oldingi qism va sahifa sozlamalari (sectPr) saqlanadi
+        body_start = document.index('<w:body>') + len('<w:body>')
+        sect_start = document.index('<w:sectPr')
+        _template = {
+            'parts': parts,
+            'head': document[:body_start],
+            'tail': document[sect_start:],
+        }
+    return _template
+
+
+def _run(text: str) -> str:
+    """Matn -> <w:r>; \\n -> <w:br/>, \\t -> <w:tab/> (python-docx kabi)"""
+    text = INVALID_XML_CHARS.sub('', text)
+    pieces = []
+    for i, line in enumerate(text.split('\n')):
+        if i:
+            pieces.append('<w:br/>')
+        for j, chunk in enumerate(line.split('\t')):
+            if j:
+                pieces.append('<w:tab/>')
+            if chunk:
+                pieces.append(f'<w:t xml:space="preserve">{escape(chunk)}</w:t>')
+    return f"<w:r>{''.join(pieces)}</w:r>"
+
+
+def _paragraph(text: str, style: str = None, center: bool = False) -> str:
+    props = ''
+    if style or center:
+        props = '<w:pPr>'
+        if style:
+            props += f'<w:pStyle w:val="{style}"/>'
+        if center:
+            props += '<w:jc w:val="center"/>'
+        props += '</w:pPr>'
+    return f'<w:p>{props}{_run(text) if text else ""}</w:p>'
+
+
+def _heading(text: str, level: int) -> str:
+    # add_heading(text, 1) -> "Heading 1" uslubi
+    return _paragraph(text, f'Heading{level}')
+
+
+def _paragraphs(text: str) -> Iterator[str]:
+    """Matnni bo'sh qatorlar bo'yicha paragraflarga bo'lish"""
+    for block in PARAGRAPH_SPLIT.split(text or ''):
+        block = block.strip('\n')
+        if block.strip():
+            yield _paragraph(block)
+
+
+def _body(data: dict) -> Iterator[str]:
+    """create_document bilan bir xil tartib: sarlavha, kirish, bo'limlar, xulosa"""
+    yield _paragraph(data['title'], 'Title', center=True)
+    
+    yield _heading('Kirish', 1)
+    yield from _paragraphs(data['introduction'])
+    
+    for section in data['sections']:
+        yield _heading(section['title'], 1)
+        yield from _paragraphs(section['content'])
+    
+    yield _heading('Xulosa', 1)
+    yield from _paragraphs(data['conclusion'])
+
+
+def write_document(data: dict, output: Union[str, BinaryIO]):
+    """Word hujjatni paragraf-ma-paragraf zip'ga yozish (fayl yo'li yoki BytesIO'ga)
+    
+    Xotirada faqat bitta paragraf va zlib buferi turadi - hajm bo'limlar
+    soniga bog'liq emas.
+    """
+    template = load_template()
+    
+    with zipfile.ZipFile(output, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for name, content in template['parts'].items():
+            archive.writestr(name, content)
+        
+        with archive.open(DOCUMENT_PART, 'w') as document:
+            document.write(template['head'].encode('utf-8'))
+            for xml in _body(data):
+                document.write(xml.encode('utf-8'))
+            document.write(template['tail'].encode('utf-8'))
@@ -1,39 +1,79 @@
+import time
+# Ishga tushish vaqti importlardan oldin o'lchanadi
+_started = time.perf_counter()
+
 import os
-import json
 import asyncio
+import psycopg2
 from aiogram import Bot, Dispatcher, types, F
 from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.fsm.storage.memory import MemoryStorage
-from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton, FSInputFile
-import google.generativeai as genai
-from pptx import Presentation
-from pptx.util import Inches, Pt
-from pptx.enum.text import PP_ALIGN
-from pptx.dml.color import RGBColor
-from docx import Document
-from docx.shared import Pt as DocPt, RGBColor as DocRGB
+from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+from aiogram.exceptions import TelegramAPIError, TelegramBadRequest
 
 # ============ DATABASE IMPORT ============
-from database import get_db, init_db, create_user
+from database import get_async_db, init_db, RUN_MIGRATIONS
+
+# ============ CACHE IMPORT ============
+from cache import get_subscription_cache
+
+# ============ SENDER IMPORT ============
+from sender import setup_sender, send_priority, PRIORITY_LOW
+
+# ============ BROADCAST IMPORT ============
+from broadcast import get_broadcast_manager, is_admin
+
+# ============ FSM STORAGE IMPORT ============
+from storage import PostgresStorage
+
+# ============ AI IMPORT ============
+from ai import AI_MAX_PER_USER
+
+# ============ RENDER IMPORT ============
+from render import DESIGNS, launch_render_pool, shutdown_render_pool
+
+# ============ WORKER IMPORT ============
+from worker import GenerationWorker
+
+# ============ STARTUP IMPORT ============
+from startup import StartupReport
+
+# ============ METRICS IMPORT ============
+from metrics import log_stats_loop
+
+# ============ TARJIMALAR ============
+from texts import get_text
 
 # ============ KONFIGURATSIYA ============
 BOT_TOKEN = os.getenv("BOT_TOKEN")
-GEMINI_API_KEY = os.getenv("API_KEY")
 REQUIRED_CHANNEL = "@bkzsdfgahd"
-
-# Gemini AI sozlash
-genai.configure(api_key=GEMINI_API_KEY)
-model = genai.GenerativeModel('gemini-2.5-flash')
+# polling yoki webhook
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+# FSM holatlari: postgres yoki memory
+FSM_STORAGE = os.getenv("FSM_STORAGE", "postgres")
+# Generatsiya worker'ini shu jarayon ichida ham ishga tushirish
+EMBEDDED_WORKER = os.getenv("EMBEDDED_WORKER", "1") == "1"
+# referrals.referrer_id - BIGINT
+MAX_USER_ID = 2 ** 63 - 1
 
 # Bot sozlash
 bot = Bot(token=BOT_TOKEN)
-storage = MemoryStorage()
+# Barcha chiquvchi xabarlar rate limit va ustuvorlik bilan yuboriladi
+send_scheduler = setup_sender(bot)
+# Holatlar Postgres'da - restart'dan keyin ham saqlanadi va replikalar uchun umumiy
+storage = PostgresStorage() if FSM_STORAGE == 'postgres' else MemoryStorage()
 dp = Dispatcher(storage=storage)
 
-# Database instance
-db = get_db()
+# Database instance (async, event loop'ni bloklamaydi)
+db = get_async_db()
+
+# Kanal obunasi keshi
+subscription_cache = get_subscription_cache()
+
+# Admin broadcast'lari
+broadcasts = get_broadcast_manager(bot)
 
 # ============ HOLATLAR (STATES) ============
 class BotStates(StatesGroup):
@@ -45,329 +85,29 @@ class BotStates(StatesGroup):
     select_design = State()
     confirm = State()
 
-# ============ TARJIMALAR ============
-TEXTS = {
-    'uz': {
-        'welcome': '👋 Assalomu alaykum!\n\n📊 Taqdimot va 📝 Referat/Mustaqil ish tayyorlash botiga xush kelibsiz!\n\n💎 Kunlik limit: {remaining}/{total}\n\nTilni tanlang:',
-        'select_lang': 'Tilni tanlang:',
-        'subscription_required': '📢 Botdan foydalanish uchun kanalga obuna bo\'ling:\n\n{channel}\n\n✅ Obuna bo\'lgach "Tasdiqlash" tugmasini bosing',
-        'check_btn': '✅ Obuna tekshirish',
-        'not_subscribed': '❌ Siz hali obuna bo\'lmadingiz!\n\nIltimos, avval kanalga obuna bo\'ling: {channel}',
-        'select_type': '📝 Qaysi turdagi hujjat kerak?\n\n💎 Bugungi limit: {remaining}/{total}',
-        'presentation': '📊 Taqdimot (PPTX)',
-        'report': '📝 Referat',
-        'coursework': '📚 Mustaqil ish',
-        'enter_topic': '✏️ Mavzuni kiriting:',
-        'enter_pages': '📄 Nechta sahifa kerak? (3-50 oralig\'ida)',
-        'invalid_pages': '❌ Noto\'g\'ri son! 3 dan 50 gacha son kiriting.',
-        'select_design': '🎨 Dizayn shablonini tanlang:',
-        'confirm_data': '📋 <b>Kiritilgan ma\'lumotlar:</b>\n\n'
-                       '🎯 Tur: {doc_type}\n'
-                       '📖 Mavzu: {topic}\n'
-                       '📄 Sahifalar: {pages}\n'
-                       '{design}'
-                       '\n✅ Davom etamizmi?',
-        'confirm_yes': '✅ Ha, davom etish',
-        'confirm_no': '❌ Yo\'q, qaytadan',
-        'generating': '⏳ Tayyorlanmoqda... Iltimos kuting...\n\n📊 Bu 30-60 soniya vaqt olishi mumkin.',
-        'success': '✅ Tayyor! Marhamat:\n\n💎 Qolgan limit: {remaining}/{total}',
-        'error': '❌ Xatolik yuz berdi. Iltimos qaytadan urinib ko\'ring.\n\nXatolik: {error}',
-        'back_to_start': '🔙 Boshiga qaytish',
-        'limit_reached': '⛔️ Kunlik limitingiz tugadi!\n\n'
-                        '💎 Bugungi limit: {remaining}/{total}\n'
-                        '🔄 Ertaga yangi limit beriladi\n\n'
-                        '🎁 Ko\'proq limit olish uchun do\'stlaringizni taklif qiling!\n'
-                        '🔗 Sizning referal havolangiz:\n'
-                        '{ref_link}\n\n'
-                        '👥 Har bir do\'stingiz uchun +1 doimiy limit!',
-        'referral_success': '🎉 Tabriklaymiz!\n\n'
-                           '{inviter} sizni taklif qildi va +1 limit oldi!\n\n'
-                           '💎 Siz ham do\'stlaringizni taklif qilib limitingizni oshiring!',
-        'referral_info': '👥 <b>Referal tizimi:</b>\n\n'
-                        '💎 Sizning limitingiz: {limit}\n'
-                        '📊 Taklif qilganlar: {count} ta\n'
-                        '🔗 Referal havolangiz:\n'
-                        '{ref_link}\n\n'
-                        '🎁 Har bir do\'st uchun +1 doimiy limit!'
-    },
-    'ru': {
-        'welcome': '👋 Здравствуйте!\n\n📊 Добро пожаловать в бот для создания презентаций и 📝 рефератов/курсовых работ!\n\n💎 Дневной лимит: {remaining}/{total}\n\nВыберите язык:',
-        'select_lang': 'Выберите язык:',
-        'subscription_required': '📢 Для использования бота подпишитесь на канал:\n\n{channel}\n\n✅ После подписки нажмите "Проверить"',
-        'check_btn': '✅ Проверить подписку',
-        'not_subscribed': '❌ Вы еще не подписались!\n\nПожалуйста, сначала подпишитесь на канал: {channel}',
-        'select_type': '📝 Какой тип документа нужен?\n\n💎 Сегодняшний лимит: {remaining}/{total}',
-        'presentation': '📊 Презентация (PPTX)',
-        'report': '📝 Реферат',
-        'coursework': '📚 Курсовая работа',
-        'enter_topic': '✏️ Введите тему:',
-        'enter_pages': '📄 Сколько страниц? (от 3 до 50)',
-        'invalid_pages': '❌ Неверное число! Введите от 3 до 50.',
-        'select_design': '🎨 Выберите дизайн шаблона:',
-        'confirm_data': '📋 <b>Введенные данные:</b>\n\n'
-                       '🎯 Тип: {doc_type}\n'
-                       '📖 Тема: {topic}\n'
-                       '📄 Страниц: {pages}\n'
-                       '{design}'
-                       '\n✅ Продолжить?',
-        'confirm_yes': '✅ Да, продолжить',
-        'confirm_no': '❌ Нет, заново',
-        'generating': '⏳ Генерируется... Пожалуйста, подождите...\n\n📊 Это может занять 30-60 секунд.',
-        'success': '✅ Готово! Держите:\n\n💎 Осталось: {remaining}/{total}',
-        'error': '❌ Произошла ошибка. Попробуйте еще раз.\n\nОшибка: {error}',
-        'back_to_start': '🔙 В начало',
-        'limit_reached': '⛔️ Дневной лимит исчерпан!\n\n'
-                        '💎 Сегодняшний лимит: {remaining}/{total}\n'
-                        '🔄 Завтра получите новый лимит\n\n'
-                        '🎁 Пригласите друзей для больше лимита!\n'
-                        '🔗 Ваша реферальная ссылка:\n'
-                        '{ref_link}\n\n'
-                        '👥 За каждого друга +1 постоянный лимит!',
-        'referral_success': '🎉 Поздравляем!\n\n'
-                           '{inviter} пригласил вас и получил +1 лимит!\n\n'
-                           '💎 Вы тоже можете пригласить друзей!',
-        'referral_info': '👥 <b>Реферальная система:</b>\n\n'
-                        '💎 Ваш лимит: {limit}\n'
-                        '📊 Приглашено: {count} чел.\n'
-                        '🔗 Реферальная ссылка:\n'
-                        '{ref_link}\n\n'
-                        '🎁 За каждого друга +1 постоянный лимит!'
-    },
-    'en': {
-        'welcome': '👋 Hello!\n\n📊 Welcome to the presentation and 📝 report/coursework creation bot!\n\n💎 Daily limit: {remaining}/{total}\n\nSelect language:',
-        'select_lang': 'Select language:',
-        'subscription_required': '📢 To use the bot, subscribe to the channel:\n\n{channel}\n\n✅ After subscribing, click "Check"',
-        'check_btn': '✅ Check subscription',
-        'not_subscribed': '❌ You haven\'t subscribed yet!\n\nPlease subscribe to the channel first: {channel}',
-        'select_type': '📝 What type of document do you need?\n\n💎 Today\'s limit: {remaining}/{total}',
-        'presentation': '📊 Presentation (PPTX)',
-        'report': '📝 Report',
-        'coursework': '📚 Coursework',
-        'enter_topic': '✏️ Enter topic:',
-        'enter_pages': '📄 How many pages? (3 to 50)',
-        'invalid_pages': '❌ Invalid number! Enter from 3 to 50.',
-        'select_design': '🎨 Select design template:',
-        'confirm_data': '📋 <b>Entered data:</b>\n\n'
-                       '🎯 Type: {doc_type}\n'
-                       '📖 Topic: {topic}\n'
-                       '📄 Pages: {pages}\n'
-                       '{design}'
-                       '\n✅ Continue?',
-        'confirm_yes': '✅ Yes, continue',
-        'confirm_no': '❌ No, restart',
-        'generating': '⏳ Generating... Please wait...\n\n📊 This may take 30-60 seconds.',
-        'success': '✅ Done! Here you go:\n\n💎 Remaining: {remaining}/{total}',
-        'error': '❌ An error occurred. Please try again.\n\nError: {error}',
-        'back_to_start': '🔙 Back to start',
-        'limit_reached': '⛔️ Daily limit reached!\n\n'
-                        '💎 Today\'s limit: {remaining}/{total}\n'
-                        '🔄 New limit tomorrow\n\n'
-                        '🎁 Invite friends for more limit!\n'
-                        '🔗 Your referral link:\n'
-                        '{ref_link}\n\n'
-                        '👥 +1 permanent limit for each friend!',
-        'referral_success': '🎉 Congratulations!\n\n'
-                           '{inviter} invited you and got +1 limit!\n\n'
-                           '💎 You can also invite friends!',
-        'referral_info': '👥 <b>Referral system:</b>\n\n'
-                        '💎 Your limit: {limit}\n'
-                        '📊 Invited: {count} people\n'
-                        '🔗 Referral link:\n'
-                        '{ref_link}\n\n'
-                        '🎁 +1 permanent limit for each friend!'
-    }
-}
+# ============ YORDAMCHI FUNKSIYALAR ============
+MEMBER_STATUSES = ('member', 'administrator', 'creator')
 
-# ============ DIZAYN SHABLONLARI ============
-DESIGNS = {
-    '1': {'name': 'Klassik Ko\'k', 'bg': (31, 78, 121), 'title': (255, 255, 255), 'text': (0, 0, 0)},
-    '2': {'name': 'Professional', 'bg': (68, 114, 196), 'title': (255, 255, 255), 'text': (0, 0, 0)},
-    '3': {'name': 'Zamonaviy', 'bg': (91, 155, 213), 'title': (255, 255, 255), 'text': (0, 0, 0)},
-    '4': {'name': 'Qizil energiya', 'bg': (192, 0, 0), 'title': (255, 255, 255), 'text': (0, 0, 0)},
-    '5': {'name': 'Yashil tabiat', 'bg': (0, 176, 80), 'title': (255, 255, 255), 'text': (0, 0, 0)}
-}
 
-# ============ YORDAMCHI FUNKSIYALAR ============
-async def check_subscription(user_id: int) -> bool:
-    """Foydalanuvchi obuna holatini tekshirish"""
+async def fetch_subscription(user_id: int) -> bool:
+    """Telegram API orqali obunani tekshirish"""
     try:
         member = await bot.get_chat_member(chat_id=REQUIRED_CHANNEL, user_id=user_id)
-        return member.status in ['member', 'administrator', 'creator']
-    except:
-        return False
+    except TelegramBadRequest as e:
+        # Foydalanuvchi kanalda topilmadi - obuna emas
+        if 'not found' in str(e).lower() or 'participant' in str(e).lower():
+            return False
+        raise
+    return member.status in MEMBER_STATUSES
 
-def get_text(lang: str, key: str) -> str:
-    """Tanlangan tildagi matnni olish"""
-    return TEXTS.get(lang, TEXTS['uz']).get(key, '')
-
-# ============ GEMINI AI ORQALI KONTENT OLISH ============
-async def generate_content_with_gemini(topic: str, pages: int, doc_type: str, lang: str) -> dict:
-    """Gemini AI yordamida kontent generatsiya qilish"""
-    
-    lang_map = {'uz': 'uzbek', 'ru': 'russian', 'en': 'english'}
-    lang_full = lang_map.get(lang, 'uzbek')
-    
-    if doc_type == 'presentation':
-        prompt = f"""Create a detailed presentation content in {lang_full} language about "{topic}".
-        
-Generate EXACTLY {pages} slides with the following structure:
-
-Return ONLY valid JSON (no markdown, no extra text) in this exact format:
-{{
-  "title": "Main presentation title",
-  "slides": [
-    {{
-      "title": "Slide 1 title",
-      "content": [
-        "First point about the topic",
-        "Second point with details",
-        "Third important point"
-      ]
-    }},
-    ... (continue for all {pages} slides)
-  ]
-}}
-
-Requirements:
-- Each slide must have 3-5 bullet points
-- Content must be informative and well-structured
-- Use {lang_full} language throughout
-- Make it educational and professional
-- RETURN ONLY JSON, NO OTHER TEXT"""
-
-    else:  # report or coursework
-        prompt = f"""Create a detailed {'report' if doc_type == 'report' else 'coursework'} in {lang_full} language about "{topic}".
-
-Generate content for approximately {pages} pages with the following structure:
-
-Return ONLY valid JSON (no markdown, no extra text) in this exact format:
-{{
-  "title": "Document title",
-  "introduction": "Detailed introduction (2-3 paragraphs)",
-  "sections": [
-    {{
-      "title": "Section 1 title",
-      "content": "Detailed content for this section (3-4 paragraphs)"
-    }},
-    {{
-      "title": "Section 2 title",
-      "content": "Detailed content for this section (3-4 paragraphs)"
-    }},
-    ... (continue with more sections)
-  ],
-  "conclusion": "Detailed conclusion (2-3 paragraphs)"
-}}
-
-Requirements:
-- Create enough sections to fill {pages} pages
-- Each section should have detailed, informative content
-- Use {lang_full} language throughout
-- Make it academic and well-researched
-- RETURN ONLY JSON, NO OTHER TEXT"""
 
+async def check_subscription(user_id: int) -> bool:
+    """Foydalanuvchi obuna holatini tekshirish (kesh orqali)"""
     try:
-        response = model.generate_content(prompt)
-        result_text = response.text.strip()
-        
-        # Agar markdown formatida kelsa, tozalash
-        if result_text.startswith('```'):
-            result_text = result_text.split('```')[1]
-            if result_text.startswith('json'):
-                result_text = result_text[4:]
-            result_text = result_text.strip()
-        
-        data = json.loads(result_text)
-        return data
-    except json.JSONDecodeError as e:
-        print(f"JSON parse error: {e}")
-        print(f"Response text: {result_text[:500]}")
-        raise Exception("AI javobini tahlil qilishda xatolik")
+        return await subscription_cache.check(user_id, fetch_subscription)
     except Exception as e:
-        print(f"Gemini error: {e}")
-        raise
-
-# ============ PPTX YARATISH ============
-def create_presentation(data: dict, design_id: str, output_path: str):
-    """PPTX taqdimot yaratish"""
-    prs = Presentation()
-    prs.slide_width = Inches(10)
-    prs.slide_height = Inches(7.5)
-    
-    design = DESIGNS[design_id]
-    bg_color = design['bg']
-    title_color = design['title']
-    text_color = design['text']
-    
-    # Birinchi slayd - sarlavha
-    slide = prs.slides.add_slide(prs.slide_layouts[6])
-    background = slide.background
-    fill = background.fill
-    fill.solid()
-    fill.fore_color.rgb = RGBColor(*bg_color)
-    
-    # Sarlavha
-    title_box = slide.shapes.add_textbox(Inches(1), Inches(3), Inches(8), Inches(1.5))
-    title_frame = title_box.text_frame
-    title_frame.text = data['title']
-    title_frame.paragraphs[0].font.size = Pt(44)
-    title_frame.paragraphs[0].font.bold = True
-    title_frame.paragraphs[0].font.color.rgb = RGBColor(*title_color)
-    title_frame.paragraphs[0].alignment = PP_ALIGN.CENTER
-    
-    # Qolgan slaydlar
-    for slide_data in data['slides']:
-        slide = prs.slides.add_slide(prs.slide_layouts[6])
-        background = slide.background
-        fill = background.fill
-        fill.solid()
-        fill.fore_color.rgb = RGBColor(255, 255, 255)
-        
-        # Sarlavha
-        title_box = slide.shapes.add_textbox(Inches(0.5), Inches(0.5), Inches(9), Inches(0.8))
-        title_frame = title_box.text_frame
-        title_frame.text = slide_data['title']
-        title_frame.paragraphs[0].font.size = Pt(32)
-        title_frame.paragraphs[0].font.bold = True
-        title_frame.paragraphs[0].font.color.rgb = RGBColor(*bg_color)
-        
-        # Kontent
-        content_box = slide.shapes.add_textbox(Inches(0.8), Inches(1.8), Inches(8.4), Inches(5))
-        text_frame = content_box.text_frame
-        text_frame.word_wrap = True
-        
-        for point in slide_data['content']:
-            p = text_frame.add_paragraph()
-            p.text = f"• {point}"
-            p.font.size = Pt(18)
-            p.font.color.rgb = RGBColor(*text_color)
-            p.space_before = Pt(12)
-            p.level = 0
-    
-    prs.save(output_path)
-
-# ============ WORD YARATISH ============
-def create_document(data: dict, output_path: str):
-    """Word hujjat yaratish"""
-    doc = Document()
-    
-    # Sarlavha
-    title = doc.add_heading(data['title'], 0)
-    title.alignment = 1  # Center
-    
-    # Kirish
-    doc.add_heading('Kirish', 1)
-    doc.add_paragraph(data['introduction'])
-    
-    # Bo'limlar
-    for section in data['sections']:
-        doc.add_heading(section['title'], 1)
-        doc.add_paragraph(section['content'])
-    
-    # Xulosa
-    doc.add_heading('Xulosa', 1)
-    doc.add_paragraph(data['conclusion'])
-    
-    doc.save(output_path)
+        print(f"Subscription check error for {user_id}: {e}")
+        return False
 
 # ============ HANDLERLAR ============
 @dp.message(Command("start"))
@@ -380,36 +120,41 @@ async def cmd_start(message: types.Message, state: FSMContext):
     first_name = message.from_user.first_name
     
     # Foydalanuvchini database'ga qo'shish yoki olish
-    db.create_user(user_id, username, first_name)
+    await db.create_user(user_id, username, first_name)
     
     # Referal tekshirish
     args = message.text.split()
     if len(args) > 1:
         try:
             referrer_id = int(args[1])
-            if referrer_id != user_id:
+            if 0 < referrer_id <= MAX_USER_ID and referrer_id != user_id:
                 # Yangi foydalanuvchi referral orqali kelgan
-                success = db.add_referral(referrer_id, user_id)
+                success = await db.add_referral(referrer_id, user_id)
                 
                 if success:
-                    # Taklif qilgan foydalanuvchiga xabar
+                    # Taklif qilgan foydalanuvchiga xabar (past ustuvorlik bilan)
                     try:
-                        referrer = db.get_user(referrer_id)
+                        referrer = await db.get_user(referrer_id)
                         ref_lang = referrer['language'] if referrer else 'uz'
                         
-                        await bot.send_message(
-                            referrer_id,
-                            f"🎉 Yangi foydalanuvchi sizning havolangiz orqali botga qo'shildi!\n\n"
-                            f"💎 Sizga +1 doimiy limit berildi!\n"
-                            f"📊 Jami limitingiz: {referrer['daily_limit'] + 1}"
-                        )
-                    except:
-                        pass
-        except:
+                        with send_priority(PRIORITY_LOW):
+                            await bot.send_message(
+                                referrer_id,
+                                f"🎉 Yangi foydalanuvchi sizning havolangiz orqali botga qo'shildi!\n\n"
+                                f"💎 Sizga +1 doimiy limit berildi!\n"
+                                f"📊 Jami limitingiz: {referrer['daily_limit']}"
+                            )
+                    except TelegramAPIError as e:
+                        print(f"Referral notification to {referrer_id} failed: {e}")
+        except ValueError:
+            # start parametri referal ID emas
             pass
+        except psycopg2.Error as e:
+            # Referal xatosi ro'yxatdan o'tishni to'xtatmasin
+            print(f"Referral {args[1]} -> {user_id} failed: {e}")
     
     # Limit ma'lumotlarini olish
-    remaining, total = db.get_daily_limit(user_id)
+    remaining, total = await db.get_daily_limit(user_id)
     
     keyboard = InlineKeyboardMarkup(inline_keyboard=[
         [InlineKeyboardButton(text="🇺🇿 O'zbek", callback_data="lang_uz")],
@@ -433,7 +178,7 @@ async def cmd_referral(message: types.Message, state: FSMContext):
     user_id = message.from_user.id
     
     # Get user from database
-    user = db.get_user(user_id)
+    user = await db.get_user(user_id)
     if not user:
         await message.answer("⚠️ Iltimos, avval /start ni bosing")
         return
@@ -441,7 +186,7 @@ async def cmd_referral(message: types.Message, state: FSMContext):
     lang = user['language']
     
     # Get referral count from database
-    ref_count = db.get_referral_count(user_id)
+    ref_count = await db.get_referral_count(user_id)
     bot_username = (await bot.me()).username
     ref_link = f"https://t.me/{bot_username}?start={user_id}"
     
@@ -453,6 +198,49 @@ async def cmd_referral(message: types.Message, state: FSMContext):
     
     await message.answer(text, parse_mode='HTML')
 
+@dp.message(Command("broadcast"))
+async def cmd_broadcast(message: types.Message):
+    """Admin: javob berilgan xabarni barcha foydalanuvchilarga yuborish"""
+    if not is_admin(message.from_user.id):
+        return
+    if not message.reply_to_message:
+        await message.answer("↩️ Yuboriladigan xabarga javob tariqasida /broadcast yozing")
+        return
+    
+    broadcast_id = await broadcasts.start(
+        message.from_user.id,
+        message.chat.id,
+        message.reply_to_message.message_id
+    )
+    await message.answer(
+        f"📣 Broadcast #{broadcast_id} navbatga qo'yildi\n"
+        f"To'xtatish: /broadcast_stop {broadcast_id}"
+    )
+
+@dp.message(Command("broadcast_stop"))
+async def cmd_broadcast_stop(message: types.Message):
+    """Admin: broadcast'ni to'xtatish"""
+    if not is_admin(message.from_user.id):
+        return
+    parts = message.text.split()
+    if len(parts) < 2 or not parts[1].isdigit():
+        await message.answer("Foydalanish: /broadcast_stop <id>")
+        return
+    
+    broadcast_id = int(parts[1])
+    if await broadcasts.stop(broadcast_id):
+        await message.answer(f"⏹ Broadcast #{broadcast_id} to'xtatilmoqda")
+    else:
+        await message.answer(f"⚠️ Broadcast #{broadcast_id} ishlamayapti")
+
+@dp.chat_member()
+async def on_channel_member_update(event: types.ChatMemberUpdated):
+    """Kanal a'zoligi o'zgarsa keshni yangilash (bot kanalda admin bo'lsa keladi)"""
+    if not event.chat.username or f"@{event.chat.username}".lower() != REQUIRED_CHANNEL.lower():
+        return
+    user_id = event.new_chat_member.user.id
+    subscription_cache.set(user_id, event.new_chat_member.status in MEMBER_STATUSES)
+
 @dp.callback_query(F.data.startswith("lang_"))
 async def process_language(callback: types.CallbackQuery, state: FSMContext):
     """Til tanlash"""
@@ -461,7 +249,7 @@ async def process_language(callback: types.CallbackQuery, state: FSMContext):
     
     # Update language in database
     user_id = callback.from_user.id
-    db.users.update_language(user_id, lang)
+    await db.update_language(user_id, lang)
     
     keyboard = InlineKeyboardMarkup(inline_keyboard=[
         [InlineKeyboardButton(text=get_text(lang, 'check_btn'), callback_data="check_sub")]
@@ -476,14 +264,14 @@ async def process_language(callback: types.CallbackQuery, state: FSMContext):
 async def check_sub(callback: types.CallbackQuery, state: FSMContext):
     """Obuna tekshirish"""
     user_id = callback.from_user.id
-    user = db.get_user(user_id)
+    user = await db.get_user(user_id)
     lang = user['language'] if user else 'uz'
     
     is_subscribed = await check_subscription(user_id)
     
     if is_subscribed:
         # Limit tekshirish
-        remaining, total = db.get_daily_limit(user_id)
+        remaining, total = await db.get_daily_limit(user_id)
         
         keyboard = InlineKeyboardMarkup(inline_keyboard=[
             [InlineKeyboardButton(text=get_text(lang, 'presentation'), callback_data="type_presentation")],
@@ -507,14 +295,14 @@ async def check_sub(callback: types.CallbackQuery, state: FSMContext):
 async def select_type(callback: types.CallbackQuery, state: FSMContext):
     """Hujjat turini tanlash"""
     user_id = callback.from_user.id
-    user = db.get_user(user_id)
+    user = await db.get_user(user_id)
     lang = user['language'] if user else 'uz'
     
     # Limit tekshirish
-    if not db.can_generate(user_id):
+    remaining, total = await db.get_daily_limit(user_id)
+    if remaining <= 0:
         bot_username = (await bot.me()).username
         ref_link = f"https://t.me/{bot_username}?start={user_id}"
-        remaining, total = db.get_daily_limit(user_id)
         
         text = get_text(lang, 'limit_reached').format(
             remaining=remaining,
@@ -538,7 +326,7 @@ async def enter_topic(message: types.Message, state: FSMContext):
     """Mavzu kiritish"""
     await state.update_data(topic=message.text)
     
-    user = db.get_user(message.from_user.id)
+    user = await db.get_user(message.from_user.id)
     lang = user['language'] if user else 'uz'
     
     await message.answer(get_text(lang, 'enter_pages'))
@@ -547,7 +335,7 @@ async def enter_topic(message: types.Message, state: FSMContext):
 @dp.message(BotStates.enter_pages)
 async def enter_pages(message: types.Message, state: FSMContext):
     """Sahifalar sonini kiritish"""
-    user = db.get_user(message.from_user.id)
+    user = await db.get_user(message.from_user.id)
     lang = user['language'] if user else 'uz'
     
     try:
@@ -577,7 +365,7 @@ async def enter_pages(message: types.Message, state: FSMContext):
         else:
             # To'g'ridan-to'g'ri tasdiqga o'tish
             await show_confirmation(message, state)
-            
+    
     except ValueError:
         await message.answer(get_text(lang, 'invalid_pages'))
 
@@ -592,7 +380,7 @@ async def select_design(callback: types.CallbackQuery, state: FSMContext):
 async def show_confirmation(message: types.Message, state: FSMContext):
     """Ma'lumotlarni tasdiqlash"""
     data = await state.get_data()
-    user = db.get_user(message.from_user.id if hasattr(message, 'from_user') else message.chat.id)
+    user = await db.get_user(message.from_user.id if hasattr(message, 'from_user') else message.chat.id)
     lang = user['language'] if user else 'uz'
     
     doc_type = data.get('doc_type')
@@ -629,7 +417,7 @@ async def confirm_yes(callback: types.CallbackQuery, state: FSMContext):
     """Tasdiqlash - hujjat yaratish"""
     data = await state.get_data()
     user_id = callback.from_user.id
-    user = db.get_user(user_id)
+    user = await db.get_user(user_id)
     lang = user['language'] if user else 'uz'
     
     doc_type = data.get('doc_type')
@@ -637,57 +425,40 @@ async def confirm_yes(callback: types.CallbackQuery, state: FSMContext):
     pages = data.get('pages')
     design = data.get('design')
     
-    await callback.message.edit_text(get_text(lang, 'generating'))
+    # Bir foydalanuvchi bir vaqtda cheklangan miqdorda generatsiya qila oladi
+    if await db.count_active_generations(user_id) >= AI_MAX_PER_USER:
+        await callback.answer(get_text(lang, 'busy'), show_alert=True)
+        return
     
-    # Create generation record in database
-    generation_id = db.generations.create_generation(user_id, doc_type, topic, pages, design)
+    # Limitni atomar band qilish (tekshirish + ishlatish bitta so'rovda)
+    allowed, remaining, total = await db.consume_generation(user_id)
+    if not allowed:
+        bot_username = (await bot.me()).username
+        ref_link = f"https://t.me/{bot_username}?start={user_id}"
+        text = get_text(lang, 'limit_reached').format(
+            remaining=remaining,
+            total=total,
+            ref_link=ref_link
+        )
+        await callback.message.edit_text(text, parse_mode='HTML')
+        await callback.answer()
+        return
+    
+    await callback.message.edit_text(get_text(lang, 'generating'))
     
+    # Vazifani navbatga qo'yish - worker bajaradi va natijani chatga yuboradi
     try:
-        # AI dan kontent olish
-        content = await generate_content_with_gemini(topic, pages, doc_type, lang)
-        
-        # Fayl yaratish
-        if doc_type == 'presentation':
-            filename = f"presentation_{user_id}_{generation_id}.pptx"
-            create_presentation(content, design, filename)
-        else:
-            filename = f"document_{user_id}_{generation_id}.docx"
-            create_document(content, filename)
-        
-        # Update generation status to completed
-        db.generations.update_status(generation_id, 'completed', filename)
-        
-        # Use generation (decrease limit)
-        db.use_generation(user_id)
-        
-        # Get updated limits
-        remaining, total = db.get_daily_limit(user_id)
-        
-        # Faylni yuborish
-        file = FSInputFile(filename)
-        await callback.message.answer_document(
-            document=file,
-            caption=get_text(lang, 'success').format(remaining=remaining, total=total)
+        generation_id = await db.enqueue_generation(
+            user_id, doc_type, topic, pages, design, lang,
+            callback.message.chat.id, callback.message.message_id
         )
-        
-        # Faylni o'chirish
-        if os.path.exists(filename):
-            os.remove(filename)
-        
-        # Boshiga qaytish tugmasi
-        keyboard = InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(text=get_text(lang, 'back_to_start'), callback_data="back_start")]
-        ])
-        await callback.message.answer("👍", reply_markup=keyboard)
-        
+        position = await db.generation_queue_position(generation_id)
+        if position > 1:
+            await callback.message.edit_text(get_text(lang, 'queued').format(position=position))
         await state.clear()
-        
     except Exception as e:
-        # Update generation status to failed
-        db.generations.update_status(generation_id, 'failed', error_message=str(e))
-        
-        error_text = get_text(lang, 'error').format(error=str(e))
-        await callback.message.answer(error_text)
+        await db.refund_generation(user_id)
+        await callback.message.answer(get_text(lang, 'error').format(error=str(e)))
         print(f"Xatolik yuz berdi: {e}")
         import traceback
         traceback.print_exc()
@@ -720,21 +491,65 @@ async def main():
     print(f"🤖 AI Model: Gemini Pro")
     print(f"💾 Database: SQLite (bot_data.db)")
     print("=" * 50)
-    
-    # Initialize database
-    try:
-        init_db()
-        print("✅ Database initialized successfully!")
-    except Exception as e:
-        print(f"⚠️ Database initialization warning: {e}")
+    startup = StartupReport(_started)
+    startup.mark("imports")
+    
+    # Render worker'lari birinchi bo'lib fork qilinadi (hali boshqa thread'lar yo'q)
+    # va fonda qiziydi - botning javob berishini kutdirmaydi
+    if EMBEDDED_WORKER:
+        render_ready = launch_render_pool()
+        if render_ready is not None:
+            startup.track("Render worker'lari", render_ready)
+        startup.mark("render pool launch")
+    
+    # Sxema: RUN_MIGRATIONS=0 bo'lsa deploy paytida `python migrations.py` bilan
+    if RUN_MIGRATIONS:
+        try:
+            init_db()
+        except Exception as e:
+            print(f"⚠️ Database initialization warning: {e}")
+        startup.mark("migrations")
+    
+    # Generatsiya worker'i (alohida jarayon: python worker.py)
+    worker = None
+    worker_task = None
+    if EMBEDDED_WORKER:
+        worker = GenerationWorker(bot)
+        worker_task = asyncio.create_task(worker.run())
+    
+    # Tashlab ketilgan FSM holatlarini tozalash
+    cleanup_task = None
+    if isinstance(storage, PostgresStorage):
+        cleanup_task = asyncio.create_task(storage.cleanup_loop())
+    
+    # To'xtab qolgan broadcast'larni davom ettirish
+    broadcast_task = asyncio.create_task(broadcasts.resume_loop())
+    metrics_task = asyncio.create_task(log_stats_loop())
+    startup.mark("background tasks")
+    startup.report()
     
     print("✅ Bot muvaffaqiyatli ishga tushdi!")
     print("💬 Xabarlarni kutmoqda...\n")
     
     try:
-        await dp.start_polling(bot, skip_updates=True)
+        if BOT_MODE == 'webhook':
+            from webhook import run_webhook
+            await run_webhook(dp, bot)
+        else:
+            await dp.start_polling(bot, skip_updates=True)
     except Exception as e:
         print(f"❌ Bot ishga tushirishda xatolik: {e}")
+    finally:
+        if cleanup_task:
+            cleanup_task.cancel()
+        broadcast_task.cancel()
+        metrics_task.cancel()
+        await broadcasts.shutdown()
+        if worker:
+            worker.stop()
+            await worker_task
+        shutdown_render_pool()
+        await db.close()
 
 if __name__ == "__main__":
     try:
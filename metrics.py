@@ -0,0 +1,44 @@
+"""
+Runtime metrics for Telegram Bot
+Collects counters from the AI layer, DB pool, send scheduler and caches
+"""
+
+import os
+import json
+import asyncio
+from typing import Dict
+
+from ai import ai_stats
+from database import get_async_db
+from sender import get_send_scheduler
+from cache import get_content_cache, get_file_cache, get_subscription_cache
+
+# ============ KONFIGURATSIYA ============
+# Metrikalarni logga yozish oralig'i (soniya); 0 - o'chirilgan
+METRICS_LOG_INTERVAL = float(os.getenv("METRICS_LOG_INTERVAL", "600"))
+
+
+def collect_stats() -> Dict:
+    """Jarayondagi barcha metrikalarni bitta lug'atga yig'ish"""
+    return {
+        'ai': ai_stats(),
+        'db_pool': get_async_db().db.pool_stats(),
+        'sender': get_send_scheduler().stats(),
+        'cache': {
+            'content': get_content_cache().stats(),
+            'files': get_file_cache().stats(),
+            'subscriptions': get_subscription_cache().stats(),
+        },
+    }
+
+
+async def log_stats_loop(interval: float = METRICS_LOG_INTERVAL):
+    """Metrikalarni vaqti-vaqti bilan logga chiqarish"""
+    if interval <= 0:
+        return
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            print(f"📈 Metrics: {json.dumps(collect_stats(), default=str)}")
+        except Exception as e:
+            print(f"Metrics error: {e}")
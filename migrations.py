@@ -0,0 +1,521 @@
+"""
+Schema migrations for Telegram Bot
+Versioned, applied once per database under an advisory lock
+"""
+
+import os
+import re
+import time
+from typing import List, Set
+
+from database import get_connection, JOB_WINDOW_DAYS
+
+# Barcha replikalar uchun bir xil kalit - bir vaqtda faqat bittasi migratsiya qiladi
+MIGRATION_LOCK_ID = int(os.environ.get('MIGRATION_LOCK_ID', '7263412001'))
+MIGRATION_LOCK_POLL = float(os.environ.get('MIGRATION_LOCK_POLL', '0.5'))
+# Lock egasi osilib qolsa, deploy cheksiz kutmasin (soniya)
+MIGRATION_LOCK_TIMEOUT = float(os.environ.get('MIGRATION_LOCK_TIMEOUT', '600'))
+
+CONCURRENT_INDEX = re.compile(
+    r'CREATE\s+(?:UNIQUE\s+)?INDEX\s+CONCURRENTLY\s+IF\s+NOT\s+EXISTS\s+(\w+)', re.IGNORECASE
+)
+
+
+class MigrationLockTimeout(Exception):
+    """Advisory lock MIGRATION_LOCK_TIMEOUT ichida bo'shamadi"""
+
+
+class Migration:
+    """Bitta sxema o'zgarishi
+    
+    transactional=False - har bir so'rov alohida (autocommit) bajariladi;
+    CREATE INDEX CONCURRENTLY tranzaksiya ichida ishlamaydi va jadvalni
+    yozishga bloklamaydi.
+    
+    manual=True - ishga tushishda qo'llanmaydi (uzoq bloklovchi o'zgarish);
+    faqat `python migrations.py --manual` bilan, texnik tanaffus paytida.
+    """
+    
+    def __init__(self, version: int, name: str, statements: List[str],
+                 transactional: bool = True, manual: bool = False):
+        self.version = version
+        self.name = name
+        self.statements = statements
+        self.transactional = transactional
+        self.manual = manual
+
+
+# Yangi o'zgarish = ro'yxat oxiriga yangi versiya. Qo'llanganlarini o'zgartirmang.
+# 1-7: ilgari init_db() har safar bajargan sxema (IF NOT EXISTS - mavjud bazalar uchun)
+MIGRATIONS = [
+    Migration(1, 'initial tables', [
+        '''
+        CREATE TABLE IF NOT EXISTS users (
+            user_id BIGINT PRIMARY KEY,
+            username TEXT,
+            first_name TEXT,
+            language TEXT DEFAULT 'uz',
+            daily_limit BIGINT DEFAULT 2,
+            used_today BIGINT DEFAULT 0,
+            last_reset DATE,
+            total_generations BIGINT DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS generations (
+            id BIGSERIAL PRIMARY KEY,
+            user_id BIGINT NOT NULL,
+            doc_type TEXT NOT NULL,
+            topic TEXT NOT NULL,
+            pages BIGINT NOT NULL,
+            design TEXT,
+            status TEXT DEFAULT 'pending',
+            file_path TEXT,
+            error_message TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            completed_at TIMESTAMP,
+            CONSTRAINT fk_user FOREIGN KEY (user_id) REFERENCES users (user_id)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS referrals (
+            id BIGSERIAL PRIMARY KEY,
+            referrer_id BIGINT NOT NULL,
+            referred_id BIGINT NOT NULL,
+            bonus_applied BOOLEAN DEFAULT FALSE,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            CONSTRAINT fk_referrer FOREIGN KEY (referrer_id) REFERENCES users (user_id),
+            CONSTRAINT fk_referred FOREIGN KEY (referred_id) REFERENCES users (user_id),
+            UNIQUE(referrer_id, referred_id)
+        )
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_generations_user_id ON generations(user_id)',
+        'CREATE INDEX IF NOT EXISTS idx_generations_created_at ON generations(created_at)',
+        'CREATE INDEX IF NOT EXISTS idx_referrals_referrer ON referrals(referrer_id)',
+    ]),
+    
+    Migration(2, 'generation queue and file cache columns', [
+        '''
+        ALTER TABLE generations
+        ADD COLUMN IF NOT EXISTS content_hash TEXT,
+        ADD COLUMN IF NOT EXISTS file_id TEXT,
+        ADD COLUMN IF NOT EXISTS lang TEXT,
+        ADD COLUMN IF NOT EXISTS chat_id BIGINT,
+        ADD COLUMN IF NOT EXISTS message_id BIGINT,
+        ADD COLUMN IF NOT EXISTS attempts INTEGER DEFAULT 0,
+        ADD COLUMN IF NOT EXISTS locked_by TEXT,
+        ADD COLUMN IF NOT EXISTS locked_at TIMESTAMP
+        ''',
+    ]),
+    
+    Migration(3, 'generation queue and file cache indexes', [
+        '''
+        CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_generations_content_hash
+        ON generations(content_hash)
+        WHERE file_id IS NOT NULL
+        ''',
+        '''
+        CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_generations_pending
+        ON generations(id)
+        WHERE status = 'pending'
+        ''',
+        '''
+        CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_generations_processing
+        ON generations(locked_at)
+        WHERE status = 'processing'
+        ''',
+    ], transactional=False),
+    
+    Migration(4, 'content cache', [
+        '''
+        CREATE TABLE IF NOT EXISTS content_cache (
+            cache_key TEXT PRIMARY KEY,
+            content JSONB NOT NULL,
+            hits BIGINT DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            expires_at TIMESTAMP NOT NULL
+        )
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_content_cache_expires_at ON content_cache(expires_at)',
+    ]),
+    
+    Migration(5, 'fsm states', [
+        '''
+        CREATE TABLE IF NOT EXISTS fsm_states (
+            storage_key TEXT PRIMARY KEY,
+            state TEXT,
+            data JSONB NOT NULL DEFAULT '{}',
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_fsm_states_updated_at ON fsm_states(updated_at)',
+    ]),
+    
+    Migration(6, 'webhook update deduplication', [
+        '''
+        CREATE TABLE IF NOT EXISTS processed_updates (
+            update_id BIGINT PRIMARY KEY,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+    ]),
+    
+    Migration(7, 'broadcasts', [
+        'ALTER TABLE users ADD COLUMN IF NOT EXISTS blocked_at TIMESTAMP',
+        '''
+        CREATE TABLE IF NOT EXISTS broadcasts (
+            id BIGSERIAL PRIMARY KEY,
+            admin_id BIGINT NOT NULL,
+            from_chat_id BIGINT NOT NULL,
+            message_id BIGINT NOT NULL,
+            status TEXT DEFAULT 'running',
+            last_user_id BIGINT DEFAULT 0,
+            sent BIGINT DEFAULT 0,
+            failed BIGINT DEFAULT 0,
+            blocked BIGINT DEFAULT 0,
+            locked_by TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            finished_at TIMESTAMP
+        )
+        ''',
+    ]),
+    
+    # So'rovlarga mos indekslar: get_user_generations, get_referrer, count_active.
+    # (user_id) va (referrer_id) indekslari yangi/UNIQUE indekslarning prefiksi - ortiqcha
+    Migration(8, 'access path indexes', [
+        '''
+        CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_generations_user_created
+        ON generations(user_id, created_at DESC)
+        ''',
+        'DROP INDEX CONCURRENTLY IF EXISTS idx_generations_user_id',
+        '''
+        CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_generations_user_active
+        ON generations(user_id)
+        WHERE status IN ('pending', 'processing')
+        ''',
+        'CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_referrals_referred ON referrals(referred_id)',
+        'DROP INDEX CONCURRENTLY IF EXISTS idx_referrals_referrer',
+    ], transactional=False),
+    
+    # Foydalanuvchi statistikasi - trigger bilan yangilanadigan hisoblagichlar (O(1) o'qish).
+    # CREATE TRIGGER yozuvlarni commit'gacha bloklaydi, shuning uchun backfill ikki
+    # marta hisoblamaydi. Hisoblagichlar umrbod: eski qatorlar arxivlansa ham kamaymaydi.
+    Migration(9, 'user generation counters', [
+        '''
+        CREATE TABLE IF NOT EXISTS user_generation_stats (
+            user_id BIGINT PRIMARY KEY,
+            total BIGINT NOT NULL DEFAULT 0,
+            completed BIGINT NOT NULL DEFAULT 0,
+            failed BIGINT NOT NULL DEFAULT 0
+        )
+        ''',
+        '''
+        CREATE OR REPLACE FUNCTION count_generation_status() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP = 'INSERT' THEN
+                INSERT INTO user_generation_stats AS s (user_id, total, completed, failed)
+                VALUES (NEW.user_id, 1,
+                        CASE WHEN NEW.status = 'completed' THEN 1 ELSE 0 END,
+                        CASE WHEN NEW.status = 'failed' THEN 1 ELSE 0 END)
+                ON CONFLICT (user_id) DO UPDATE
+                SET total = s.total + 1,
+                    completed = s.completed + EXCLUDED.completed,
+                    failed = s.failed + EXCLUDED.failed;
+            ELSIF NEW.status IS DISTINCT FROM OLD.status THEN
+                UPDATE user_generation_stats
+                SET completed = completed
+                        + CASE WHEN NEW.status = 'completed' THEN 1 ELSE 0 END
+                        - CASE WHEN OLD.status = 'completed' THEN 1 ELSE 0 END,
+                    failed = failed
+                        + CASE WHEN NEW.status = 'failed' THEN 1 ELSE 0 END
+                        - CASE WHEN OLD.status = 'failed' THEN 1 ELSE 0 END
+                WHERE user_id = NEW.user_id;
+            END IF;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+        ''',
+        'DROP TRIGGER IF EXISTS trg_generations_stats ON generations',
+        '''
+        CREATE TRIGGER trg_generations_stats
+        AFTER INSERT OR UPDATE OF status ON generations
+        FOR EACH ROW EXECUTE FUNCTION count_generation_status()
+        ''',
+        '''
+        INSERT INTO user_generation_stats (user_id, total, completed, failed)
+        SELECT user_id,
+               COUNT(*),
+               COUNT(*) FILTER (WHERE status = 'completed'),
+               COUNT(*) FILTER (WHERE status = 'failed')
+        FROM generations
+        GROUP BY user_id
+        ON CONFLICT (user_id) DO UPDATE
+        SET total = EXCLUDED.total,
+            completed = EXCLUDED.completed,
+            failed = EXCLUDED.failed
+        ''',
+    ]),
+    
+    # generations -> oylik RANGE bo'limlar (created_at). PK bo'lim kalitini o'z ichiga
+    # olishi shart: (id, created_at). Barcha qatorlar bitta tranzaksiyada ko'chiriladi -
+    # shu vaqt davomida generations'ga yozish va o'qish bloklanadi, shuning uchun
+    # manual: bot va worker'larni to'xtatib, `python migrations.py --manual`.
+    # Keyingi oylar bo'limlarini retention.py yaratadi; generations_default - zaxira.
+    Migration(10, 'monthly partitions for generations', [
+        '''
+        CREATE OR REPLACE FUNCTION create_generation_partition(month DATE) RETURNS TEXT AS $$
+        DECLARE
+            start_at DATE := date_trunc('month', month)::date;
+            name TEXT := 'generations_y' || to_char(start_at, 'YYYY') || 'm' || to_char(start_at, 'MM');
+        BEGIN
+            EXECUTE format(
+                'CREATE TABLE IF NOT EXISTS %I PARTITION OF generations FOR VALUES FROM (%L) TO (%L)',
+                name, start_at, (start_at + INTERVAL '1 month')::date
+            );
+            RETURN name;
+        END
+        $$ LANGUAGE plpgsql
+        ''',
+        'ALTER TABLE generations RENAME TO generations_legacy',
+        'ALTER INDEX generations_pkey RENAME TO generations_legacy_pkey',
+        # Ustunlar ro'yxati qo'lda yozilmaydi: bu migratsiya manual va keyingi
+        # migratsiyalardan keyin bajarilishi mumkin - ular qo'shgan ustunlar ham ko'chadi
+        '''
+        CREATE TABLE generations (
+            LIKE generations_legacy INCLUDING DEFAULTS INCLUDING CONSTRAINTS INCLUDING GENERATED
+        ) PARTITION BY RANGE (created_at)
+        ''',
+        "UPDATE generations_legacy SET created_at = COALESCE(completed_at, LOCALTIMESTAMP) WHERE created_at IS NULL",
+        'ALTER TABLE generations ALTER COLUMN created_at SET NOT NULL',
+        'ALTER TABLE generations ADD PRIMARY KEY (id, created_at)',
+        '''
+        ALTER TABLE generations
+        ADD CONSTRAINT fk_user FOREIGN KEY (user_id) REFERENCES users (user_id)
+        ''',
+        'ALTER SEQUENCE generations_id_seq OWNED BY generations.id',
+        'CREATE TABLE generations_default PARTITION OF generations DEFAULT',
+        '''
+        DO $$
+        DECLARE
+            month TIMESTAMP;
+        BEGIN
+            FOR month IN
+                SELECT generate_series(
+                    date_trunc('month', COALESCE(MIN(created_at), LOCALTIMESTAMP)),
+                    date_trunc('month', LOCALTIMESTAMP) + INTERVAL '2 months',
+                    INTERVAL '1 month'
+                )
+                FROM generations_legacy
+            LOOP
+                PERFORM create_generation_partition(month::date);
+            END LOOP;
+        END
+        $$
+        ''',
+        # LIKE ustunlar tartibini saqlaydi
+        'INSERT INTO generations SELECT * FROM generations_legacy',
+        'DROP TABLE generations_legacy',
+        # Bo'lim indekslari ma'lumot ko'chirilgandan keyin quriladi (tezroq)
+        'CREATE INDEX idx_generations_created_at ON generations(created_at)',
+        'CREATE INDEX idx_generations_user_created ON generations(user_id, created_at DESC)',
+        '''
+        CREATE INDEX idx_generations_user_active
+        ON generations(user_id)
+        WHERE status IN ('pending', 'processing')
+        ''',
+        '''
+        CREATE INDEX idx_generations_content_hash
+        ON generations(content_hash)
+        WHERE file_id IS NOT NULL
+        ''',
+        "CREATE INDEX idx_generations_pending ON generations(id) WHERE status = 'pending'",
+        "CREATE INDEX idx_generations_processing ON generations(locked_at) WHERE status = 'processing'",
+        # Trigger ko'chirishdan keyin - hisoblagichlar ikki marta oshmasin
+        '''
+        CREATE TRIGGER trg_generations_stats
+        AFTER INSERT OR UPDATE OF status ON generations
+        FOR EACH ROW EXECUTE FUNCTION count_generation_status()
+        ''',
+    ], manual=True),
+    
+    # Update lease: handler tugagach 'done'. Replika o'lsa lease tugaydi va
+    # Telegram qayta yuborgan update boshqa replikada ishlanadi
+    Migration(11, 'webhook update leases', [
+        '''
+        ALTER TABLE processed_updates
+        ADD COLUMN IF NOT EXISTS status TEXT NOT NULL DEFAULT 'done',
+        ADD COLUMN IF NOT EXISTS expires_at TIMESTAMP
+        ''',
+    ]),
+    
+    # Navbat so'rovlari faqat JOB_WINDOW_DAYS ichidagi qatorlarni ko'radi - undan eski
+    # pending/processing qatorlar abadiy osilib qolardi. Bir martalik tozalash;
+    # bundan keyin oynadan chiqayotganlarini reclaim_stale tugatadi
+    Migration(12, 'expire abandoned generation jobs', [
+        '''
+        UPDATE generations
+        SET status = 'failed', error_message = 'Abandoned before job queue'
+        WHERE status = 'pending' AND chat_id IS NULL
+        ''',
+        f'''
+        UPDATE generations
+        SET status = 'failed', error_message = 'Expired in queue', locked_by = NULL
+        WHERE status IN ('pending', 'processing')
+          AND created_at <= CURRENT_TIMESTAMP - {JOB_WINDOW_DAYS} * INTERVAL '1 day'
+        ''',
+    ]),
+]
+
+
+# ============ RUNNER ============
+
+def _applied_versions(cursor) -> Set[int]:
+    cursor.execute("SELECT to_regclass('schema_version') IS NOT NULL AS present")
+    if not cursor.fetchone()['present']:
+        return set()
+    cursor.execute('SELECT version FROM schema_version')
+    return {row['version'] for row in cursor.fetchall()}
+
+
+def _drop_invalid_index(cursor, name: str):
+    """Yarim qolgan CONCURRENTLY indeks (INVALID) bo'lsa, qayta qurish uchun o'chirish"""
+    cursor.execute('''
+        SELECT 1 FROM pg_index i
+        JOIN pg_class c ON c.oid = i.indexrelid
+        WHERE c.relname = %s AND NOT i.indisvalid
+    ''', (name,))
+    if cursor.fetchone():
+        print(f"♻️ Invalid index {name} qayta quriladi")
+        cursor.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {name}')
+
+
+def _acquire_lock(cursor):
+    """Advisory lock'ni so'rovlar orasida kutish
+    
+    pg_advisory_lock() da bloklanib turgan so'rov ochiq tranzaksiya
+    hisoblanadi va boshqa replikadagi CREATE INDEX CONCURRENTLY uni
+    kutadi - deadlock. Shuning uchun try + pauza.
+    
+    MIGRATION_LOCK_TIMEOUT soniyada olinmasa MigrationLockTimeout.
+    """
+    started = time.monotonic()
+    last_report = started
+    while True:
+        cursor.execute('SELECT pg_try_advisory_lock(%s) AS locked', (MIGRATION_LOCK_ID,))
+        if cursor.fetchone()['locked']:
+            return
+        
+        now = time.monotonic()
+        if now - started >= MIGRATION_LOCK_TIMEOUT:
+            raise MigrationLockTimeout(
+                f"Migration lock {MIGRATION_LOCK_ID} not released after {MIGRATION_LOCK_TIMEOUT:.0f}s; "
+                f"check pg_locks for the session holding it (locktype = 'advisory')"
+            )
+        if now - last_report >= 30:
+            last_report = now
+            print(f"⏳ Migration lock band: {now - started:.0f} s kutilmoqda")
+        time.sleep(MIGRATION_LOCK_POLL)
+
+
+def _apply(cursor, migration: Migration):
+    started = time.monotonic()
+    if migration.transactional:
+        cursor.execute('BEGIN')
+        try:
+            for statement in migration.statements:
+                cursor.execute(statement)
+        except Exception:
+            cursor.execute('ROLLBACK')
+            raise
+    else:
+        for statement in migration.statements:
+            match = CONCURRENT_INDEX.search(statement)
+            if match:
+                _drop_invalid_index(cursor, match.group(1))
+            cursor.execute(statement)
+        cursor.execute('BEGIN')
+    
+    duration_ms = int((time.monotonic() - started) * 1000)
+    cursor.execute('''
+        INSERT INTO schema_version (version, name, duration_ms)
+        VALUES (%s, %s, %s)
+    ''', (migration.version, migration.name, duration_ms))
+    cursor.execute('COMMIT')
+    print(f"✅ Migration {migration.version} ({migration.name}): {duration_ms} ms")
+
+
+def pending_migrations(applied: Set[int], include_manual: bool = False) -> List[Migration]:
+    return [
+        m for m in sorted(MIGRATIONS, key=lambda m: m.version)
+        if m.version not in applied and (include_manual or not m.manual)
+    ]
+
+
+def migrate(include_manual: bool = False) -> int:
+    """Qo'llanmagan migratsiyalarni bajarish; bajarilganlar sonini qaytaradi
+    
+    Hammasi qo'llangan bo'lsa - bitta SELECT, hech qanday lock yoki DDL yo'q.
+    Aks holda advisory lock olinadi: boshqa replikalar kutib turadi va
+    lock bo'shagach hech narsa qilmay chiqadi. Manual migratsiyalar faqat
+    include_manual=True bilan bajariladi.
+    """
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        if not pending_migrations(_applied_versions(cursor), include_manual):
+            return 0
+        
+        conn.commit()
+        conn.autocommit = True
+        try:
+            _acquire_lock(cursor)
+            try:
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS schema_version (
+                        version INTEGER PRIMARY KEY,
+                        name TEXT NOT NULL,
+                        duration_ms INTEGER,
+                        applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    )
+                ''')
+                # Lock kutilgan paytda boshqa replika qo'llagan bo'lishi mumkin
+                pending = pending_migrations(_applied_versions(cursor), include_manual)
+                for migration in pending:
+                    _apply(cursor, migration)
+                return len(pending)
+            finally:
+                cursor.execute('SELECT pg_advisory_unlock(%s)', (MIGRATION_LOCK_ID,))
+        finally:
+            conn.autocommit = False
+
+
+def schema_status() -> List[dict]:
+    """Har bir migratsiya va u qachon qo'llangani"""
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        applied = {}
+        if _applied_versions(cursor):
+            cursor.execute('SELECT version, applied_at FROM schema_version')
+            applied = {row['version']: row['applied_at'] for row in cursor.fetchall()}
+    return [
+        {'version': m.version, 'name': m.name, 'manual': m.manual,
+         'applied_at': applied.get(m.version)}
+        for m in sorted(MIGRATIONS, key=lambda m: m.version)
+    ]
+
+
+if __name__ == "__main__":
+    import sys
+    
+    count = migrate(include_manual='--manual' in sys.argv[1:])
+    print(f"Database ready! ({count} migration(s) applied)")
+    for row in schema_status():
+        if row['applied_at']:
+            mark = '✅'
+        else:
+            mark = '✋' if row['manual'] else '⏳'
+        print(f"{mark} {row['version']:>3} {row['name']}")
+    if any(row['manual'] and not row['applied_at'] for row in schema_status()):
+        print("✋ - manual: stop the bot and workers, then run python migrations.py --manual")
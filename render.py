@@ -0,0 +1,325 @@
+"""
+Rendering module for Telegram Bot
+Builds PPTX/DOCX files from AI content in a pool of warm worker processes
+"""
+
+import os
+import io
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import BinaryIO, Optional, Union
+
+from docx_writer import load_template, write_document
+
+# pptx/docx faqat render qiladigan joyda (worker jarayonlarida) yuklanadi -
+# bot jarayonining ishga tushishi sekinlashmasin
+
+# ============ KONFIGURATSIYA ============
+# 0 - pool ishlatilmaydi, render thread'da bajariladi
+RENDER_WORKERS = int(os.getenv("RENDER_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Word backend: stream (to'g'ridan-to'g'ri zip'ga) yoki python-docx
+DOCX_WRITER = os.getenv("DOCX_WRITER", "stream")
+
+# ============ DIZAYN SHABLONLARI ============
+DESIGNS = {
+    '1': {'name': 'Klassik Ko\'k', 'bg': (31, 78, 121), 'title': (255, 255, 255), 'text': (0, 0, 0)},
+    '2': {'name': 'Professional', 'bg': (68, 114, 196), 'title': (255, 255, 255), 'text': (0, 0, 0)},
+    '3': {'name': 'Zamonaviy', 'bg': (91, 155, 213), 'title': (255, 255, 255), 'text': (0, 0, 0)},
+    '4': {'name': 'Qizil energiya', 'bg': (192, 0, 0), 'title': (255, 255, 255), 'text': (0, 0, 0)},
+    '5': {'name': 'Yashil tabiat', 'bg': (0, 176, 80), 'title': (255, 255, 255), 'text': (0, 0, 0)}
+}
+
+# <id>.pptx shu papkada bo'lsa, dizayn shu fayldan olinadi (0-layout: sarlavha, 1-layout: kontent)
+DESIGN_TEMPLATE_DIR = os.getenv("DESIGN_TEMPLATE_DIR", "templates")
+
+TITLE_LAYOUT = 0
+CONTENT_LAYOUT = 1
+
+# design_id -> tayyor .pptx shablon baytlari
+_templates = {}
+
+
+def _style_placeholder(shape, left, top, width, height, size: int, color: tuple,
+                       bold: bool = False, align: str = None, space_before: int = None):
+    """Layout placeholder'i joylashuvi va matn uslubini bir marta belgilash"""
+    from pptx.dml.color import RGBColor
+    from pptx.oxml.ns import qn
+    from pptx.oxml.xmlchemy import OxmlElement
+    
+    shape.left, shape.top, shape.width, shape.height = left, top, width, height
+    shape.text_frame.word_wrap = True
+    
+    text_body = shape.text_frame._txBody
+    lst_style = text_body.find(qn('a:lstStyle'))
+    if lst_style is None:
+        lst_style = OxmlElement('a:lstStyle')
+        text_body.bodyPr.addnext(lst_style)
+    for child in list(lst_style):
+        lst_style.remove(child)
+    
+    level = OxmlElement('a:lvl1pPr')
+    level.set('marL', '0')
+    level.set('indent', '0')
+    if align:
+        level.set('algn', align)
+    if space_before is not None:
+        spacing = OxmlElement('a:spcBef')
+        points = OxmlElement('a:spcPts')
+        points.set('val', str(space_before * 100))
+        spacing.append(points)
+        level.append(spacing)
+    level.append(OxmlElement('a:buNone'))
+    
+    run_style = OxmlElement('a:defRPr')
+    run_style.set('sz', str(size * 100))
+    run_style.set('b', '1' if bold else '0')
+    fill = OxmlElement('a:solidFill')
+    rgb = OxmlElement('a:srgbClr')
+    rgb.set('val', str(RGBColor(*color)))
+    fill.append(rgb)
+    run_style.append(fill)
+    level.append(run_style)
+    
+    lst_style.append(level)
+
+
+def _build_template(design: dict):
+    """DESIGNS yozuvidan ikki layout'li shablon yasash"""
+    from pptx import Presentation
+    from pptx.util import Inches
+    from pptx.dml.color import RGBColor
+    
+    prs = Presentation()
+    prs.slide_width = Inches(10)
+    prs.slide_height = Inches(7.5)
+    
+    title_layout = prs.slide_layouts[TITLE_LAYOUT]
+    content_layout = prs.slide_layouts[CONTENT_LAYOUT]
+    
+    # Keraksiz layout'lar - har renderda o'qilmasin
+    for layout in list(prs.slide_layouts):
+        if layout not in (title_layout, content_layout):
+            prs.slide_layouts.remove(layout)
+    
+    # Sarlavha slaydi: rangli fon, markazda katta sarlavha
+    title_layout.background.fill.solid()
+    title_layout.background.fill.fore_color.rgb = RGBColor(*design['bg'])
+    for placeholder in list(title_layout.placeholders):
+        if placeholder.placeholder_format.idx != 0:
+            placeholder._element.getparent().remove(placeholder._element)
+    _style_placeholder(title_layout.placeholders[0],
+                       Inches(1), Inches(3), Inches(8), Inches(1.5),
+                       size=44, color=design['title'], bold=True, align='ctr')
+    
+    # Kontent slaydi: oq fon, dizayn rangidagi sarlavha va punktlar
+    content_layout.background.fill.solid()
+    content_layout.background.fill.fore_color.rgb = RGBColor(255, 255, 255)
+    _style_placeholder(content_layout.placeholders[0],
+                       Inches(0.5), Inches(0.5), Inches(9), Inches(0.8),
+                       size=32, color=design['bg'], bold=True, align='l')
+    _style_placeholder(content_layout.placeholders[1],
+                       Inches(0.8), Inches(1.8), Inches(8.4), Inches(5),
+                       size=18, color=design['text'], space_before=12)
+    
+    return prs
+
+
+def compile_design(design_id: str) -> bytes:
+    """Dizaynni .pptx shablon baytlariga aylantirish (bir marta)"""
+    template = _templates.get(design_id)
+    if template is None:
+        path = os.path.join(DESIGN_TEMPLATE_DIR, f"{design_id}.pptx")
+        if os.path.exists(path):
+            from pptx import Presentation
+            prs = Presentation(path)
+        else:
+            prs = _build_template(DESIGNS[design_id])
+        buffer = io.BytesIO()
+        prs.save(buffer)
+        template = _templates[design_id] = buffer.getvalue()
+    return template
+
+
+def compile_designs():
+    """Barcha dizaynlarni oldindan tayyorlash"""
+    for design_id in DESIGNS:
+        compile_design(design_id)
+
+
+# ============ PPTX YARATISH ============
+def _text_frame(slide, prs, body: bool):
+    """Sarlavha yoki matn joyi: placeholder turi bo'yicha, bo'lmasa matn qutisi
+    
+    DESIGN_TEMPLATE_DIR'dagi shablonlarda placeholder idx'lari 0/1 bo'lishi shart emas.
+    """
+    from pptx.enum.shapes import PP_PLACEHOLDER
+    
+    wanted = ((PP_PLACEHOLDER.BODY, PP_PLACEHOLDER.OBJECT) if body
+              else (PP_PLACEHOLDER.TITLE, PP_PLACEHOLDER.CENTER_TITLE))
+    for shape in slide.placeholders:
+        if shape.placeholder_format.type in wanted:
+            return shape.text_frame
+    
+    width, height = prs.slide_width, prs.slide_height
+    if body:
+        box = slide.shapes.add_textbox(width // 12, height // 4, width * 10 // 12, height * 2 // 3)
+    else:
+        box = slide.shapes.add_textbox(width // 12, height // 15, width * 10 // 12, height // 8)
+    box.text_frame.word_wrap = True
+    return box.text_frame
+
+
+def create_presentation(data: dict, design_id: str, output: Union[str, BinaryIO]):
+    """PPTX taqdimot yaratish (fayl yo'li yoki BytesIO'ga)"""
+    from pptx import Presentation
+    
+    # Fon, joylashuv va shriftlar shablonda - bu yerda faqat matn to'ldiriladi
+    prs = Presentation(io.BytesIO(compile_design(design_id)))
+    title_layout = prs.slide_layouts[TITLE_LAYOUT]
+    content_layout = prs.slide_layouts[CONTENT_LAYOUT]
+    
+    # Birinchi slayd - sarlavha
+    slide = prs.slides.add_slide(title_layout)
+    _text_frame(slide, prs, body=False).text = data['title']
+    
+    # Qolgan slaydlar
+    for slide_data in data['slides']:
+        slide = prs.slides.add_slide(content_layout)
+        _text_frame(slide, prs, body=False).text = slide_data['title']
+        
+        text_frame = _text_frame(slide, prs, body=True)
+        for i, point in enumerate(slide_data['content']):
+            p = text_frame.paragraphs[0] if i == 0 else text_frame.add_paragraph()
+            p.text = f"• {point}"
+    
+    prs.save(output)
+
+# ============ WORD YARATISH ============
+def create_document(data: dict, output: Union[str, BinaryIO]):
+    """Word hujjat yaratish (fayl yo'li yoki BytesIO'ga)"""
+    from docx import Document
+    
+    doc = Document()
+    
+    # Sarlavha
+    title = doc.add_heading(data['title'], 0)
+    title.alignment = 1  # Center
+    
+    # Kirish
+    doc.add_heading('Kirish', 1)
+    doc.add_paragraph(data['introduction'])
+    
+    # Bo'limlar
+    for section in data['sections']:
+        doc.add_heading(section['title'], 1)
+        doc.add_paragraph(section['content'])
+    
+    # Xulosa
+    doc.add_heading('Xulosa', 1)
+    doc.add_paragraph(data['conclusion'])
+    
+    doc.save(output)
+
+
+# ============ RENDER POOL ============
+
+def render_to_bytes(data: dict, doc_type: str, design_id: str = None) -> bytes:
+    """Hujjatni xotirada yaratib, fayl baytlarini qaytarish"""
+    buffer = io.BytesIO()
+    if doc_type == 'presentation':
+        create_presentation(data, design_id, buffer)
+    elif DOCX_WRITER == 'stream':
+        write_document(data, buffer)
+    else:
+        create_document(data, buffer)
+    return buffer.getvalue()
+
+
+def _warm_worker():
+    """Worker jarayonida og'ir kutubxonalarni va dizayn shablonlarini oldindan yuklash"""
+    compile_designs()
+    if DOCX_WRITER == 'stream':
+        load_template()
+    else:
+        from docx import Document
+        Document()
+
+
+def _ping() -> int:
+    return os.getpid()
+
+
+_executor = None
+
+def get_render_pool() -> ProcessPoolExecutor:
+    """Global render pool"""
+    global _executor
+    if _executor is None:
+        # fork: worker'lar render modulini qayta import qilmaydi va
+        # main.py'ning modul darajasidagi kodini ishga tushirmaydi
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context('fork' if 'fork' in methods else None)
+        _executor = ProcessPoolExecutor(
+            max_workers=RENDER_WORKERS,
+            mp_context=context,
+            initializer=_warm_worker
+        )
+    return _executor
+
+
+def launch_render_pool() -> Optional[asyncio.Future]:
+    """Worker'larni hozir ishga tushirish; ular qizigach tugaydigan future qaytaradi
+    
+    fork shu chaqiruv ichida bo'ladi, shuning uchun uni boshqa thread'lar
+    (DB executor) paydo bo'lishidan oldin chaqirish kerak. Shablonlar
+    va kutubxonalar worker'larning o'zida parallel yuklanadi.
+    """
+    if RENDER_WORKERS <= 0:
+        return None
+    loop = asyncio.get_running_loop()
+    pool = get_render_pool()
+    return asyncio.gather(*(loop.run_in_executor(pool, _ping) for _ in range(RENDER_WORKERS)))
+
+
+async def start_render_pool():
+    """Worker'larni ishga tushirib, ular tayyor bo'lishini kutish"""
+    ready = launch_render_pool()
+    if ready is not None:
+        await ready
+
+
+def shutdown_render_pool():
+    """Render pool'ni to'xtatish"""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=True, cancel_futures=True)
+        _executor = None
+
+
+def _replace_broken_pool(broken: ProcessPoolExecutor):
+    """Worker'i o'lgan (masalan, OOM) pool'ni tashlab yuborish - keyingisi yangidan yaratiladi
+    
+    Bir vaqtda bir nechta render xato olsa ham pool faqat bir marta almashtiriladi.
+    """
+    global _executor
+    if _executor is broken:
+        _executor = None
+        broken.shutdown(wait=False, cancel_futures=True)
+
+
+async def render(data: dict, doc_type: str, design_id: str = None) -> bytes:
+    """Event loop'ni bloklamasdan hujjat baytlarini olish"""
+    loop = asyncio.get_running_loop()
+    if RENDER_WORKERS <= 0:
+        return await loop.run_in_executor(None, render_to_bytes, data, doc_type, design_id)
+    
+    pool = get_render_pool()
+    try:
+        return await loop.run_in_executor(pool, render_to_bytes, data, doc_type, design_id)
+    except BrokenProcessPool:
+        # Pool BrokenProcessPool holatida qoladi - yangisini ochib, bir marta qayta urinish
+        print("⚠️ Render worker o'ldi, pool qayta yaratilmoqda")
+        _replace_broken_pool(pool)
+        return await loop.run_in_executor(get_render_pool(), render_to_bytes, data, doc_type, design_id)
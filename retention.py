@@ -0,0 +1,212 @@
+"""
+Partition maintenance for Telegram Bot
+Creates upcoming monthly generations partitions and archives expired ones to gzip files
+
+Bot jarayonlari buni ishga tushirmaydi - alohida vazifa sifatida (cron,
+Kubernetes CronJob) oyiga kamida bir marta: python retention.py
+"""
+
+import os
+import re
+import gzip
+from datetime import date
+from typing import Dict, List, Tuple
+
+from database import get_connection
+
+# ============ KONFIGURATSIYA ============
+# Shuncha oydan eski bo'limlar arxivlanib o'chiriladi (0 - o'chirilgan, standart)
+GENERATION_RETENTION_MONTHS = int(os.getenv("GENERATION_RETENTION_MONTHS", "0"))
+# Oldindan yaratiladigan kelgusi oylar
+PARTITION_PREMAKE_MONTHS = int(os.getenv("PARTITION_PREMAKE_MONTHS", "2"))
+# Arxiv papkasi - doimiy diskdagi absolyut yo'l; berilmasa hech narsa o'chirilmaydi
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR")
+# DETACH ota jadvalni qisqa vaqt bloklaydi - band bo'lsa keyingi safar
+RETENTION_LOCK_TIMEOUT = os.getenv("RETENTION_LOCK_TIMEOUT", "5s")
+
+RETENTION_LOCK_ID = int(os.getenv("RETENTION_LOCK_ID", "7263412002"))
+
+PARTITION_NAME = re.compile(r'^generations_y(\d{4})m(\d{2})$')
+
+
+def _add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def _partition_month(name: str) -> date:
+    match = PARTITION_NAME.match(name)
+    return date(int(match.group(1)), int(match.group(2)), 1) if match else None
+
+
+def is_partitioned(cursor) -> bool:
+    """generations bo'limlarga ajratilganmi (10-migratsiya qo'llanganmi)"""
+    cursor.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass('generations')")
+    row = cursor.fetchone()
+    return bool(row) and row['relkind'] == 'p'
+
+
+def _move_from_default(cursor, name: str, month: date):
+    """generations_default'dagi shu oy qatorlarini yangi bo'limga ko'chirib, uni ulash
+    
+    Bo'lim o'z vaqtida yaratilmagan bo'lsa (cron o'tkazib yuborilgan) qatorlar
+    default'ga tushadi va CREATE TABLE ... PARTITION OF xato beradi.
+    """
+    cursor.execute('BEGIN')
+    try:
+        cursor.execute('SET LOCAL lock_timeout = %s', (RETENTION_LOCK_TIMEOUT,))
+        # Ko'chirish davomida default'ga yangi qator tushmasin (o'qish mumkin)
+        cursor.execute('LOCK TABLE generations_default IN EXCLUSIVE MODE')
+        cursor.execute(f'''
+            CREATE TABLE {name}
+            (LIKE generations INCLUDING DEFAULTS INCLUDING CONSTRAINTS INCLUDING GENERATED)
+        ''')
+        cursor.execute(f'''
+            WITH moved AS (
+                DELETE FROM generations_default
+                WHERE created_at >= %s AND created_at < %s
+                RETURNING *
+            )
+            INSERT INTO {name} SELECT * FROM moved
+        ''', (month, _add_months(month, 1)))
+        moved = cursor.rowcount
+        cursor.execute(f'''
+            ALTER TABLE generations ATTACH PARTITION {name}
+            FOR VALUES FROM (%s) TO (%s)
+        ''', (month, _add_months(month, 1)))
+        cursor.execute('COMMIT')
+    except Exception:
+        cursor.execute('ROLLBACK')
+        raise
+    print(f"📦 {moved} ta qator generations_default'dan {name} ga ko'chirildi")
+
+
+def ensure_partition(cursor, month: date) -> str:
+    """Bitta oy bo'limini yaratish (bor bo'lsa - hech narsa qilmaydi)"""
+    name = f"generations_y{month:%Y}m{month:%m}"
+    cursor.execute('SELECT to_regclass(%s) IS NOT NULL AS present', (name,))
+    if cursor.fetchone()['present']:
+        return name
+    
+    cursor.execute('''
+        SELECT EXISTS (
+            SELECT 1 FROM generations_default WHERE created_at >= %s AND created_at < %s
+        ) AS stranded
+    ''', (month, _add_months(month, 1)))
+    if cursor.fetchone()['stranded']:
+        _move_from_default(cursor, name, month)
+        return name
+    
+    cursor.execute('SELECT create_generation_partition(%s) AS name', (month,))
+    return cursor.fetchone()['name']
+
+
+def ensure_partitions(cursor, months_ahead: int = PARTITION_PREMAKE_MONTHS) -> List[str]:
+    """Joriy va kelgusi oylar bo'limlarini yaratish
+    
+    Yaratib bo'lmagan oy (masalan, lock_timeout) logga yoziladi va o'tkazib
+    yuboriladi - keyingi ishga tushishda qayta uriniladi.
+    """
+    this_month = date.today().replace(day=1)
+    created = []
+    for offset in range(months_ahead + 1):
+        month = _add_months(this_month, offset)
+        try:
+            created.append(ensure_partition(cursor, month))
+        except Exception as e:
+            print(f"❌ generations {month:%Y-%m} bo'limi yaratilmadi: {e}")
+    return created
+
+
+def list_partitions(cursor) -> List[Tuple[str, bool]]:
+    """generations_yYYYYmMM jadvallari: (nom, hali ulanganmi)
+    
+    Ajratilgan, lekin arxivlanmay qolganlar (jarayon yiqilgan) ham qaytadi.
+    """
+    cursor.execute('''
+        SELECT c.relname AS name, c.relispartition AS attached
+        FROM pg_class c
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE n.nspname = current_schema()
+          AND c.relkind = 'r'
+          AND c.relname LIKE 'generations\\_y%'
+        ORDER BY c.relname
+    ''')
+    return [(row['name'], row['attached']) for row in cursor.fetchall()
+            if PARTITION_NAME.match(row['name'])]
+
+
+def archive_partition(cursor, name: str, attached: bool) -> str:
+    """Bo'limni ajratish, gzip CSV'ga yozish va o'chirish; arxiv yo'lini qaytaradi"""
+    if attached:
+        cursor.execute('BEGIN')
+        try:
+            cursor.execute('SET LOCAL lock_timeout = %s', (RETENTION_LOCK_TIMEOUT,))
+            cursor.execute(f'ALTER TABLE generations DETACH PARTITION {name}')
+            cursor.execute('COMMIT')
+        except Exception:
+            cursor.execute('ROLLBACK')
+            raise
+    
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+    path = os.path.join(ARCHIVE_DIR, f"{name}.csv.gz")
+    temp_path = path + '.tmp'
+    # COPY oqim bilan yoziladi - bo'lim hajmidan qat'i nazar xotira o'zgarmaydi
+    with gzip.open(temp_path, 'wb') as archive:
+        cursor.copy_expert(f'COPY {name} TO STDOUT WITH (FORMAT csv, HEADER)', archive)
+    with open(temp_path, 'rb') as archive:
+        os.fsync(archive.fileno())
+    os.replace(temp_path, path)
+    
+    cursor.execute(f'DROP TABLE {name}')
+    return path
+
+
+def run_retention(retention_months: int = GENERATION_RETENTION_MONTHS) -> Dict:
+    """Bo'limlarga xizmat: yangilarini yaratish, eskilarini arxivlash
+    
+    Bir vaqtda faqat bitta jarayon bajaradi (advisory lock); qolganlari
+    hech narsa qilmay qaytadi.
+    """
+    if retention_months > 0 and not (ARCHIVE_DIR and os.path.isabs(ARCHIVE_DIR)):
+        raise ValueError("GENERATION_RETENTION_MONTHS needs ARCHIVE_DIR set to an absolute path "
+                         "on persistent storage")
+    
+    result = {'created': [], 'archived': [], 'skipped': False, 'partitioned': True}
+    with get_connection() as conn:
+        conn.commit()
+        conn.autocommit = True
+        try:
+            cursor = conn.cursor()
+            cursor.execute('SELECT pg_try_advisory_lock(%s) AS locked', (RETENTION_LOCK_ID,))
+            if not cursor.fetchone()['locked']:
+                result['skipped'] = True
+                return result
+            try:
+                if not is_partitioned(cursor):
+                    result['partitioned'] = False
+                    return result
+                result['created'] = ensure_partitions(cursor)
+                if retention_months > 0:
+                    cutoff = _add_months(date.today().replace(day=1), -retention_months)
+                    for name, attached in list_partitions(cursor):
+                        if _partition_month(name) < cutoff:
+                            result['archived'].append(archive_partition(cursor, name, attached))
+            finally:
+                cursor.execute('SELECT pg_advisory_unlock(%s)', (RETENTION_LOCK_ID,))
+        finally:
+            conn.autocommit = False
+    return result
+
+
+if __name__ == "__main__":
+    # Cron uchun: python retention.py
+    result = run_retention()
+    if result['skipped']:
+        print("Another process is running retention")
+    elif not result['partitioned']:
+        print("generations is not partitioned yet: python migrations.py --manual")
+    else:
+        print(f"Partitions ready: {', '.join(result['created'])}")
+        for path in result['archived']:
+            print(f"Archived: {path}")
@@ -0,0 +1,229 @@
+"""
+Outbound message scheduler for Telegram Bot
+Rate-limits everything the bot sends so bursts do not end in 429 RetryAfter errors
+"""
+
+import os
+import time
+import heapq
+import asyncio
+import itertools
+import contextvars
+from collections import Counter
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import TelegramMethod
+from aiogram.methods.base import Response, TelegramType
+
+# ============ KONFIGURATSIYA ============
+# Telegram: ~30 xabar/soniya jami, 1 xabar/soniya bitta chatga, 20 xabar/daqiqa guruhga
+SEND_GLOBAL_RATE = float(os.getenv("SEND_GLOBAL_RATE", "25"))
+SEND_CHAT_RATE = float(os.getenv("SEND_CHAT_RATE", "1"))
+SEND_CHAT_BURST = int(os.getenv("SEND_CHAT_BURST", "3"))
+SEND_GROUP_RATE = float(os.getenv("SEND_GROUP_RATE", str(20 / 60)))
+SEND_MAX_RETRIES = int(os.getenv("SEND_MAX_RETRIES", "3"))
+
+# Ustuvorlik: kichik son - oldinroq
+PRIORITY_HIGH = 0       # tayyor fayllar
+PRIORITY_NORMAL = 1     # javoblar, tahrirlar
+PRIORITY_LOW = 2        # bildirishnomalar, broadcast
+
+PRIORITY_NAMES = {PRIORITY_HIGH: 'high', PRIORITY_NORMAL: 'normal', PRIORITY_LOW: 'low'}
+
+# Cheklanadigan metodlar (chatga biror narsa yuboradigan yoki o'zgartiradiganlar)
+RATE_LIMITED_PREFIXES = ('Send', 'Edit', 'Copy', 'Forward', 'Delete')
+
+_priority = contextvars.ContextVar('send_priority', default=None)
+
+
+@contextmanager
+def send_priority(level: int):
+    """Blok ichidagi yuborishlar ustuvorligini belgilash"""
+    token = _priority.set(level)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+class _ChatLimiter:
+    """Bitta chat uchun token bucket"""
+    
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated', 'paused_until')
+    
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+    
+    def delay(self) -> float:
+        """Token olish; kerak bo'lsa qancha kutish kerakligini qaytarish"""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        wait = 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+        return max(wait, self.paused_until - now)
+
+
+class SendScheduler(BaseRequestMiddleware):
+    """Bot session middleware: global va har bir chat bo'yicha limitlar, ustuvorlik, RetryAfter"""
+    
+    def __init__(self, global_rate: float = SEND_GLOBAL_RATE, chat_rate: float = SEND_CHAT_RATE,
+                 chat_burst: int = SEND_CHAT_BURST, group_rate: float = SEND_GROUP_RATE,
+                 max_retries: int = SEND_MAX_RETRIES):
+        self.interval = 1 / global_rate if global_rate > 0 else 0
+        self.chat_rate = chat_rate
+        self.chat_burst = max(1, chat_burst)
+        self.group_rate = group_rate
+        self.max_retries = max_retries
+        
+        self._chats: Dict[int, _ChatLimiter] = {}
+        self._heap = []
+        self._seq = itertools.count()
+        self._wakeup = None
+        self._dispatcher = None
+        self._next_slot = 0.0
+        self._paused_until = 0.0
+        
+        self.metrics = Counter()
+        self.delay_total = Counter()
+        self.delay_max = Counter()
+    
+    # ---------- limitlar ----------
+    
+    def _chat(self, chat_id) -> _ChatLimiter:
+        limiter = self._chats.get(chat_id)
+        if limiter is None:
+            if len(self._chats) > 100000:
+                self._prune()
+            is_group = isinstance(chat_id, str) or chat_id < 0
+            rate = self.group_rate if is_group else self.chat_rate
+            limiter = self._chats[chat_id] = _ChatLimiter(rate, 1 if is_group else self.chat_burst)
+        return limiter
+    
+    def _prune(self):
+        """Uzoq vaqt ishlatilmagan chat limiterlarini o'chirish"""
+        now = time.monotonic()
+        for chat_id, limiter in list(self._chats.items()):
+            if limiter.tokens >= limiter.capacity - 1 and now - limiter.updated > 60:
+                del self._chats[chat_id]
+    
+    async def _dispatch(self):
+        """Global token'larni ustuvorlik tartibida tarqatish"""
+        while True:
+            if not self._heap:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            
+            now = time.monotonic()
+            start = max(self._next_slot, self._paused_until)
+            if start > now:
+                await asyncio.sleep(start - now)
+                continue
+            
+            _, _, waiter = heapq.heappop(self._heap)
+            if waiter.done():
+                continue
+            waiter.set_result(None)
+            self._next_slot = max(now, self._next_slot) + self.interval
+    
+    async def _acquire_global(self, priority: int):
+        if self.interval <= 0:
+            return
+        if self._dispatcher is None or self._dispatcher.done():
+            self._wakeup = asyncio.Event()
+            self._dispatcher = asyncio.create_task(self._dispatch())
+        
+        waiter = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._heap, (priority, next(self._seq), waiter))
+        self._wakeup.set()
+        await waiter
+    
+    async def _acquire(self, chat_id, priority: int):
+        started = time.monotonic()
+        if chat_id is not None:
+            delay = self._chat(chat_id).delay()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        await self._acquire_global(priority)
+        
+        waited = time.monotonic() - started
+        name = PRIORITY_NAMES.get(priority, str(priority))
+        self.delay_total[name] += waited
+        self.delay_max[name] = max(self.delay_max[name], waited)
+    
+    # ---------- middleware ----------
+    
+    @staticmethod
+    def _default_priority(method: TelegramMethod) -> int:
+        name = type(method).__name__
+        if name in ('SendDocument', 'SendPhoto', 'SendVideo', 'SendAudio'):
+            return PRIORITY_HIGH
+        return PRIORITY_NORMAL
+    
+    async def __call__(self, make_request: NextRequestMiddlewareType[TelegramType],
+                       bot: Bot, method: TelegramMethod[TelegramType]) -> Response[TelegramType]:
+        if not type(method).__name__.startswith(RATE_LIMITED_PREFIXES):
+            return await make_request(bot, method)
+        
+        chat_id = getattr(method, 'chat_id', None)
+        priority = _priority.get()
+        if priority is None:
+            priority = self._default_priority(method)
+        name = PRIORITY_NAMES.get(priority, str(priority))
+        
+        attempt = 0
+        while True:
+            await self._acquire(chat_id, priority)
+            try:
+                response = await make_request(bot, method)
+                self.metrics[f'sent_{name}'] += 1
+                return response
+            except TelegramRetryAfter as e:
+                self.metrics['retry_after'] += 1
+                pause_until = time.monotonic() + e.retry_after
+                if chat_id is not None:
+                    limiter = self._chat(chat_id)
+                    limiter.paused_until = max(limiter.paused_until, pause_until)
+                else:
+                    self._paused_until = max(self._paused_until, pause_until)
+                if attempt >= self.max_retries:
+                    self.metrics['dropped'] += 1
+                    raise
+                attempt += 1
+                print(f"Telegram RetryAfter {e.retry_after}s for chat {chat_id} (attempt {attempt})")
+    
+    def stats(self) -> Dict:
+        depth = Counter(PRIORITY_NAMES.get(p, str(p)) for p, _, w in self._heap if not w.done())
+        return {
+            **self.metrics,
+            'queue_depth': dict(depth),
+            'delay_total': dict(self.delay_total),
+            'delay_max': dict(self.delay_max),
+            'tracked_chats': len(self._chats),
+        }
+
+
+_scheduler: Optional[SendScheduler] = None
+
+def get_send_scheduler() -> SendScheduler:
+    """Global send scheduler"""
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = SendScheduler()
+    return _scheduler
+
+
+def setup_sender(bot: Bot) -> SendScheduler:
+    """Bot'ning barcha chiquvchi so'rovlarini scheduler orqali o'tkazish"""
+    scheduler = get_send_scheduler()
+    bot.session.middleware(scheduler)
+    return scheduler
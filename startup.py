@@ -0,0 +1,43 @@
+"""
+Startup timing for Telegram Bot
+Measures how long each cold-start phase takes and prints a short report
+"""
+
+import time
+import asyncio
+from typing import List, Optional, Tuple
+
+
+class StartupReport:
+    """Ishga tushish bosqichlari vaqtini yig'ish"""
+    
+    def __init__(self, started: Optional[float] = None):
+        # started - jarayon boshida olingan time.perf_counter() (importlar ham hisoblanadi)
+        self.started = time.perf_counter() if started is None else started
+        self._last = self.started
+        self.phases: List[Tuple[str, float]] = []
+    
+    def mark(self, phase: str):
+        """Oldingi belgidan beri o'tgan vaqtni `phase` nomi bilan yozish"""
+        now = time.perf_counter()
+        self.phases.append((phase, now - self._last))
+        self._last = now
+    
+    def track(self, phase: str, future: asyncio.Future):
+        """Fonda tugaydigan bosqich: tugaganda boshidan beri o'tgan vaqtni chiqarish"""
+        def done(f: asyncio.Future):
+            elapsed = (time.perf_counter() - self.started) * 1000
+            if f.cancelled():
+                return
+            if f.exception() is not None:
+                print(f"⚠️ {phase} xatolik bilan tugadi ({elapsed:.0f} ms): {f.exception()}")
+            else:
+                print(f"⏱ {phase} tayyor: ishga tushgandan {elapsed:.0f} ms keyin")
+        future.add_done_callback(done)
+    
+    def report(self):
+        total = (self._last - self.started) * 1000
+        print(f"⏱ Ishga tushish: {total:.0f} ms")
+        width = max((len(name) for name, _ in self.phases), default=0)
+        for name, seconds in self.phases:
+            print(f"   {name.ljust(width, '.')}.. {seconds * 1000:7.0f} ms")
@@ -0,0 +1,107 @@
+"""
+FSM storage for Telegram Bot
+Keeps conversation state in PostgreSQL so it survives restarts and is shared by replicas
+"""
+
+import os
+import copy
+import asyncio
+from typing import Any, Dict, Mapping, Optional
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+
+from database import get_async_db
+from cache import TTLCache
+
+# ============ KONFIGURATSIYA ============
+# Write-through kesh muddati (soniya). Kesh boshqa replika yozganini ko'rmaydi -
+# faqat bitta jarayon (polling) yoki sticky load balancer bo'lsa yoqing
+FSM_CACHE_TTL = float(os.getenv("FSM_CACHE_TTL", "0"))
+FSM_CACHE_SIZE = int(os.getenv("FSM_CACHE_SIZE", "10000"))
+# Tashlab ketilgan holatlar shuncha vaqtdan keyin o'chiriladi
+FSM_STATE_TTL = int(os.getenv("FSM_STATE_TTL", str(7 * 24 * 3600)))
+FSM_CLEANUP_INTERVAL = float(os.getenv("FSM_CLEANUP_INTERVAL", "3600"))
+
+
+class PostgresStorage(BaseStorage):
+    """fsm_states jadvalidagi FSM storage: har bir chat uchun bitta ixcham qator"""
+    
+    def __init__(self, cache_ttl: float = FSM_CACHE_TTL, cache_size: int = FSM_CACHE_SIZE):
+        self._db = get_async_db()
+        self._cache = TTLCache(maxsize=cache_size, ttl=cache_ttl) if cache_ttl > 0 else None
+    
+    @staticmethod
+    def _key(key: StorageKey) -> str:
+        parts = [str(key.bot_id), str(key.chat_id), str(key.user_id)]
+        if key.thread_id:
+            parts.append(f"t{key.thread_id}")
+        if key.business_connection_id:
+            parts.append(f"b{key.business_connection_id}")
+        if key.destiny != 'default':
+            parts.append(key.destiny)
+        return ':'.join(parts)
+    
+    async def _load(self, storage_key: str) -> Dict[str, Any]:
+        if self._cache is not None:
+            record = self._cache.get(storage_key)
+            if record is not None:
+                return record
+        
+        record = await self._db.run(self._db.db.fsm.get, storage_key)
+        record = record or {'state': None, 'data': {}}
+        if self._cache is not None:
+            self._cache.set(storage_key, record)
+        return record
+    
+    def _remember(self, storage_key: str, field: str, value):
+        """Keshdagi yozuvning bitta maydonini yangilash (yozuv keshda bo'lsa)"""
+        if self._cache is None:
+            return
+        record = self._cache.pop(storage_key)
+        if record is not None:
+            self._cache.set(storage_key, {**record, field: value})
+    
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        # Faqat state ustuni yoziladi - parallel yozilgan data yo'qolmaydi
+        storage_key = self._key(key)
+        state = state.state if isinstance(state, State) else state
+        await self._db.run(self._db.db.fsm.set_state, storage_key, state)
+        self._remember(storage_key, 'state', state)
+    
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        record = await self._load(self._key(key))
+        return record['state']
+    
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        storage_key = self._key(key)
+        data = copy.deepcopy(data)
+        await self._db.run(self._db.db.fsm.set_data, storage_key, data)
+        self._remember(storage_key, 'data', data)
+    
+    async def update_data(self, key: StorageKey, data: Mapping[str, Any]) -> Dict[str, Any]:
+        # Bitta so'rovda birlashtiriladi - parallel update_data bir-birini o'chirmaydi
+        storage_key = self._key(key)
+        merged = await self._db.run(self._db.db.fsm.merge_data, storage_key, dict(data))
+        self._remember(storage_key, 'data', copy.deepcopy(merged))
+        return merged
+    
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        record = await self._load(self._key(key))
+        return copy.deepcopy(record['data'])
+    
+    async def cleanup_loop(self, older_than: int = FSM_STATE_TTL,
+                           interval: float = FSM_CLEANUP_INTERVAL):
+        """Tashlab ketilgan holatlarni vaqti-vaqti bilan o'chirish"""
+        while True:
+            try:
+                removed = await self._db.run(self._db.db.fsm.purge, older_than)
+                if removed:
+                    print(f"🧹 {removed} ta eski FSM holati o'chirildi")
+            except Exception as e:
+                print(f"FSM cleanup error: {e}")
+            await asyncio.sleep(interval)
+    
+    async def close(self) -> None:
+        if self._cache is not None:
+            self._cache.clear()
@@ -0,0 +1,351 @@
+"""Content parsing and chunked generation without calling Gemini"""
+
+import io
+import json
+import asyncio
+
+import pytest
+
+import ai
+import docx_writer
+
+
+class FakeGemini:
+    """Promptga qarab oldindan tayyorlangan javob qaytaradi"""
+    
+    def __init__(self, doc_type):
+        self.doc_type = doc_type
+    
+    async def generate(self, prompt: str) -> str:
+        if 'Create an outline' in prompt:
+            count = 16 if self.doc_type == 'presentation' else ai.count_sections(16)
+            return json.dumps({'title': 'Reja', 'items': [f"T{i}" for i in range(count)]})
+        if 'introduction and conclusion' in prompt:
+            return json.dumps({'introduction': 'Kirish', 'conclusion': 'Xulosa'})
+        titles = json.loads(prompt.split('in this order: ')[1].split('\n')[0])
+        if self.doc_type == 'presentation':
+            # Model punktlar o'rniga bitta string qaytardi
+            items = [{'title': t, 'content': f"{t} haqida"} for t in titles]
+            return json.dumps({'slides': items})
+        # Model matn o'rniga paragraflar ro'yxatini qaytardi
+        items = [{'title': t, 'content': [f"{t} 1", f"{t} 2"]} for t in titles]
+        return '```json\n' + json.dumps({'sections': items}) + '\n```'
+
+
+@pytest.mark.parametrize('doc_type', ['presentation', 'report'])
+def test_chunked_output_is_normalized_like_single_call(monkeypatch, doc_type):
+    monkeypatch.setattr(ai, 'gemini', FakeGemini(doc_type))
+    content, complete = asyncio.run(ai.generate_chunked('Mavzu', 16, doc_type, 'uz'))
+    
+    assert complete
+    if doc_type == 'presentation':
+        assert len(content['slides']) == 16
+        assert content['slides'][0] == {'title': 'T0', 'content': ['T0 haqida']}
+    else:
+        assert len(content['sections']) == ai.count_sections(16)
+        assert content['sections'][0] == {'title': 'T0', 'content': 'T0 1\n\nT0 2'}
+        assert content['introduction'] == 'Kirish' and content['conclusion'] == 'Xulosa'
+
+
+def test_chunked_report_renders_with_stream_writer(monkeypatch):
+    pytest.importorskip('docx')
+    monkeypatch.setattr(ai, 'gemini', FakeGemini('report'))
+    content, _ = asyncio.run(ai.generate_chunked('Mavzu', 16, 'report', 'uz'))
+    
+    output = io.BytesIO()
+    docx_writer.write_document(content, output)
+    assert output.getvalue()[:2] == b'PK'
+
+
+def _slides(count):
+    return [{'title': f"S{i}", 'content': ['a', 'b']} for i in range(count)]
+
+
+def test_parse_content_complete_only_for_clean_full_answers():
+    full = json.dumps({'title': 'T', 'slides': _slides(3)})
+    assert ai.parse_content(full, 'presentation', 3)[1]
+    assert ai.parse_content('Mana:\n```json\n' + full + '\n```', 'presentation', 3)[1]
+    
+    # Kam slayd
+    short = json.dumps({'title': 'T', 'slides': _slides(2)})
+    content, complete = ai.parse_content(short, 'presentation', 3)
+    assert len(content['slides']) == 2 and not complete
+    
+    # Uzilgan javob - tiklangan
+    content, complete = ai.parse_content(full[:-40], 'presentation', 2)
+    assert len(content['slides']) >= 2 and not complete
+    
+    # Yaroqsiz element tashlangan
+    broken = json.dumps({'title': 'T', 'slides': _slides(3) + [{'content': ['x']}]})
+    assert not ai.parse_content(broken, 'presentation', 3)[1]
+
+
+def test_parse_content_document_without_conclusion_is_partial():
+    data = {'title': 'T', 'introduction': 'Kirish',
+            'sections': [{'title': 'B', 'content': 'Matn'}], 'conclusion': 'Xulosa'}
+    assert ai.parse_content(json.dumps(data), 'report')[1]
+    data['conclusion'] = ''
+    assert not ai.parse_content(json.dumps(data), 'report')[1]
+
+
+def test_chunked_repaired_chunk_is_partial(monkeypatch):
+    fake = FakeGemini('presentation')
+    generate = fake.generate
+    
+    async def truncating(prompt):
+        text = await generate(prompt)
+        if 'T8' in prompt and 'Create an outline' not in prompt:
+            # Oxirgi punkt yozilayotganda uzilgan, lekin slaydlar soni to'g'ri
+            return text[:-4]
+        return text
+    
+    fake.generate = truncating
+    monkeypatch.setattr(ai, 'gemini', fake)
+    content, complete = asyncio.run(ai.generate_chunked('Mavzu', 16, 'presentation', 'uz'))
+    assert len(content['slides']) == 16
+    assert not complete
+
+
+# ============ extract_json ============
+
+@pytest.mark.parametrize('text, method', [
+    ('{"title": "T", "slides": []}', 'direct'),
+    ('Mana javob:\n```json\n{"title": "T", "slides": []}\n```\nOmad!', 'extracted'),
+    # Uzilgan string va ochiq massiv yopiladi
+    ('{"title": "T", "slides": [{"title": "A", "content": ["x", "y', 'repaired'),
+    # Qiymatsiz qolgan kalit olib tashlanadi
+    ('{"title": "T", "slides": [{"title": "A", "content": ["x"]}], "note":', 'repaired'),
+])
+def test_extract_json_paths(text, method):
+    data, used = ai._extract_json(text)
+    assert used == method
+    assert data['title'] == 'T'
+    assert ai.extract_json(text) == data
+
+
+def test_extract_json_repaired_keeps_partial_item():
+    data = ai.extract_json('{"title": "T", "slides": [{"title": "A", "content": ["x", "y')
+    assert data['slides'] == [{'title': 'A', 'content': ['x', 'y']}]
+
+
+def test_extract_json_truncates_to_last_complete_item():
+    # Yopib bo'lmaydigan joyda uzilgan: oxirgi to'liq slaydgacha kesiladi
+    text = '{"title": "T", "slides": [{"title": "A", "content": ["x"]}, {"title": "B", "content": [tr'
+    data, method = ai._extract_json(text)
+    assert method == 'truncated'
+    assert data == {'title': 'T', 'slides': [{'title': 'A', 'content': ['x']}]}
+
+
+def test_extract_json_keeps_brackets_inside_strings():
+    text = 'javob: {"title": "a } b ] {", "slides": ["\\"q\\" ["]} tamom'
+    data, method = ai._extract_json(text)
+    assert method == 'extracted'
+    assert data == {'title': 'a } b ] {', 'slides': ['"q" [']}
+
+
+@pytest.mark.parametrize('text', ['JSON yo\'q', '{tr', '[1, 2]'])
+def test_extract_json_failure_raises_parse_error(text):
+    with pytest.raises(ai.ParseError):
+        ai.extract_json(text)
+
+
+def test_extract_json_counts_parse_paths():
+    before = ai.parse_stats()
+    ai.extract_json('{"a": 1}')
+    with pytest.raises(ai.ParseError):
+        ai.extract_json('matn')
+    after = ai.parse_stats()
+    assert after['direct'] == before.get('direct', 0) + 1
+    assert after['failed'] == before.get('failed', 0) + 1
+
+
+# ============ StreamingArrayParser ============
+
+STREAMED = json.dumps({
+    'title': 'Mavzu {[',
+    'slides': [
+        {'title': 'A', 'content': ['x', 'qavs ] ichida', 'qo\'shtirnoq \\" va }']},
+        {'title': 'B', 'content': [['ichki', {'d': 1}]]},
+        {'title': 'C', 'content': []},
+    ],
+    'sections': [{'title': 'keyin', 'content': 'e\'tiborsiz'}],
+}, ensure_ascii=False)
+
+
+@pytest.mark.parametrize('size', [1, 3, 7, len(STREAMED)])
+def test_streaming_parser_matches_full_parse(size):
+    parser = ai.StreamingArrayParser('slides')
+    items = []
+    for i in range(0, len(STREAMED), size):
+        items.extend(parser.feed(STREAMED[i:i + size]))
+    assert items == json.loads(STREAMED)['slides']
+    assert parser.count == 3
+    assert parser.done
+
+
+def test_streaming_parser_yields_item_as_soon_as_it_closes():
+    parser = ai.StreamingArrayParser('sections')
+    assert parser.feed('```json\n{"sec') == []
+    assert parser.feed('tions": [{"title": "A", "content": "x"}') == [{'title': 'A', 'content': 'x'}]
+    assert parser.feed(', {"title": "B", "con') == []
+    assert not parser.done
+    assert parser.feed('tent": "y"}]}\n```') == [{'title': 'B', 'content': 'y'}]
+    assert parser.done
+    assert parser.feed('{"sections": [{"title": "C"}]}') == []
+
+
+def test_streaming_parser_without_key_yields_nothing():
+    parser = ai.StreamingArrayParser('slides')
+    assert parser.feed('{"title": "T", "items": [{"a": 1}]}') == []
+    assert parser.count == 0 and not parser.done
+
+
+# ============ TokenBucket / CircuitBreaker ============
+
+class FakeClock:
+    """ai.time o'rniga: vaqt faqat qo'lda suriladi"""
+    
+    def __init__(self):
+        self.now = 1000.0
+    
+    def monotonic(self):
+        return self.now
+
+
+def test_token_bucket_bursts_then_paces():
+    bucket = ai.TokenBucket(rate=50, capacity=3)
+    
+    async def take(n):
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        for _ in range(n):
+            await bucket.acquire()
+        return loop.time() - started
+    
+    assert asyncio.run(take(3)) < 0.015
+    assert bucket.waits == 0
+    # Keyingi 3 ta token 1/50 soniyadan kutiladi
+    assert asyncio.run(take(3)) >= 0.05
+    assert bucket.waits == 3
+    assert 0.05 <= bucket.wait_time <= 0.07
+
+
+def test_token_bucket_refill_is_capped(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(ai, 'time', clock)
+    bucket = ai.TokenBucket(rate=10, capacity=2)
+    
+    async def drain(n):
+        for _ in range(n):
+            await bucket.acquire()
+    
+    asyncio.run(drain(2))
+    clock.now += 60
+    # Bir daqiqa kutilsa ham faqat capacity ta token yig'iladi
+    asyncio.run(drain(2))
+    assert bucket.waits == 0
+    bucket._refill()
+    assert bucket._tokens == 0
+
+
+def test_token_bucket_zero_rate_is_unlimited():
+    bucket = ai.TokenBucket(rate=0, capacity=1)
+    
+    async def drain():
+        for _ in range(100):
+            await bucket.acquire()
+    
+    asyncio.run(drain())
+    assert bucket.waits == 0
+
+
+def test_circuit_breaker_opens_and_recovers(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(ai, 'time', clock)
+    breaker = ai.CircuitBreaker(threshold=3, reset_timeout=30)
+    
+    for _ in range(2):
+        assert breaker.allow()
+        breaker.record_failure()
+    assert breaker.state == 'closed'
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == 'open' and breaker.opens == 1
+    
+    assert not breaker.allow()
+    clock.now += 29
+    assert not breaker.allow()
+    assert breaker.rejected == 2
+    
+    # Reset vaqtidan keyin faqat bitta sinov so'rovi o'tadi
+    clock.now += 1
+    assert breaker.allow()
+    assert breaker.state == 'half_open'
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == 'closed' and breaker.failures == 0
+    assert breaker.allow()
+
+
+def test_circuit_breaker_failed_probe_reopens(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(ai, 'time', clock)
+    breaker = ai.CircuitBreaker(threshold=1, reset_timeout=10)
+    
+    breaker.record_failure()
+    clock.now += 10
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == 'open' and breaker.opens == 2
+    assert not breaker.allow()
+    
+    # Natijasiz tugagan sinov (masalan, foydalanuvchi xatosi) keyingisini to'smaydi
+    clock.now += 10
+    assert breaker.allow()
+    breaker.release()
+    assert breaker.allow()
+
+
+# ============ Bo'lak darajasidagi qayta urinish ============
+
+class CountingGemini:
+    """Har bir chaqiruvda navbatdagi javobni qaytaradi yoki xatoni ko'taradi"""
+    
+    def __init__(self, *replies):
+        self.replies = list(replies)
+        self.calls = 0
+    
+    async def generate(self, prompt: str) -> str:
+        self.calls += 1
+        reply = self.replies.pop(0) if len(self.replies) > 1 else self.replies[0]
+        if isinstance(reply, BaseException):
+            raise reply
+        return reply
+
+
+def _retry_chunk(monkeypatch, fake):
+    monkeypatch.setattr(ai, 'gemini', fake)
+    monkeypatch.setattr(ai, 'AI_CHUNK_RETRIES', 2)
+    check = lambda d: isinstance(d.get('items'), list)
+    return asyncio.run(ai._generate_with_retries('prompt', check, asyncio.Semaphore(1)))
+
+
+def test_chunk_retries_invalid_json_and_shape(monkeypatch):
+    fake = CountingGemini("javob yo'q", '{"title": "T"}', '{"items": ["a"]}')
+    data, clean_parse = _retry_chunk(monkeypatch, fake)
+    assert data == {'items': ['a']} and clean_parse
+    assert fake.calls == 3
+    
+    fake = CountingGemini('{"title": "T"}')
+    with pytest.raises(ai.ParseError):
+        _retry_chunk(monkeypatch, fake)
+    assert fake.calls == 3
+
+
+@pytest.mark.parametrize('error', [ConnectionError('503'), ai.CircuitOpen('ochiq'), ValueError('prompt')])
+def test_chunk_does_not_retry_upstream_errors(monkeypatch, error):
+    # GeminiClient.call o'zi qayta urinib bo'lgan - bo'lak qayta so'ramaydi
+    fake = CountingGemini(error, '{"items": ["a"]}')
+    with pytest.raises(type(error)):
+        _retry_chunk(monkeypatch, fake)
+    assert fake.calls == 1
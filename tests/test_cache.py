@@ -0,0 +1,67 @@
+"""In-process caches and cache keys"""
+
+import cache
+from cache import TTLCache, make_filename
+
+
+class FakeClock:
+    """cache.time o'rniga: vaqt faqat qo'lda suriladi"""
+    
+    def __init__(self):
+        self.now = 1000.0
+    
+    def monotonic(self):
+        return self.now
+
+
+def test_filename_depends_only_on_content():
+    content = {'title': "Sun'iy intellekt: kelajak / AI?"}
+    assert make_filename(content, 'presentation') == "Sun'iy_intellekt_kelajak_AI.pptx"
+    assert make_filename(content, 'report') == "Sun'iy_intellekt_kelajak_AI.docx"
+    assert make_filename({'title': ' .. '}, 'coursework') == 'document.docx'
+    assert make_filename({}, 'presentation') == 'presentation.pptx'
+    assert len(make_filename({'title': 'x' * 500}, 'report')) == 65
+
+
+def test_ttl_cache_expires_entries(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(cache, 'time', clock)
+    ttl = TTLCache(maxsize=10, ttl=5)
+    ttl.set('a', 1)
+    ttl.set('b', 2, ttl=60)
+    
+    clock.now += 5
+    assert ttl.get('a') == 1
+    clock.now += 0.1
+    assert ttl.get('a', 'yoq') == 'yoq'
+    assert 'a' not in ttl._data
+    assert ttl.get('b') == 2
+    assert (ttl.hits, ttl.misses) == (2, 1)
+
+
+def test_ttl_cache_evicts_least_recently_used():
+    ttl = TTLCache(maxsize=2, ttl=60)
+    ttl.set('a', 1)
+    ttl.set('b', 2)
+    assert ttl.get('a') == 1       # 'b' endi eng eski
+    ttl.set('c', 3)
+    assert ttl.get('b') is None
+    assert ttl.get('a') == 1 and ttl.get('c') == 3
+    
+    ttl.set('a', 10)               # qayta yozish ham yangilaydi
+    ttl.set('d', 4)
+    assert ttl.get('c') is None
+    assert len(ttl) == 2 and ttl.evictions == 2
+
+
+def test_ttl_cache_falsy_values_and_pop():
+    ttl = TTLCache(maxsize=5, ttl=60)
+    ttl.set('zero', 0)
+    ttl.set('none', None)
+    assert ttl.get('zero', 'yoq') == 0
+    assert ttl.get('none', 'yoq') is None
+    assert ttl.pop('zero') == 0
+    assert ttl.pop('zero', 'yoq') == 'yoq'
+    ttl.clear()
+    assert len(ttl) == 0
+    assert ttl.stats() == {'size': 0, 'maxsize': 5, 'hits': 2, 'misses': 0, 'evictions': 0}
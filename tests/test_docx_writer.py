@@ -0,0 +1,67 @@
+"""Streaming DOCX writer against python-docx create_document"""
+
+import io
+
+import pytest
+
+docx = pytest.importorskip('docx')
+
+from docx_writer import write_document
+from render import create_document
+
+
+def _read(writer, data):
+    output = io.BytesIO()
+    writer(data, output)
+    output.seek(0)
+    document = docx.Document(output)
+    return document, [(p.style.name, p.text, p.alignment) for p in document.paragraphs]
+
+
+def _data(**overrides):
+    data = {
+        'title': "Sun'iy intellekt <AI> & kelajak",
+        'introduction': 'Kirish matni\tjadval bilan',
+        'sections': [
+            {'title': '1. Tarix', 'content': 'Birinchi qator\nikkinchi qator'},
+            {'title': '2. "Hozir"', 'content': 'Oddiy matn'},
+        ],
+        'conclusion': 'Xulosa',
+    }
+    data.update(overrides)
+    return data
+
+
+def test_same_paragraphs_styles_and_text():
+    data = _data()
+    expected_doc, expected = _read(create_document, data)
+    actual_doc, actual = _read(write_document, data)
+    
+    assert actual == expected
+    assert actual[0] == ('Title', data['title'], 1)
+    
+    expected_section = expected_doc.sections[0]
+    actual_section = actual_doc.sections[0]
+    assert actual_section.page_width == expected_section.page_width
+    assert actual_section.page_height == expected_section.page_height
+    assert actual_section.left_margin == expected_section.left_margin
+
+
+def test_blank_lines_become_separate_paragraphs():
+    data = _data(sections=[{'title': 'B', 'content': 'Birinchi\n\n\nIkkinchi\n \nUchinchi'}])
+    _, expected = _read(create_document, data)
+    _, actual = _read(write_document, data)
+    
+    # create_document bitta paragraf ichida qator tashlaydi; stream yozuvchi
+    # uni alohida paragraflarga bo'ladi - matn va tartib bir xil
+    section = [t for _, t, _ in actual[4:7]]
+    assert section == ['Birinchi', 'Ikkinchi', 'Uchinchi']
+    assert expected[4][1].split() == ' '.join(section).split()
+    assert actual[:4] == expected[:4]
+    assert actual[7:] == expected[5:]
+
+
+def test_control_characters_are_dropped():
+    # python-docx bunday matnda xato beradi; stream yozuvchi ularni tashlaydi
+    _, actual = _read(write_document, _data(conclusion='Xulosa\x00\x0b tamom'))
+    assert actual[-1] == ('Normal', 'Xulosa tamom', None)
@@ -0,0 +1,188 @@
+"""Migration runner idempotence against an in-memory schema_version"""
+
+from contextlib import contextmanager
+
+import pytest
+
+import migrations
+from migrations import Migration
+
+
+class FakeCursor:
+    """Runner ishlatadigan so'rovlarni tushunadigan cursor; qolganlari yoziladi"""
+    
+    def __init__(self, db):
+        self.db = db
+        self._rows = []
+    
+    def execute(self, sql, params=None):
+        sql = ' '.join(sql.split())
+        self._rows = []
+        if sql.startswith("SELECT to_regclass('schema_version')"):
+            self._rows = [{'present': self.db.versions is not None}]
+        elif sql == 'SELECT version FROM schema_version':
+            self._rows = [{'version': v} for v in self.db.versions]
+        elif sql.startswith('SELECT pg_try_advisory_lock'):
+            self._rows = [{'locked': self.db.try_lock()}]
+        elif sql.startswith('SELECT pg_advisory_unlock'):
+            self.db.locked = False
+        elif sql.startswith('CREATE TABLE IF NOT EXISTS schema_version'):
+            if self.db.versions is None:
+                self.db.versions = set()
+        elif sql.startswith('INSERT INTO schema_version'):
+            self.db.pending_versions.add(params[0])
+        elif sql == 'BEGIN':
+            self.db.in_transaction = True
+            self.db.pending_versions, self.db.pending_ddl = set(), []
+        elif sql in ('COMMIT', 'ROLLBACK'):
+            if sql == 'COMMIT':
+                self.db.versions |= self.db.pending_versions
+                self.db.ddl += self.db.pending_ddl
+            self.db.in_transaction = False
+        elif sql.startswith('SELECT 1 FROM pg_index'):
+            pass
+        else:
+            if sql in self.db.fail_on:
+                self.db.fail_on.discard(sql)
+                raise RuntimeError(f"failed: {sql}")
+            # autocommit rejimida darhol, tranzaksiyada COMMIT'da
+            (self.db.pending_ddl if self.db.in_transaction else self.db.ddl).append(sql)
+    
+    def fetchone(self):
+        return self._rows[0] if self._rows else None
+    
+    def fetchall(self):
+        return self._rows
+
+
+class FakeConnection:
+    def __init__(self, db):
+        self.db = db
+        self.autocommit = False
+    
+    def cursor(self):
+        return FakeCursor(self.db)
+    
+    def commit(self):
+        pass
+
+
+class FakeDatabase:
+    def __init__(self):
+        self.versions = None          # schema_version jadvali yo'q
+        self.pending_versions = set()
+        self.pending_ddl = []
+        self.in_transaction = False
+        self.ddl = []
+        self.locked = False
+        self.lock_attempts = 0
+        self.fail_on = set()
+        self.on_lock_wait = None
+    
+    def try_lock(self):
+        self.lock_attempts += 1
+        if self.locked:
+            if self.on_lock_wait:
+                self.on_lock_wait()
+            return False
+        self.locked = True
+        return True
+    
+    @contextmanager
+    def connection(self):
+        yield FakeConnection(self)
+
+
+MIGRATIONS = [
+    Migration(2, 'ikkinchi', ['CREATE INDEX b']),
+    Migration(1, 'birinchi', ['CREATE TABLE a', 'ALTER TABLE a']),
+    Migration(3, 'qo\'lda', ['ALTER TABLE a SET LOGGED'], manual=True),
+    Migration(4, 'concurrent', ['CREATE INDEX CONCURRENTLY IF NOT EXISTS c ON a (x)'],
+              transactional=False),
+]
+
+
+APPLIED_DDL = [
+    'CREATE TABLE a', 'ALTER TABLE a', 'CREATE INDEX b',
+    'CREATE INDEX CONCURRENTLY IF NOT EXISTS c ON a (x)',
+]
+
+
+@pytest.fixture
+def db(monkeypatch):
+    database = FakeDatabase()
+    monkeypatch.setattr(migrations, 'get_connection', database.connection)
+    monkeypatch.setattr(migrations, 'MIGRATIONS', MIGRATIONS)
+    monkeypatch.setattr(migrations, 'MIGRATION_LOCK_POLL', 0)
+    return database
+
+
+def test_pending_migrations_are_ordered_and_skip_manual():
+    versions = [m.version for m in migrations.pending_migrations(set())]
+    assert versions == sorted(versions)
+    assert 10 not in versions
+    assert 10 in [m.version for m in migrations.pending_migrations(set(), include_manual=True)]
+    assert migrations.pending_migrations({m.version for m in migrations.MIGRATIONS}) == []
+
+
+def test_migrate_twice_applies_once(db):
+    assert migrations.migrate() == 3
+    assert db.versions == {1, 2, 4}
+    assert db.ddl == APPLIED_DDL
+    assert not db.locked
+    
+    attempts = db.lock_attempts
+    assert migrations.migrate() == 0
+    # Hammasi qo'llangan - lock ham olinmaydi
+    assert db.lock_attempts == attempts
+    assert db.ddl == APPLIED_DDL
+
+
+def test_manual_migration_only_on_request(db):
+    migrations.migrate()
+    assert migrations.migrate(include_manual=True) == 1
+    assert db.versions == {1, 2, 3, 4}
+    assert migrations.migrate(include_manual=True) == 0
+
+
+def test_waiting_replica_skips_what_the_other_applied(db):
+    db.versions = {1}
+    db.locked = True
+    
+    def other_replica_finishes():
+        # Lock egasi 2 va 4 ni qo'llab, lock'ni bo'shatdi
+        db.versions |= {2, 4}
+        db.locked = False
+    db.on_lock_wait = other_replica_finishes
+    
+    assert migrations.migrate() == 0
+    assert db.lock_attempts == 2
+    assert db.ddl == []
+    assert not db.locked
+
+
+def test_failed_migration_is_retried_on_next_run(db):
+    db.fail_on.add('CREATE INDEX b')
+    with pytest.raises(RuntimeError):
+        migrations.migrate()
+    assert db.versions == {1}
+    assert not db.locked
+    
+    assert migrations.migrate() == 2
+    assert db.versions == {1, 2, 4}
+    assert db.ddl == APPLIED_DDL
+
+
+def test_lock_wait_times_out(db, monkeypatch):
+    monkeypatch.setattr(migrations, 'MIGRATION_LOCK_TIMEOUT', 0.05)
+    monkeypatch.setattr(migrations, 'MIGRATION_LOCK_POLL', 0.01)
+    # Lock egasi osilib qolgan
+    db.versions = set()
+    db.locked = True
+    
+    with pytest.raises(migrations.MigrationLockTimeout):
+        migrations.migrate()
+    assert db.lock_attempts > 1
+    assert db.versions == set() and db.ddl == []
+    # Boshqa sessiyaning lock'i bo'shatilmaydi
+    assert db.locked
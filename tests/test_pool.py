@@ -0,0 +1,113 @@
+"""ConnectionPool without a database: connections are fakes"""
+
+import time
+import threading
+
+import pytest
+
+from database import ConnectionPool, PoolTimeout
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        return False
+    
+    def execute(self, query):
+        time.sleep(self.conn.ping_delay)
+        if self.conn.broken:
+            raise Exception("server closed the connection unexpectedly")
+
+
+class FakeConnection:
+    def __init__(self, ping_delay: float = 0, broken: bool = False):
+        self.ping_delay = ping_delay
+        self.broken = broken
+        self.closed = 0
+    
+    def cursor(self):
+        return FakeCursor(self)
+    
+    def rollback(self):
+        pass
+    
+    def close(self):
+        self.closed = 1
+
+
+class FakePool(ConnectionPool):
+    def __init__(self, **kwargs):
+        super().__init__('fake', **kwargs)
+        self.connected = []
+    
+    def _connect(self):
+        conn = FakeConnection()
+        self.connected.append(conn)
+        return conn
+    
+    def add_idle(self, conn, idle_for: float):
+        now = time.monotonic()
+        self._created[id(conn)] = now
+        self._idle.append((conn, now, now - idle_for))
+
+
+def test_slow_ping_does_not_block_other_checkouts():
+    pool = FakePool(max_size=2, ping_after=1)
+    fast = FakeConnection()
+    slow = FakeConnection(ping_delay=1.0)
+    pool.add_idle(fast, idle_for=0)
+    pool.add_idle(slow, idle_for=60)
+    
+    pinging = threading.Thread(target=pool.getconn)
+    pinging.start()
+    time.sleep(0.1)
+    
+    started = time.monotonic()
+    assert pool.getconn() is fast
+    assert time.monotonic() - started < 0.5
+    pinging.join()
+
+
+def test_broken_connection_is_replaced():
+    pool = FakePool(max_size=1, ping_after=1)
+    broken = FakeConnection(broken=True)
+    pool.add_idle(broken, idle_for=60)
+    
+    conn = pool.getconn()
+    assert conn is pool.connected[0]
+    assert broken.closed
+    assert pool.stats()['failed_checks'] == 1
+    assert pool.stats()['size'] == 1
+
+
+def test_recycled_and_returned_connections():
+    pool = FakePool(max_size=1, recycle=0.05)
+    conn = pool.getconn()
+    pool.putconn(conn)
+    assert pool.getconn() is conn
+    pool.putconn(conn)
+    
+    time.sleep(0.1)
+    fresh = pool.getconn()
+    assert fresh is not conn and conn.closed
+    assert pool.stats()['recycled'] == 1
+
+
+def test_checkout_times_out_when_exhausted():
+    pool = FakePool(max_size=1, timeout=0.1)
+    pool.getconn()
+    with pytest.raises(PoolTimeout):
+        pool.getconn()
+    assert pool.stats()['timeouts'] == 1
+
+
+def test_waiter_gets_returned_connection():
+    pool = FakePool(max_size=1, timeout=2)
+    conn = pool.getconn()
+    threading.Timer(0.1, pool.putconn, (conn,)).start()
+    assert pool.getconn() is conn
@@ -0,0 +1,71 @@
+"""Render pool recovery and custom design templates"""
+
+import io
+import os
+import signal
+import asyncio
+
+import pytest
+
+pptx = pytest.importorskip('pptx')
+
+import render
+
+DECK = {'title': 'Mavzu', 'slides': [{'title': 'A', 'content': ['birinchi', 'ikkinchi']}]}
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    monkeypatch.setattr(render, 'RENDER_WORKERS', 1)
+    yield
+    render.shutdown_render_pool()
+
+
+def test_render_survives_killed_worker(pool):
+    async def main():
+        await render.start_render_pool()
+        broken = render.get_render_pool()
+        pid = await asyncio.get_running_loop().run_in_executor(broken, render._ping)
+        
+        # OOM killer o'rniga
+        os.kill(pid, signal.SIGKILL)
+        await asyncio.sleep(0.2)
+        
+        output = await render.render(DECK, 'presentation', '1')
+        assert output[:2] == b'PK'
+        assert render.get_render_pool() is not broken
+        
+        # Yangi pool keyingi chaqiruvlarda ham ishlaydi
+        assert (await render.render(DECK, 'presentation', '1'))[:2] == b'PK'
+    
+    asyncio.run(main())
+
+
+# ============ Maxsus dizayn shablonlari ============
+
+def _custom_template(path, body_idx=None):
+    """Kontent layout'idagi matn joyi idx=body_idx bo'lgan (yoki umuman yo'q) shablon"""
+    prs = pptx.Presentation()
+    layout = prs.slide_layouts[render.CONTENT_LAYOUT]
+    body = layout.placeholders[1]
+    if body_idx is None:
+        body._element.getparent().remove(body._element)
+    else:
+        body._element.nvSpPr.nvPr.get_or_add_ph().set('idx', str(body_idx))
+    prs.save(str(path))
+
+
+@pytest.mark.parametrize('body_idx', [13, None])
+def test_custom_template_body_placeholder(tmp_path, monkeypatch, body_idx):
+    _custom_template(tmp_path / '9.pptx', body_idx)
+    monkeypatch.setattr(render, 'DESIGN_TEMPLATE_DIR', str(tmp_path))
+    monkeypatch.setattr(render, '_templates', {})
+    
+    output = io.BytesIO()
+    render.create_presentation(DECK, '9', output)
+    output.seek(0)
+    slides = list(pptx.Presentation(output).slides)
+    
+    assert slides[0].shapes.title.text == 'Mavzu'
+    texts = [shape.text_frame.text for shape in slides[1].shapes if shape.has_text_frame]
+    assert texts == ['A', '• birinchi\n• ikkinchi']
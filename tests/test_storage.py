@@ -0,0 +1,104 @@
+"""PostgresStorage shared by replicas, with an in-memory fsm table"""
+
+import asyncio
+import threading
+
+from aiogram.fsm.storage.base import StorageKey
+
+import storage
+from database import get_async_db
+
+
+class FakeFSM:
+    def __init__(self):
+        self.rows = {}
+        self._lock = threading.Lock()
+    
+    def get(self, storage_key):
+        with self._lock:
+            row = self.rows.get(storage_key)
+            return dict(row) if row else None
+    
+    def _upsert(self, storage_key, field, value):
+        with self._lock:
+            row = self.rows.setdefault(storage_key, {'state': None, 'data': {}})
+            row[field] = value
+            if row['state'] is None and not row['data']:
+                del self.rows[storage_key]
+    
+    def set_state(self, storage_key, state):
+        self._upsert(storage_key, 'state', state)
+    
+    def set_data(self, storage_key, data):
+        self._upsert(storage_key, 'data', data)
+    
+    def merge_data(self, storage_key, data):
+        with self._lock:
+            row = self.rows.setdefault(storage_key, {'state': None, 'data': {}})
+            row['data'] = {**row['data'], **data}
+            return dict(row['data'])
+
+
+KEY = StorageKey(bot_id=1, chat_id=42, user_id=42)
+KEY_ROW = storage.PostgresStorage._key(KEY)
+
+
+def test_replicas_see_each_others_state_by_default(monkeypatch):
+    monkeypatch.setattr(get_async_db().db, 'fsm', FakeFSM())
+    
+    async def main():
+        replica_a = storage.PostgresStorage()
+        replica_b = storage.PostgresStorage()
+        
+        await replica_a.set_state(KEY, 'Wizard:enter_topic')
+        assert await replica_b.get_state(KEY) == 'Wizard:enter_topic'
+        
+        await replica_a.set_state(KEY, 'Wizard:enter_pages')
+        await replica_a.update_data(KEY, {'topic': 'Python'})
+        assert await replica_b.get_state(KEY) == 'Wizard:enter_pages'
+        assert await replica_b.get_data(KEY) == {'topic': 'Python'}
+        
+        await replica_b.set_state(KEY, None)
+        await replica_b.set_data(KEY, {})
+        assert await replica_a.get_state(KEY) is None
+    
+    asyncio.run(main())
+
+
+def test_cached_data_is_not_shared_by_reference(monkeypatch):
+    monkeypatch.setattr(get_async_db().db, 'fsm', FakeFSM())
+    
+    async def main():
+        fsm = storage.PostgresStorage(cache_ttl=60)
+        await fsm.set_data(KEY, {'items': [1]})
+        data = await fsm.get_data(KEY)
+        data['items'].append(2)
+        assert await fsm.get_data(KEY) == {'items': [1]}
+    
+    asyncio.run(main())
+
+
+def test_concurrent_writes_keep_each_others_fields(monkeypatch):
+    fake = FakeFSM()
+    monkeypatch.setattr(get_async_db().db, 'fsm', fake)
+    
+    async def main():
+        replica_a = storage.PostgresStorage()
+        replica_b = storage.PostgresStorage()
+        await replica_a.set_state(KEY, 'Wizard:enter_pages')
+        
+        # Ikki marta bosilgan tugma: ikkala replika bir vaqtda yozadi
+        await asyncio.gather(
+            replica_a.update_data(KEY, {'topic': 'Python'}),
+            replica_b.update_data(KEY, {'pages': 10}),
+            replica_b.set_state(KEY, 'Wizard:select_design'),
+        )
+        assert await replica_a.get_state(KEY) == 'Wizard:select_design'
+        assert await replica_a.get_data(KEY) == {'topic': 'Python', 'pages': 10}
+        
+        await replica_a.set_data(KEY, {})
+        assert KEY_ROW in fake.rows
+        await replica_b.set_state(KEY, None)
+        assert fake.rows == {}
+    
+    asyncio.run(main())
@@ -0,0 +1,200 @@
+"""Webhook redelivery against a fake Telegram Bot API server"""
+
+import time
+import asyncio
+import threading
+
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+from aiogram import Bot, Dispatcher, F
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.types import Message
+
+import webhook
+
+TOKEN = '123456:TEST'
+
+
+class FakeUpdates:
+    """processed_updates jadvalining xotiradagi nusxasi (UpdateDB bilan bir xil qoidalar)"""
+    
+    def __init__(self):
+        self.rows = {}
+        self._lock = threading.Lock()
+    
+    def claim(self, update_id, lease):
+        with self._lock:
+            row = self.rows.get(update_id)
+            if row is None or (row['status'] == 'processing' and row['expires_at'] < time.monotonic()):
+                self.rows[update_id] = {'status': 'processing', 'expires_at': time.monotonic() + lease}
+                return 'claimed'
+            return 'done' if row['status'] == 'done' else 'busy'
+    
+    def complete(self, update_id):
+        with self._lock:
+            self.rows[update_id] = {'status': 'done', 'expires_at': None}
+    
+    def forget(self, update_id):
+        with self._lock:
+            if self.rows.get(update_id, {}).get('status') == 'processing':
+                del self.rows[update_id]
+
+
+def _update(update_id, text='salom'):
+    return {
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'date': int(time.time()),
+            'chat': {'id': 42, 'type': 'private'},
+            'from': {'id': 42, 'is_bot': False, 'first_name': 'Test'},
+            'text': text,
+        },
+    }
+
+
+async def _fake_telegram(sent):
+    """Bot API: yuborilgan xabarlarni yozib boradi"""
+    async def method(request):
+        payload = dict(await request.post()) or await request.json()
+        sent.append((request.match_info['method'], payload))
+        return web.json_response({'ok': True, 'result': {
+            'message_id': len(sent),
+            'date': int(time.time()),
+            'chat': {'id': 42, 'type': 'private'},
+            'text': payload.get('text', ''),
+        }})
+    
+    app = web.Application()
+    app.router.add_post('/bot{token}/{method}', method)
+    server = TestServer(app)
+    await server.start_server()
+    return server
+
+
+async def _replica(telegram, release=None):
+    """Bitta bot replikasi: webhook ilovasi va unga HTTP klient"""
+    session = AiohttpSession(api=TelegramAPIServer.from_base(str(telegram.make_url(''))))
+    bot = Bot(TOKEN, session=session)
+    dp = Dispatcher()
+    
+    @dp.message(F.text)
+    async def echo(message: Message):
+        if release is not None:
+            await release.wait()
+        await message.answer(f"echo: {message.text}")
+    
+    client = TestClient(TestServer(webhook.create_app(dp, bot)))
+    await client.start_server()
+    return client, dp, bot
+
+
+async def _stop(replica):
+    client, _, bot = replica
+    await client.close()
+    await bot.session.close()
+
+
+def _run(monkeypatch, scenario):
+    updates = FakeUpdates()
+    monkeypatch.setattr(webhook.db.db, 'updates', updates)
+    
+    async def main():
+        sent = []
+        telegram = await _fake_telegram(sent)
+        try:
+            await scenario(telegram, sent, updates)
+        finally:
+            await telegram.close()
+    
+    asyncio.run(main())
+
+
+def test_duplicate_delivery_is_handled_once(monkeypatch):
+    async def scenario(telegram, sent, updates):
+        replica = await _replica(telegram)
+        try:
+            for _ in range(2):
+                response = await replica[0].post(webhook.WEBHOOK_PATH, json=_update(1))
+                assert response.status == 200
+        finally:
+            await _stop(replica)
+        assert [method for method, _ in sent] == ['sendMessage']
+    
+    _run(monkeypatch, scenario)
+
+
+def test_redelivered_after_replica_is_stopped_mid_update(monkeypatch):
+    async def scenario(telegram, sent, updates):
+        # A replika handler ichida to'xtatiladi (deploy) - update yo'qolmasligi kerak
+        dying = await _replica(telegram, release=asyncio.Event())
+        _, dp, bot = dying
+        request = asyncio.create_task(dp.feed_webhook_update(bot, _update(2)))
+        await asyncio.sleep(0.2)
+        assert updates.rows[2]['status'] == 'processing'
+        request.cancel()
+        await asyncio.gather(request, return_exceptions=True)
+        # Lease bekor qilingan handler ichida (executor orqali) bo'shatiladi
+        for _ in range(50):
+            if 2 not in updates.rows:
+                break
+            await asyncio.sleep(0.02)
+        await _stop(dying)
+        assert 2 not in updates.rows
+        
+        replica = await _replica(telegram)
+        try:
+            response = await replica[0].post(webhook.WEBHOOK_PATH, json=_update(2))
+            assert response.status == 200
+        finally:
+            await _stop(replica)
+        assert [method for method, _ in sent] == ['sendMessage']
+        assert updates.rows[2]['status'] == 'done'
+    
+    _run(monkeypatch, scenario)
+
+
+def test_redelivered_after_killed_replica_lease_expires(monkeypatch):
+    monkeypatch.setattr(webhook, 'UPDATE_LEASE', 1)
+    
+    async def scenario(telegram, sent, updates):
+        # SIGKILL: lease qoladi, hech narsa uni bo'shatmaydi
+        updates.claim(3, 0.5)
+        
+        replica = await _replica(telegram)
+        try:
+            response = await replica[0].post(webhook.WEBHOOK_PATH, json=_update(3))
+            assert response.status == 500
+            assert sent == []
+            
+            await asyncio.sleep(0.6)
+            response = await replica[0].post(webhook.WEBHOOK_PATH, json=_update(3))
+            assert response.status == 200
+        finally:
+            await _stop(replica)
+        assert [method for method, _ in sent] == ['sendMessage']
+    
+    _run(monkeypatch, scenario)
+
+
+def test_healthz_reports_metrics(monkeypatch):
+    monkeypatch.setattr(webhook.db.db, 'pool_stats', lambda: {'size': 1})
+    
+    async def scenario(telegram, sent, updates):
+        replica = await _replica(telegram)
+        try:
+            for _ in range(2):
+                await replica[0].post(webhook.WEBHOOK_PATH, json=_update(4))
+            response = await replica[0].get('/healthz')
+            assert response.status == 200
+            body = await response.json()
+        finally:
+            await _stop(replica)
+        assert body['status'] == 'ok'
+        assert body['duplicates'] == 1
+        assert body['db_pool'] == {'size': 1}
+        assert {'ai', 'sender', 'cache'} <= set(body)
+        assert 'queue_depth' in body['sender']
+    
+    _run(monkeypatch, scenario)
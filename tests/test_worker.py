@@ -0,0 +1,91 @@
+"""Generation job bookkeeping after the document is delivered"""
+
+import asyncio
+from types import SimpleNamespace
+
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import SendMessage
+
+import worker
+
+CONTENT = {'title': 'Mavzu', 'slides': [{'title': 'A', 'content': ['x']}]}
+JOB = {'id': 7, 'user_id': 1, 'chat_id': 1, 'lang': 'uz', 'doc_type': 'presentation',
+       'topic': 'Mavzu', 'pages': 1, 'design': '1', 'message_id': None}
+
+
+class FakeDB:
+    def __init__(self, status_failures=0):
+        self.status_failures = status_failures
+        self.statuses = []
+        self.refunds = 0
+    
+    async def get_daily_limit(self, user_id):
+        return 2, 3
+    
+    async def update_generation_status(self, generation_id, status, *args, **kwargs):
+        if self.status_failures:
+            self.status_failures -= 1
+            raise ConnectionError("server closed the connection unexpectedly")
+        self.statuses.append(status)
+    
+    async def refund_generation(self, user_id):
+        self.refunds += 1
+
+
+class FakeBot:
+    def __init__(self, message_error=None):
+        self.documents = []
+        self.messages = []
+        self.message_error = message_error
+    
+    async def send_document(self, chat_id, document, caption=None):
+        self.documents.append(document)
+        return SimpleNamespace(document=SimpleNamespace(file_id='file-1'))
+    
+    async def send_message(self, chat_id, text, **kwargs):
+        if self.message_error:
+            raise self.message_error
+        self.messages.append(text)
+
+
+class FakeCache:
+    def __init__(self, value=None):
+        self.value = value
+    
+    async def get(self, *args):
+        return self.value
+    
+    async def set(self, *args):
+        pass
+
+
+def _run_job(monkeypatch, db, bot):
+    async def fake_render(content, doc_type, design):
+        return b'PK'
+    
+    monkeypatch.setattr(worker, 'db', db)
+    monkeypatch.setattr(worker, 'get_content_cache', lambda: FakeCache(CONTENT))
+    monkeypatch.setattr(worker, 'get_file_cache', FakeCache)
+    monkeypatch.setattr(worker, 'render', fake_render)
+    monkeypatch.setattr(worker, 'COMPLETE_ATTEMPTS', 1)
+    asyncio.run(worker.run_job(bot, dict(JOB)))
+
+
+def test_delivered_document_is_never_failed_or_refunded(monkeypatch):
+    retry_after = TelegramRetryAfter(SendMessage(chat_id=1, text='👍'), 'Too Many Requests', 5)
+    db = FakeDB(status_failures=1)
+    bot = FakeBot(message_error=retry_after)
+    _run_job(monkeypatch, db, bot)
+    
+    assert len(bot.documents) == 1
+    assert db.statuses == [] and db.refunds == 0
+    assert bot.messages == []
+
+
+def test_completed_after_delivery(monkeypatch):
+    db = FakeDB()
+    bot = FakeBot()
+    _run_job(monkeypatch, db, bot)
+    
+    assert db.statuses == ['completed'] and db.refunds == 0
+    assert bot.messages == ['👍']
@@ -0,0 +1,157 @@
+"""
+Translations for Telegram Bot
+Shared by the bot process and the generation workers
+"""
+
+# ============ TARJIMALAR ============
+TEXTS = {
+    'uz': {
+        'welcome': '👋 Assalomu alaykum!\n\n📊 Taqdimot va 📝 Referat/Mustaqil ish tayyorlash botiga xush kelibsiz!\n\n💎 Kunlik limit: {remaining}/{total}\n\nTilni tanlang:',
+        'select_lang': 'Tilni tanlang:',
+        'subscription_required': '📢 Botdan foydalanish uchun kanalga obuna bo\'ling:\n\n{channel}\n\n✅ Obuna bo\'lgach "Tasdiqlash" tugmasini bosing',
+        'check_btn': '✅ Obuna tekshirish',
+        'not_subscribed': '❌ Siz hali obuna bo\'lmadingiz!\n\nIltimos, avval kanalga obuna bo\'ling: {channel}',
+        'select_type': '📝 Qaysi turdagi hujjat kerak?\n\n💎 Bugungi limit: {remaining}/{total}',
+        'presentation': '📊 Taqdimot (PPTX)',
+        'report': '📝 Referat',
+        'coursework': '📚 Mustaqil ish',
+        'enter_topic': '✏️ Mavzuni kiriting:',
+        'enter_pages': '📄 Nechta sahifa kerak? (3-50 oralig\'ida)',
+        'invalid_pages': '❌ Noto\'g\'ri son! 3 dan 50 gacha son kiriting.',
+        'select_design': '🎨 Dizayn shablonini tanlang:',
+        'confirm_data': '📋 <b>Kiritilgan ma\'lumotlar:</b>\n\n'
+                       '🎯 Tur: {doc_type}\n'
+                       '📖 Mavzu: {topic}\n'
+                       '📄 Sahifalar: {pages}\n'
+                       '{design}'
+                       '\n✅ Davom etamizmi?',
+        'confirm_yes': '✅ Ha, davom etish',
+        'confirm_no': '❌ Yo\'q, qaytadan',
+        'generating': '⏳ Tayyorlanmoqda... Iltimos kuting...\n\n📊 Bu 30-60 soniya vaqt olishi mumkin.',
+        'queued': '⏳ Navbatdasiz: {position}-o\'rin\n\nIltimos kuting, navbatingiz kelishi bilan tayyorlash boshlanadi.',
+        'busy': '⏳ Sizning oldingi so\'rovingiz hali tayyorlanmoqda. Iltimos, u tugashini kuting.',
+        'progress_slides': '⏳ Tayyorlanmoqda...\n\n📊 Slayd {done}/{total} tayyor',
+        'progress_sections': '⏳ Tayyorlanmoqda...\n\n📝 {done}-bo\'lim tayyor',
+        'ai_unavailable': '⚠️ AI xizmati hozir vaqtincha ishlamayapti.\n\n🔄 Iltimos, bir necha daqiqadan so\'ng qaytadan urinib ko\'ring. Limitingiz saqlanib qoldi.',
+        'success': '✅ Tayyor! Marhamat:\n\n💎 Qolgan limit: {remaining}/{total}',
+        'error': '❌ Xatolik yuz berdi. Iltimos qaytadan urinib ko\'ring.\n\nXatolik: {error}',
+        'back_to_start': '🔙 Boshiga qaytish',
+        'limit_reached': '⛔️ Kunlik limitingiz tugadi!\n\n'
+                        '💎 Bugungi limit: {remaining}/{total}\n'
+                        '🔄 Ertaga yangi limit beriladi\n\n'
+                        '🎁 Ko\'proq limit olish uchun do\'stlaringizni taklif qiling!\n'
+                        '🔗 Sizning referal havolangiz:\n'
+                        '{ref_link}\n\n'
+                        '👥 Har bir do\'stingiz uchun +1 doimiy limit!',
+        'referral_success': '🎉 Tabriklaymiz!\n\n'
+                           '{inviter} sizni taklif qildi va +1 limit oldi!\n\n'
+                           '💎 Siz ham do\'stlaringizni taklif qilib limitingizni oshiring!',
+        'referral_info': '👥 <b>Referal tizimi:</b>\n\n'
+                        '💎 Sizning limitingiz: {limit}\n'
+                        '📊 Taklif qilganlar: {count} ta\n'
+                        '🔗 Referal havolangiz:\n'
+                        '{ref_link}\n\n'
+                        '🎁 Har bir do\'st uchun +1 doimiy limit!'
+    },
+    'ru': {
+        'welcome': '👋 Здравствуйте!\n\n📊 Добро пожаловать в бот для создания презентаций и 📝 рефератов/курсовых работ!\n\n💎 Дневной лимит: {remaining}/{total}\n\nВыберите язык:',
+        'select_lang': 'Выберите язык:',
+        'subscription_required': '📢 Для использования бота подпишитесь на канал:\n\n{channel}\n\n✅ После подписки нажмите "Проверить"',
+        'check_btn': '✅ Проверить подписку',
+        'not_subscribed': '❌ Вы еще не подписались!\n\nПожалуйста, сначала подпишитесь на канал: {channel}',
+        'select_type': '📝 Какой тип документа нужен?\n\n💎 Сегодняшний лимит: {remaining}/{total}',
+        'presentation': '📊 Презентация (PPTX)',
+        'report': '📝 Реферат',
+        'coursework': '📚 Курсовая работа',
+        'enter_topic': '✏️ Введите тему:',
+        'enter_pages': '📄 Сколько страниц? (от 3 до 50)',
+        'invalid_pages': '❌ Неверное число! Введите от 3 до 50.',
+        'select_design': '🎨 Выберите дизайн шаблона:',
+        'confirm_data': '📋 <b>Введенные данные:</b>\n\n'
+                       '🎯 Тип: {doc_type}\n'
+                       '📖 Тема: {topic}\n'
+                       '📄 Страниц: {pages}\n'
+                       '{design}'
+                       '\n✅ Продолжить?',
+        'confirm_yes': '✅ Да, продолжить',
+        'confirm_no': '❌ Нет, заново',
+        'generating': '⏳ Генерируется... Пожалуйста, подождите...\n\n📊 Это может занять 30-60 секунд.',
+        'queued': '⏳ Вы в очереди: место {position}\n\nПожалуйста, подождите, генерация начнется автоматически.',
+        'busy': '⏳ Ваш предыдущий запрос еще обрабатывается. Пожалуйста, дождитесь его завершения.',
+        'progress_slides': '⏳ Генерируется...\n\n📊 Готово слайдов: {done}/{total}',
+        'progress_sections': '⏳ Генерируется...\n\n📝 Готово разделов: {done}',
+        'ai_unavailable': '⚠️ AI-сервис временно недоступен.\n\n🔄 Пожалуйста, попробуйте снова через несколько минут. Ваш лимит сохранен.',
+        'success': '✅ Готово! Держите:\n\n💎 Осталось: {remaining}/{total}',
+        'error': '❌ Произошла ошибка. Попробуйте еще раз.\n\nОшибка: {error}',
+        'back_to_start': '🔙 В начало',
+        'limit_reached': '⛔️ Дневной лимит исчерпан!\n\n'
+                        '💎 Сегодняшний лимит: {remaining}/{total}\n'
+                        '🔄 Завтра получите новый лимит\n\n'
+                        '🎁 Пригласите друзей для больше лимита!\n'
+                        '🔗 Ваша реферальная ссылка:\n'
+                        '{ref_link}\n\n'
+                        '👥 За каждого друга +1 постоянный лимит!',
+        'referral_success': '🎉 Поздравляем!\n\n'
+                           '{inviter} пригласил вас и получил +1 лимит!\n\n'
+                           '💎 Вы тоже можете пригласить друзей!',
+        'referral_info': '👥 <b>Реферальная система:</b>\n\n'
+                        '💎 Ваш лимит: {limit}\n'
+                        '📊 Приглашено: {count} чел.\n'
+                        '🔗 Реферальная ссылка:\n'
+                        '{ref_link}\n\n'
+                        '🎁 За каждого друга +1 постоянный лимит!'
+    },
+    'en': {
+        'welcome': '👋 Hello!\n\n📊 Welcome to the presentation and 📝 report/coursework creation bot!\n\n💎 Daily limit: {remaining}/{total}\n\nSelect language:',
+        'select_lang': 'Select language:',
+        'subscription_required': '📢 To use the bot, subscribe to the channel:\n\n{channel}\n\n✅ After subscribing, click "Check"',
+        'check_btn': '✅ Check subscription',
+        'not_subscribed': '❌ You haven\'t subscribed yet!\n\nPlease subscribe to the channel first: {channel}',
+        'select_type': '📝 What type of document do you need?\n\n💎 Today\'s limit: {remaining}/{total}',
+        'presentation': '📊 Presentation (PPTX)',
+        'report': '📝 Report',
+        'coursework': '📚 Coursework',
+        'enter_topic': '✏️ Enter topic:',
+        'enter_pages': '📄 How many pages? (3 to 50)',
+        'invalid_pages': '❌ Invalid number! Enter from 3 to 50.',
+        'select_design': '🎨 Select design template:',
+        'confirm_data': '📋 <b>Entered data:</b>\n\n'
+                       '🎯 Type: {doc_type}\n'
+                       '📖 Topic: {topic}\n'
+                       '📄 Pages: {pages}\n'
+                       '{design}'
+                       '\n✅ Continue?',
+        'confirm_yes': '✅ Yes, continue',
+        'confirm_no': '❌ No, restart',
+        'generating': '⏳ Generating... Please wait...\n\n📊 This may take 30-60 seconds.',
+        'queued': '⏳ You are in the queue: position {position}\n\nPlease wait, generation will start automatically.',
+        'busy': '⏳ Your previous request is still being generated. Please wait for it to finish.',
+        'progress_slides': '⏳ Generating...\n\n📊 Slide {done}/{total} ready',
+        'progress_sections': '⏳ Generating...\n\n📝 Section {done} ready',
+        'ai_unavailable': '⚠️ The AI service is temporarily unavailable.\n\n🔄 Please try again in a few minutes. Your limit has been kept.',
+        'success': '✅ Done! Here you go:\n\n💎 Remaining: {remaining}/{total}',
+        'error': '❌ An error occurred. Please try again.\n\nError: {error}',
+        'back_to_start': '🔙 Back to start',
+        'limit_reached': '⛔️ Daily limit reached!\n\n'
+                        '💎 Today\'s limit: {remaining}/{total}\n'
+                        '🔄 New limit tomorrow\n\n'
+                        '🎁 Invite friends for more limit!\n'
+                        '🔗 Your referral link:\n'
+                        '{ref_link}\n\n'
+                        '👥 +1 permanent limit for each friend!',
+        'referral_success': '🎉 Congratulations!\n\n'
+                           '{inviter} invited you and got +1 limit!\n\n'
+                           '💎 You can also invite friends!',
+        'referral_info': '👥 <b>Referral system:</b>\n\n'
+                        '💎 Your limit: {limit}\n'
+                        '📊 Invited: {count} people\n'
+                        '🔗 Referral link:\n'
+                        '{ref_link}\n\n'
+                        '🎁 +1 permanent limit for each friend!'
+    }
+}
+
+
+def get_text(lang: str, key: str) -> str:
+    """Tanlangan tildagi matnni olish"""
+    return TEXTS.get(lang, TEXTS['uz']).get(key, '')
@@ -0,0 +1,169 @@
+"""
+Webhook mode for Telegram Bot
+aiohttp server that receives updates from Telegram instead of long polling
+"""
+
+import os
+import json
+import signal
+import asyncio
+from typing import Any, Awaitable, Callable, Dict
+
+from aiohttp import web
+from aiogram import Bot, Dispatcher, BaseMiddleware
+from aiogram.types import TelegramObject, Update
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+
+from database import get_async_db
+from cache import TTLCache
+from metrics import collect_stats
+
+# ============ KONFIGURATSIYA ============
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+# Tashqi manzil (https://bot.example.com); berilsa webhook Telegram'da o'rnatiladi
+WEBHOOK_BASE_URL = os.getenv("WEBHOOK_BASE_URL")
+# Bir update necha soniya davomida takror hisoblanadi
+UPDATE_DEDUP_TTL = int(os.getenv("UPDATE_DEDUP_TTL", str(24 * 3600)))
+# Replika update'ni shuncha soniyaga band qiladi; o'lsa, keyin boshqasi oladi
+UPDATE_LEASE = int(os.getenv("UPDATE_LEASE", "120"))
+
+db = get_async_db()
+
+
+# ============ UPDATE DEDUPLICATION ============
+
+class UpdateInProgress(Exception):
+    """Update boshqa replikada ishlanmoqda - 500 qaytadi, Telegram keyinroq qayta yuboradi"""
+
+
+class DeduplicateUpdatesMiddleware(BaseMiddleware):
+    """Telegram qayta yuborgan (yoki boshqa replika olgan) update'larni tashlab yuborish
+    
+    Update lease bilan olinadi va handler tugagandan keyingina 'done' bo'ladi.
+    Xato yoki bekor qilishda lease bo'shatiladi; jarayon o'ldirilsa (SIGKILL)
+    lease UPDATE_LEASE soniyadan keyin tugaydi. Ikkala holda ham Telegram
+    qayta yuborgan update ishlanadi.
+    """
+    
+    def __init__(self, maxsize: int = 10000, lease: int = UPDATE_LEASE):
+        self._seen = TTLCache(maxsize=maxsize, ttl=UPDATE_DEDUP_TTL)
+        self.lease = lease
+        self.duplicates = 0
+    
+    async def __call__(self, handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+                       event: TelegramObject, data: Dict[str, Any]) -> Any:
+        if not isinstance(event, Update):
+            return await handler(event, data)
+        
+        update_id = event.update_id
+        if self._seen.get(update_id):
+            self.duplicates += 1
+            return None
+        
+        state = await db.run(db.db.updates.claim, update_id, self.lease)
+        if state == 'done':
+            self.duplicates += 1
+            self._seen.set(update_id, True)
+            return None
+        if state == 'busy':
+            raise UpdateInProgress(f"Update {update_id} is being handled by another replica")
+        
+        try:
+            result = await handler(event, data)
+        except BaseException:
+            # Xato yoki to'xtatish (CancelledError) - qayta yuborilgan update qabul qilinsin
+            try:
+                await db.run(db.db.updates.forget, update_id)
+            except Exception as e:
+                print(f"Could not release update {update_id}: {e}")
+            raise
+        
+        self._seen.set(update_id, True)
+        try:
+            await db.run(db.db.updates.complete, update_id)
+        except Exception as e:
+            # Handler bajarildi - lease tugaguncha boshqa replika olmaydi
+            print(f"Could not mark update {update_id} done: {e}")
+        return result
+
+
+DEDUP_KEY = web.AppKey('dedup', DeduplicateUpdatesMiddleware)
+
+
+async def _purge_processed_updates():
+    """Eski dedup yozuvlarini vaqti-vaqti bilan tozalash"""
+    while True:
+        try:
+            await db.run(db.db.updates.purge, UPDATE_DEDUP_TTL)
+        except Exception as e:
+            print(f"Processed updates purge error: {e}")
+        await asyncio.sleep(3600)
+
+
+# ============ SERVER ============
+
+async def healthz(request: web.Request) -> web.Response:
+    dedup = request.app[DEDUP_KEY]
+    return web.json_response(
+        {'status': 'ok', 'duplicates': dedup.duplicates, **collect_stats()},
+        dumps=lambda data: json.dumps(data, default=str)
+    )
+
+
+def create_app(dp: Dispatcher, bot: Bot) -> web.Application:
+    """aiohttp ilovasini yaratish"""
+    dedup = DeduplicateUpdatesMiddleware()
+    dp.update.outer_middleware(dedup)
+    app = web.Application()
+    app[DEDUP_KEY] = dedup
+    
+    # Javob update to'liq qayta ishlangandan keyin qaytariladi: replika
+    # deploy paytida o'chsa, Telegram update'ni boshqasiga qayta yuboradi
+    SimpleRequestHandler(
+        dispatcher=dp,
+        bot=bot,
+        secret_token=WEBHOOK_SECRET,
+        handle_in_background=False
+    ).register(app, path=WEBHOOK_PATH)
+    setup_application(app, dp, bot=bot)
+    
+    app.router.add_get('/healthz', healthz)
+    return app
+
+
+async def run_webhook(dp: Dispatcher, bot: Bot):
+    """Webhook serverini SIGTERM/SIGINT kelguncha ishlatish"""
+    app = create_app(dp, bot)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, WEBHOOK_HOST, WEBHOOK_PORT)
+    await site.start()
+    print(f"🌐 Webhook server: http://{WEBHOOK_HOST}:{WEBHOOK_PORT}{WEBHOOK_PATH}")
+    
+    if WEBHOOK_BASE_URL:
+        await bot.set_webhook(
+            WEBHOOK_BASE_URL.rstrip('/') + WEBHOOK_PATH,
+            secret_token=WEBHOOK_SECRET,
+            allowed_updates=dp.resolve_used_update_types(),
+            drop_pending_updates=False
+        )
+    
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:
+            pass
+    
+    purge_task = asyncio.create_task(_purge_processed_updates())
+    try:
+        await stop.wait()
+    finally:
+        print("🛑 Webhook server to'xtatilmoqda...")
+        purge_task.cancel()
+        # Yangi so'rovlar qabul qilinmaydi, ishlanayotganlari tugatiladi
+        await runner.cleanup()
@@ -0,0 +1,338 @@
+"""
+Generation worker for Telegram Bot
+Claims queued generations from the database and delivers the results to chats
+"""
+
+import time
+_started = time.perf_counter()
+
+import os
+import socket
+import asyncio
+import traceback
+from typing import Optional
+
+from aiogram import Bot
+from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton, BufferedInputFile
+from aiogram.exceptions import TelegramBadRequest
+
+from database import get_async_db, init_db, RUN_MIGRATIONS
+from ai import generate_content_with_gemini, CircuitOpen
+from cache import (
+    get_content_cache, get_file_cache, make_filename, make_render_key, PostgresContentCache
+)
+from render import render, launch_render_pool, shutdown_render_pool
+from sender import setup_sender
+from startup import StartupReport
+from metrics import log_stats_loop
+from texts import get_text
+
+# ============ KONFIGURATSIYA ============
+BOT_TOKEN = os.getenv("BOT_TOKEN")
+
+# Bitta worker bir vaqtda nechta vazifa bajaradi
+WORKER_CONCURRENCY = int(os.getenv("WORKER_CONCURRENCY", "8"))
+# Navbat bo'sh bo'lsa qancha kutish (soniya)
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "1"))
+# Vazifa hali ishlanayotganini bildirish oralig'i
+JOB_HEARTBEAT_INTERVAL = float(os.getenv("JOB_HEARTBEAT_INTERVAL", "30"))
+# Shuncha vaqt heartbeat bo'lmasa - worker o'lgan deb hisoblanadi
+JOB_STALE_AFTER = int(os.getenv("JOB_STALE_AFTER", "300"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+# Progress xabarini tahrirlash oralig'i (soniya) - Telegram limitlari uchun
+PROGRESS_EDIT_INTERVAL = float(os.getenv("PROGRESS_EDIT_INTERVAL", "2"))
+# Yuborilgan hujjat statusini yozish uchun urinishlar soni
+COMPLETE_ATTEMPTS = int(os.getenv("COMPLETE_ATTEMPTS", "3"))
+
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+db = get_async_db()
+
+
+# ============ YORDAMCHI FUNKSIYALAR ============
+
+class ProgressMessage:
+    """Holat xabarini tahrirlash - tez-tez emas va bir xil matnsiz"""
+    
+    def __init__(self, bot: Bot, chat_id: int, message_id: Optional[int],
+                 min_interval: float = PROGRESS_EDIT_INTERVAL):
+        self.bot = bot
+        self.chat_id = chat_id
+        self.message_id = message_id
+        self.min_interval = min_interval
+        self._last_text = None
+        self._last_edit = 0.0
+    
+    async def update(self, text: str, force: bool = False):
+        if self.message_id is None:
+            return
+        loop = asyncio.get_running_loop()
+        if text == self._last_text:
+            return
+        if not force and loop.time() - self._last_edit < self.min_interval:
+            return
+        
+        self._last_text = text
+        self._last_edit = loop.time()
+        try:
+            await self.bot.edit_message_text(text, chat_id=self.chat_id, message_id=self.message_id)
+        except TelegramBadRequest as e:
+            # "message is not modified" va shunga o'xshashlar
+            print(f"Progress edit skipped: {e}")
+
+
+async def _heartbeat(generation_id: int):
+    """Uzoq vazifa davomida claim'ni yangilab turish"""
+    while True:
+        await asyncio.sleep(JOB_HEARTBEAT_INTERVAL)
+        try:
+            await db.heartbeat_generation(generation_id, WORKER_ID)
+        except Exception as e:
+            print(f"Heartbeat error for generation {generation_id}: {e}")
+
+
+async def fail_generation(bot: Bot, job: dict, error: Exception):
+    """Vazifani failed qilish, limitni qaytarish va foydalanuvchiga xabar berish"""
+    lang = job.get('lang') or 'uz'
+    await db.update_generation_status(job['id'], 'failed', error_message=str(error))
+    
+    # Muvaffaqiyatsiz generatsiya limitdan ayrilmaydi
+    await db.refund_generation(job['user_id'])
+    
+    if isinstance(error, CircuitOpen):
+        error_text = get_text(lang, 'ai_unavailable')
+    else:
+        error_text = get_text(lang, 'error').format(error=str(error))
+    
+    try:
+        await bot.send_message(job['chat_id'], error_text)
+    except Exception as e:
+        print(f"Could not notify chat {job['chat_id']}: {e}")
+
+
+async def complete_generation(bot: Bot, job: dict, filename: str):
+    """Hujjat yetkazilgandan keyingi ishlar - hech qachon xato ko'tarmaydi
+    
+    Foydalanuvchi faylni olgan: DB yoki Telegram xatosi generatsiyani
+    failed qilmasligi, limitni qaytarmasligi va xato xabarini yubormasligi kerak.
+    """
+    generation_id = job['id']
+    for attempt in range(1, COMPLETE_ATTEMPTS + 1):
+        try:
+            await db.update_generation_status(generation_id, 'completed', filename)
+            break
+        except Exception as e:
+            print(f"Could not mark generation {generation_id} completed "
+                  f"(attempt {attempt}/{COMPLETE_ATTEMPTS}): {e}")
+            if attempt < COMPLETE_ATTEMPTS:
+                await asyncio.sleep(2 ** attempt)
+    
+    # Boshiga qaytish tugmasi
+    keyboard = InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text=get_text(job.get('lang') or 'uz', 'back_to_start'),
+                              callback_data="back_start")]
+    ])
+    try:
+        await bot.send_message(job['chat_id'], "👍", reply_markup=keyboard)
+    except Exception as e:
+        print(f"Could not send the start button to chat {job['chat_id']}: {e}")
+
+
+# ============ VAZIFANI BAJARISH ============
+
+async def process_generation(bot: Bot, job: dict):
+    """Bitta generatsiya: kontent, render, yuborish"""
+    generation_id = job['id']
+    user_id = job['user_id']
+    chat_id = job['chat_id']
+    lang = job.get('lang') or 'uz'
+    doc_type = job['doc_type']
+    topic = job['topic']
+    pages = job['pages']
+    design = job['design']
+    
+    content_cache = get_content_cache()
+    file_cache = get_file_cache()
+    progress = ProgressMessage(bot, chat_id, job.get('message_id'))
+    
+    async def show_item(done: int, item: dict):
+        if doc_type == 'presentation':
+            text = get_text(lang, 'progress_slides').format(done=done, total=pages)
+        else:
+            text = get_text(lang, 'progress_sections').format(done=done)
+        await progress.update(text)
+    
+    await progress.update(get_text(lang, 'generating'), force=True)
+    
+    # Avval keshdan qidirish - topilsa AI chaqirilmaydi (limit baribir ishlatiladi)
+    content = await content_cache.get(topic, pages, doc_type, lang)
+    
+    if content is None:
+        # AI dan kontent olish - parallellik va navbat WORKER_CONCURRENCY va DB navbati orqali
+        content, complete = await generate_content_with_gemini(
+            topic, pages, doc_type, lang, on_item=show_item
+        )
+        # Tiklangan yoki kam slaydli natija faqat shu foydalanuvchiga - boshqalarga keshdan berilmaydi
+        if complete:
+            await content_cache.set(topic, pages, doc_type, lang, content)
+        else:
+            print(f"Generation {generation_id}: partial content, not cached")
+    
+    # file_id qayta yuborilganda Telegram asl nomni saqlaydi - nomda user/generation id yo'q
+    filename = make_filename(content, doc_type)
+    
+    remaining, total = await db.get_daily_limit(user_id)
+    caption = get_text(lang, 'success').format(remaining=remaining, total=total)
+    
+    # Xuddi shu kontent va dizayn oldin yuborilgan bo'lsa - file_id orqali qayta yuborish
+    render_key = make_render_key(content, design, doc_type)
+    file_id = await file_cache.get(render_key)
+    sent = None
+    if file_id:
+        try:
+            sent = await bot.send_document(chat_id, document=file_id, caption=caption)
+        except TelegramBadRequest as e:
+            print(f"Cached file_id rejected: {e}")
+            file_cache.forget(render_key)
+    
+    if sent is None:
+        # Fayl yaratish (render worker jarayonida, faqat xotirada)
+        file_bytes = await render(content, doc_type, design)
+        
+        # Faylni diskka yozmasdan yuborish
+        file = BufferedInputFile(file_bytes, filename=filename)
+        sent = await bot.send_document(chat_id, document=file, caption=caption)
+        await file_cache.set(generation_id, render_key, sent.document.file_id)
+    
+    # Hujjat yetkazildi - worker to'xtatilsa ham status yozib qo'yilsin (aks holda reclaim qayta yuboradi)
+    await asyncio.shield(complete_generation(bot, job, filename))
+
+
+async def run_job(bot: Bot, job: dict):
+    """Vazifani heartbeat bilan bajarish; xato bo'lsa failed qilish"""
+    heartbeat = asyncio.create_task(_heartbeat(job['id']))
+    try:
+        await process_generation(bot, job)
+    except asyncio.CancelledError:
+        # Worker to'xtatilmoqda - vazifa boshqa worker'ga qaytadi (reclaim)
+        raise
+    except Exception as e:
+        print(f"Xatolik yuz berdi (generation {job['id']}): {e}")
+        traceback.print_exc()
+        try:
+            await fail_generation(bot, job, e)
+        except Exception as notify_error:
+            print(f"Could not mark generation {job['id']} failed: {notify_error}")
+    finally:
+        heartbeat.cancel()
+
+
+# ============ WORKER ============
+
+class GenerationWorker:
+    """generations jadvalidan vazifalarni olib bajaruvchi worker"""
+    
+    def __init__(self, bot: Bot, concurrency: int = WORKER_CONCURRENCY):
+        self.bot = bot
+        self.concurrency = max(1, concurrency)
+        self._tasks = set()
+        self._stopping = asyncio.Event()
+    
+    async def reclaim(self):
+        """O'lgan worker'lar vazifalarini navbatga qaytarish"""
+        exhausted = await db.reclaim_stale_generations(JOB_STALE_AFTER, JOB_MAX_ATTEMPTS)
+        for job in exhausted:
+            await fail_generation(self.bot, job, Exception("Generatsiya yakunlanmadi"))
+        if exhausted:
+            print(f"♻️ {len(exhausted)} ta vazifa bekor qilindi")
+    
+    async def run(self):
+        """Navbatni to'xtatilguncha qayta ishlash"""
+        print(f"🛠 Worker {WORKER_ID} ishga tushdi (concurrency={self.concurrency})")
+        await self.reclaim()
+        loop = asyncio.get_running_loop()
+        last_reclaim = loop.time()
+        
+        # Umumiy kontent keshini worker'lar to'ldiradi - eskirganini ham ular tozalaydi
+        content_cache = get_content_cache()
+        purge_task = None
+        if isinstance(content_cache, PostgresContentCache):
+            purge_task = asyncio.create_task(content_cache.purge_loop())
+        
+        while not self._stopping.is_set():
+            if loop.time() - last_reclaim > JOB_STALE_AFTER / 2:
+                last_reclaim = loop.time()
+                try:
+                    await self.reclaim()
+                except Exception as e:
+                    print(f"Reclaim error: {e}")
+            
+            job = None
+            if len(self._tasks) < self.concurrency:
+                try:
+                    job = await db.claim_generation(WORKER_ID)
+                except Exception as e:
+                    print(f"Claim error: {e}")
+            
+            if job is None:
+                try:
+                    await asyncio.wait_for(self._stopping.wait(), JOB_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            
+            task = asyncio.create_task(run_job(self.bot, job))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        
+        if purge_task:
+            purge_task.cancel()
+        # Ishlanayotgan vazifalarni tugatish
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+    
+    def stop(self):
+        self._stopping.set()
+
+
+# ============ ALOHIDA WORKER JARAYONI ============
+
+async def main():
+    """Worker'ni alohida jarayon sifatida ishga tushirish"""
+    startup = StartupReport(_started)
+    startup.mark("imports")
+    
+    # fork - DB thread'laridan oldin
+    render_ready = launch_render_pool()
+    if render_ready is not None:
+        startup.track("Render worker'lari", render_ready)
+    startup.mark("render pool launch")
+    
+    if RUN_MIGRATIONS:
+        try:
+            init_db()
+        except Exception as e:
+            print(f"⚠️ Database initialization warning: {e}")
+        startup.mark("migrations")
+    
+    bot = Bot(token=BOT_TOKEN)
+    setup_sender(bot)
+    worker = GenerationWorker(bot)
+    startup.report()
+    metrics_task = asyncio.create_task(log_stats_loop())
+    
+    try:
+        await worker.run()
+    finally:
+        metrics_task.cancel()
+        worker.stop()
+        shutdown_render_pool()
+        await bot.session.close()
+        await db.close()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        print("\n\n🛑 Worker to'xtatildi!")